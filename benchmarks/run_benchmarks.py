@@ -0,0 +1,204 @@
+"""
+Benchmark the loading, localisation, matching and writing of point clouds on synthetic datasets at several scales.
+
+Each dataset goes through the pipeline twice: a first pass times the stages, a second pass measures their peak of
+memory allocated through Python with tracemalloc, which would slow down the first one. The localisation of the point
+clouds is timed on its own, although it runs within the loading and matching stages. The results are written as JSON
+so that runs on different commits can be compared (see --compare).
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales small medium --output bench.json
+    python benchmarks/run_benchmarks.py --scales small --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src'))
+import synthetic
+import data_loader, instrumentation, matcher
+
+CLASS_TABLE_PATH = os.path.join(REPO_ROOT, 'class_table.csv')
+
+# scale name -> (number of trees, points per tree)
+SCALES = {
+    "tiny": (50, 1_000),
+    "small": (500, 2_000),
+    "medium": (2_000, 5_000),
+    "large": (10_000, 10_000),
+}
+SCENARIOS = ("files", "merged")
+FORMATS = ("LAS", "PLY")
+
+# the stages of a run, in order; localise runs within load_point_clouds and match, the others one after the other
+STAGES = ("load_point_clouds", "localise", "load_labels", "match", "store")
+
+def run_pipeline(point_clouds_directory: str, labels_path: str, output_directory: str, scenario: str, dir_depth: int,
+                 scalar_field_name: str, max_distance: float, workers: int, chunk_size: int):
+    """
+    Run the pipeline of main.py on a dataset, each step in an instrumentation stage of the active run report.
+
+    Returns:
+    tuple: The number of point clouds, and the number of matched point clouds (None for a merged cloud, whose
+           matched segments are only logged by the matcher).
+    """
+    with instrumentation.stage("load_point_clouds"):
+        point_clouds = data_loader.load_pc_files_from_directory(point_clouds_directory, depth=dir_depth, scalar_field_name=scalar_field_name, workers=workers)
+    with instrumentation.stage("load_labels"):
+        labels = data_loader.load_labels_from_csv(labels_path, CLASS_TABLE_PATH)
+    if scenario == "files":
+        with instrumentation.stage("match"):
+            matched = matcher.match_point_clouds_with_labels(point_clouds, labels, max_distance)
+        with instrumentation.stage("store"):
+            for pc in matched:
+                pc.store_pc(output_directory, chunk_size=chunk_size)
+        return len(point_clouds), len(matched)
+    with instrumentation.stage("match"):
+        matched = matcher.match_point_cloud_with_labels(point_clouds[0], labels, scalar_field_name, max_distance)
+    with instrumentation.stage("store"):
+        matched.store_pc(output_directory, chunk_size=chunk_size)
+    return len(point_clouds), None
+
+def measure(pipeline, output_directory: str) -> tuple:
+    """
+    Run a pipeline twice, to output_directory then to a second directory: once to time its stages, once with
+    tracemalloc to measure their peak of memory allocated through Python.
+
+    Returns:
+    tuple: The result of the pipeline and a dict of the "seconds" and "peak_memory_bytes" of each stage, and of the "total".
+    """
+    timing_report = instrumentation.RunReport()
+    with timing_report.activate():
+        result = pipeline(output_directory)
+    memory_report = instrumentation.RunReport(trace_memory=True)
+    with memory_report.activate():
+        pipeline(output_directory + '_memory')
+    stages = {}
+    for name in STAGES:
+        if name in timing_report.stages:
+            stages[name] = {"seconds": timing_report.stages[name]["seconds"],
+                            "peak_memory_bytes": memory_report.stages[name].get("peak_traced_memory_bytes", 0)}
+    stages["total"] = {
+        "seconds": timing_report.seconds,
+        "peak_memory_bytes": max(stage["peak_memory_bytes"] for stage in stages.values()),
+    }
+    return result, stages
+
+def run_scenario(work_directory: str, scenario: str, type_str: str, n_trees: int, points_per_tree: int,
+                 max_distance: float = 2.0, workers: int = 1, chunk_size: int = None, seed: int = 0) -> dict:
+    """
+    Generate a dataset and run the pipeline of main.py on it, stage by stage.
+
+    Returns:
+    dict: The parameters of the run and the measures of each stage.
+    """
+    centers = synthetic.generate_tree_centers(n_trees, seed)
+    point_clouds_directory = os.path.join(work_directory, 'point_clouds')
+    os.makedirs(point_clouds_directory)
+    labels_path = os.path.join(work_directory, 'labels.csv')
+    output_directory = os.path.join(work_directory, 'output_pc')
+    generation_start = time.perf_counter()
+    if scenario == "files":
+        synthetic.write_tree_files(point_clouds_directory, centers, points_per_tree, type_str, seed)
+        dir_depth, scalar_field_name = 2, None
+    else:
+        file_path = os.path.join(point_clouds_directory, f"forest.{type_str.lower()}")
+        synthetic.write_merged_cloud(file_path, centers, points_per_tree, type_str, seed=seed)
+        dir_depth, scalar_field_name = 0, synthetic.INSTANCE_FIELD_NAMES[type_str]
+    n_labels = synthetic.write_labels_csv(labels_path, centers, CLASS_TABLE_PATH, seed=seed)
+    generation_seconds = time.perf_counter() - generation_start
+
+    (n_point_clouds, n_matched), stages = measure(
+        lambda output_path: run_pipeline(point_clouds_directory, labels_path, output_path, scenario, dir_depth, scalar_field_name,
+                                         max_distance, workers, chunk_size),
+        output_directory)
+    return {
+        "scenario": scenario,
+        "format": type_str,
+        "n_trees": n_trees,
+        "points_per_tree": points_per_tree,
+        "n_labels": n_labels,
+        "n_point_clouds": n_point_clouds,
+        "n_matched": n_matched,
+        "generation_seconds": generation_seconds,
+        "stages": stages,
+    }
+
+def get_environment() -> dict:
+    """
+    Describe the machine and the code the benchmarks ran on.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare(results: list, reference: dict):
+    """
+    Print the ratio of the time and memory of each stage to the same stage in a reference run (< 1 is an improvement).
+    """
+    reference_runs = {(run["scenario"], run["format"], run["n_trees"], run["points_per_tree"]): run for run in reference["results"]}
+    print(f"Compared to commit {reference['environment']['commit']}:")
+    for run in results:
+        key = (run["scenario"], run["format"], run["n_trees"], run["points_per_tree"])
+        if key not in reference_runs:
+            print(f"  {key}: not in the reference run")
+            continue
+        for stage, measures in run["stages"].items():
+            reference_measures = reference_runs[key]["stages"].get(stage)
+            if reference_measures is None:
+                continue
+            time_ratio = measures["seconds"] / max(reference_measures["seconds"], 1e-9)
+            memory_ratio = measures["peak_memory_bytes"] / max(reference_measures["peak_memory_bytes"], 1)
+            print(f"  {key} {stage}: time x{time_ratio:.2f}, memory x{memory_ratio:.2f}")
+
+def main(scales: list, scenarios: list, formats: list, output_path: str, compare_path: str = None, workers: int = 1, chunk_size: int = None):
+    results = []
+    for scale in scales:
+        n_trees, points_per_tree = SCALES[scale]
+        for scenario in scenarios:
+            for type_str in formats:
+                with tempfile.TemporaryDirectory() as work_directory:
+                    run = run_scenario(work_directory, scenario, type_str, n_trees, points_per_tree, workers=workers, chunk_size=chunk_size)
+                run["scale"] = scale
+                results.append(run)
+                timings = ", ".join(f"{stage} {measures['seconds']:.2f}s / {measures['peak_memory_bytes'] / 2**20:.0f}MiB" for stage, measures in run["stages"].items())
+                print(f"[{scale}] {scenario} {type_str} ({n_trees} trees x {points_per_tree} points): {timings}")
+
+    report = {"environment": get_environment(), "results": results}
+    if output_path:
+        with open(output_path, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {output_path}")
+    if compare_path:
+        with open(compare_path, 'r') as file:
+            compare(results, json.load(file))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the point cloud / label matching pipeline on synthetic datasets.")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=["tiny", "small"], help='Dataset scales to run. Default is tiny and small.')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS), help='"files" for one file per tree (directory depth 2), "merged" for one cloud with an instance scalar field (directory depth 0). Default is both.')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS), help='Point cloud formats. Default is both.')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Path of the JSON results. Default is benchmark_results.json.')
+    parser.add_argument('--compare', type=str, default=None, help='Path of the JSON results of a previous run to compare with.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to read the point cloud files. Default is 1.')
+    parser.add_argument('--chunk_size', type=int, default=None, help='Chunk size used to write the outputs. Default is None.')
+    args = parser.parse_args()
+    main(args.scales, args.scenarios, args.formats, args.output, args.compare, args.workers, args.chunk_size)
@@ -0,0 +1,125 @@
+"""
+Benchmark the cold start of the pipeline: the time a fresh interpreter takes to import main.py, and to run a small
+job on LAS files only or on PLY files only, together with the format libraries each of them imported.
+
+Every measure runs in a new process, as each job of a sharded cluster run does, and is repeated to take the median.
+
+Usage:
+    python benchmarks/startup_time.py --output startup.json
+    python benchmarks/startup_time.py --compare startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import run_benchmarks
+import synthetic
+
+SRC_PATH = os.path.join(run_benchmarks.REPO_ROOT, 'src')
+# the modules whose import a job should only pay for when it needs them
+WATCHED_MODULES = ("laspy", "plyfile", "numpy.lib.recfunctions", "asyncio", "service", "las_stream", "ply_stream")
+SCENARIOS = ("import", "LAS", "PLY")
+
+CHILD_TEMPLATE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src_path!r})
+import main
+imported = time.perf_counter()
+{job}
+end = time.perf_counter()
+print(json.dumps({{"import_seconds": imported - start, "run_seconds": end - imported,
+                  "modules": [name for name in {watched!r} if name in sys.modules]}}))
+"""
+
+JOB_TEMPLATE = """main.main(dir_depth=2, max_distance=2.0, scalar_field_name=None, point_clouds_path={point_clouds_path!r}, labels_path={labels_path!r},
+          class_table_path={class_table_path!r}, output_path={output_path!r}, type_strs=[{type_str!r}])"""
+
+def write_dataset(work_directory: str, n_trees: int, points_per_tree: int, seed: int = 0) -> dict:
+    """
+    Write one directory of tree files per format, and their labels CSV.
+
+    Returns:
+    dict: The point cloud directory of each format, and the path of the labels CSV under "labels".
+    """
+    centers = synthetic.generate_tree_centers(n_trees, seed)
+    paths = {"labels": os.path.join(work_directory, 'labels.csv')}
+    synthetic.write_labels_csv(paths["labels"], centers, run_benchmarks.CLASS_TABLE_PATH, seed=seed)
+    for type_str in run_benchmarks.FORMATS:
+        paths[type_str] = os.path.join(work_directory, type_str.lower())
+        os.makedirs(paths[type_str])
+        synthetic.write_tree_files(paths[type_str], centers, points_per_tree, type_str, seed)
+    return paths
+
+def run_child(code: str) -> dict:
+    """
+    Run code in a new interpreter and measure its wall time, start-up of the interpreter included.
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    process_seconds = time.perf_counter() - start
+    measures = json.loads(completed.stdout.strip().splitlines()[-1])
+    measures["process_seconds"] = process_seconds
+    return measures
+
+def run_scenario(scenario: str, paths: dict, work_directory: str, repeats: int) -> dict:
+    if scenario == "import":
+        job = ""
+    else:
+        job = JOB_TEMPLATE.format(point_clouds_path=paths[scenario], labels_path=paths["labels"], class_table_path=run_benchmarks.CLASS_TABLE_PATH,
+                                  output_path=os.path.join(work_directory, f'output_{scenario.lower()}'), type_str=scenario)
+    code = CHILD_TEMPLATE.format(src_path=SRC_PATH, job=job, watched=WATCHED_MODULES)
+    runs = [run_child(code) for _ in range(repeats)]
+    return {
+        "scenario": scenario,
+        "repeats": repeats,
+        "stages": {name: {"seconds": statistics.median(run[name] for run in runs)} for name in ("import_seconds", "run_seconds", "process_seconds")},
+        "modules": runs[-1]["modules"],
+    }
+
+def compare(results: list, reference: dict):
+    """
+    Print the ratio of the median times of each scenario to the same scenario in a reference run (< 1 is an improvement).
+    """
+    reference_runs = {run["scenario"]: run for run in reference["results"]}
+    print(f"Compared to commit {reference['environment']['commit']}:")
+    for run in results:
+        if run["scenario"] not in reference_runs:
+            print(f"  {run['scenario']}: not in the reference run")
+            continue
+        for stage, measures in run["stages"].items():
+            reference_seconds = reference_runs[run["scenario"]]["stages"][stage]["seconds"]
+            print(f"  {run['scenario']} {stage}: time x{measures['seconds'] / max(reference_seconds, 1e-9):.2f}")
+
+def main(scenarios: list, repeats: int, output_path: str, compare_path: str = None, n_trees: int = 20, points_per_tree: int = 500):
+    results = []
+    with tempfile.TemporaryDirectory() as work_directory:
+        paths = write_dataset(work_directory, n_trees, points_per_tree)
+        for scenario in scenarios:
+            run = run_scenario(scenario, paths, work_directory, repeats)
+            results.append(run)
+            timings = ", ".join(f"{stage} {measures['seconds'] * 1000:.0f}ms" for stage, measures in run["stages"].items())
+            print(f"{scenario}: {timings}; imported {', '.join(run['modules']) or 'none of the watched modules'}")
+
+    report = {"environment": run_benchmarks.get_environment(), "results": results}
+    if output_path:
+        with open(output_path, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {output_path}")
+    if compare_path:
+        with open(compare_path, 'r') as file:
+            compare(results, json.load(file))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import time and cold start of the pipeline.")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS), help='"import" only imports main.py, "LAS" and "PLY" run a small job on files of that format only. Default is all.')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of new processes per scenario, of which the median is kept. Default is 5.')
+    parser.add_argument('--output', type=str, default='startup_results.json', help='Path of the JSON results. Default is startup_results.json.')
+    parser.add_argument('--compare', type=str, default=None, help='Path of the JSON results of a previous run to compare with.')
+    args = parser.parse_args()
+    main(args.scenarios, args.repeats, args.output, args.compare)
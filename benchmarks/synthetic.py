@@ -0,0 +1,168 @@
+"""
+This module generates synthetic forest-scale datasets for the benchmarks: point clouds of trees, as
+many small per-tree files or as one large cloud with an instance scalar field, and their labels CSV.
+"""
+import os
+import sys
+
+import laspy
+import numpy as np
+from plyfile import PlyElement, PlyData
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import data_loader, utils
+
+# south-west corner of the synthetic forest, in LV95 (east, north)
+ORIGIN = (2600000.0, 1200000.0)
+# distance between two neighbouring trees, larger than twice the default matching distance
+TREE_SPACING = 6.0
+CROWN_RADIUS = 2.0
+TREE_HEIGHT = 25.0
+GROUND_ALTITUDE = 600.0
+INSTANCE_FIELD_NAMES = {"LAS": "PredInstance", "PLY": "scalar_PredInstance"}
+
+def generate_tree_centers(n_trees: int, seed: int = 0):
+    """
+    Place trees on a jittered square grid.
+
+    Parameters:
+    n_trees (int): The number of trees.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    np.ndarray: An (n_trees, 2) array of LV95 (east, north) tree centers.
+    """
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_trees)))
+    rows, cols = np.divmod(np.arange(n_trees), side)
+    jitter = rng.uniform(-0.5, 0.5, (n_trees, 2))
+    return np.column_stack((ORIGIN[0] + (cols + jitter[:, 0]) * TREE_SPACING, ORIGIN[1] + (rows + jitter[:, 1]) * TREE_SPACING))
+
+def generate_tree_points(center, n_points: int, rng):
+    """
+    Sample the points of a tree: a cylinder of radius CROWN_RADIUS around its center.
+
+    Returns:
+    tuple: The x (east), y (north) and z arrays of the points.
+    """
+    radius = CROWN_RADIUS * np.sqrt(rng.random(n_points))
+    angle = rng.uniform(0, 2 * np.pi, n_points)
+    xs = center[0] + radius * np.cos(angle)
+    ys = center[1] + radius * np.sin(angle)
+    zs = GROUND_ALTITUDE + rng.uniform(0, TREE_HEIGHT, n_points)
+    return xs, ys, zs
+
+def write_point_cloud(file_path: str, xs, ys, zs, type_str: str = "LAS", instances=None):
+    """
+    Write a point cloud, with an instance scalar field if instances is given.
+
+    LAS files use point format 0 with a millimetric scale, like the sample data, and store the instances
+    in a PredInstance extra dimension. PLY files are binary with double coordinates and a float scalar_PredInstance.
+    """
+    if type_str == "LAS":
+        header = laspy.LasHeader(point_format=0, version="1.2")
+        if instances is not None:
+            header.add_extra_dim(laspy.ExtraBytesParams(name=INSTANCE_FIELD_NAMES["LAS"], type=np.float32))
+        header.scales = [0.001, 0.001, 0.001]
+        header.offsets = [np.floor(xs.min()), np.floor(ys.min()), np.floor(zs.min())]
+        las_data = laspy.LasData(header)
+        las_data.x = xs
+        las_data.y = ys
+        las_data.z = zs
+        if instances is not None:
+            las_data[INSTANCE_FIELD_NAMES["LAS"]] = instances
+        las_data.write(file_path)
+    elif type_str == "PLY":
+        dtype = [('x', '<f8'), ('y', '<f8'), ('z', '<f8')]
+        if instances is not None:
+            dtype.append((INSTANCE_FIELD_NAMES["PLY"], '<f4'))
+        vertices = np.empty(len(xs), dtype=dtype)
+        vertices['x'] = xs
+        vertices['y'] = ys
+        vertices['z'] = zs
+        if instances is not None:
+            vertices[INSTANCE_FIELD_NAMES["PLY"]] = instances
+        PlyData([PlyElement.describe(vertices, 'vertex')]).write(file_path)
+    else:
+        raise ValueError(f"Unknown point cloud type: {type_str}")
+
+def write_tree_files(directory_path: str, centers, points_per_tree: int, type_str: str = "LAS", seed: int = 0):
+    """
+    Write one point cloud file per tree, each in its own subdirectory (the layout read with a directory depth of 2).
+
+    Returns:
+    list: The paths of the written files.
+    """
+    rng = np.random.default_rng(seed)
+    extension = type_str.lower()
+    file_paths = []
+    for i, center in enumerate(centers):
+        tree_directory = os.path.join(directory_path, f"tree_{i}")
+        os.makedirs(tree_directory, exist_ok=True)
+        file_path = os.path.join(tree_directory, f"tree_{i}.{extension}")
+        write_point_cloud(file_path, *generate_tree_points(center, points_per_tree, rng), type_str=type_str)
+        file_paths.append(file_path)
+    return file_paths
+
+def write_merged_cloud(file_path: str, centers, points_per_tree: int, type_str: str = "PLY", ground_fraction: float = 0.2, seed: int = 0):
+    """
+    Write all the trees in one point cloud whose instance scalar field tells them apart (the layout read with a
+    directory depth of 0). Trees have instances 1..n, and ground points spread under the forest have instance 0.
+    """
+    rng = np.random.default_rng(seed)
+    n_trees = len(centers)
+    n_tree_points = n_trees * points_per_tree
+    n_ground_points = int(n_tree_points * ground_fraction)
+    # all trees are sampled at once: the points of tree i are the rows i * points_per_tree ...
+    instances = np.repeat(np.arange(1, n_trees + 1, dtype=np.float32), points_per_tree)
+    radius = CROWN_RADIUS * np.sqrt(rng.random(n_tree_points))
+    angle = rng.uniform(0, 2 * np.pi, n_tree_points)
+    xs = np.repeat(centers[:, 0], points_per_tree) + radius * np.cos(angle)
+    ys = np.repeat(centers[:, 1], points_per_tree) + radius * np.sin(angle)
+    zs = GROUND_ALTITUDE + rng.uniform(0, TREE_HEIGHT, n_tree_points)
+
+    mins = centers.min(axis=0) - CROWN_RADIUS
+    maxs = centers.max(axis=0) + CROWN_RADIUS
+    xs = np.concatenate((xs, rng.uniform(mins[0], maxs[0], n_ground_points)))
+    ys = np.concatenate((ys, rng.uniform(mins[1], maxs[1], n_ground_points)))
+    zs = np.concatenate((zs, np.full(n_ground_points, GROUND_ALTITUDE)))
+    instances = np.concatenate((instances, np.zeros(n_ground_points, dtype=np.float32)))
+    # shuffled, as segmentation outputs are not sorted by instance
+    order = rng.permutation(len(xs))
+    write_point_cloud(file_path, xs[order], ys[order], zs[order], type_str=type_str, instances=instances[order])
+    return file_path
+
+def write_labels_csv(file_path: str, centers, class_table_path: str, noise: float = 0.3, decoy_fraction: float = 0.1, seed: int = 0):
+    """
+    Write a labels CSV with one label near each tree center, plus decoy labels far from any tree.
+
+    Parameters:
+    file_path (str): The path to the CSV file to write.
+    centers (np.ndarray): The LV95 (east, north) tree centers.
+    class_table_path (str): The class table the label names are drawn from.
+    noise (float): The standard deviation of the distance between a label and its tree, in meters.
+    decoy_fraction (float): The number of labels matching no tree, relative to the number of trees.
+    seed (int): The seed of the random generator.
+
+    Returns:
+    int: The number of written labels.
+    """
+    rng = np.random.default_rng(seed)
+    n_decoys = int(len(centers) * decoy_fraction)
+    locations = centers + rng.normal(0, noise, centers.shape)
+    # decoys are south of the forest, further than any matching distance from the trees
+    decoys = np.column_stack((rng.uniform(centers[:, 0].min(), centers[:, 0].max(), n_decoys),
+                              np.full(n_decoys, centers[:, 1].min() - 100.0)))
+    locations = np.concatenate((locations, decoys))
+    lats, lons, alts = utils.convert_lv95_to_wgs84_array(locations[:, 1], locations[:, 0], np.full(len(locations), GROUND_ALTITUDE))
+    class_names = np.array(list(utils.load_class_table(class_table_path).values()))
+    names = class_names[rng.integers(0, len(class_names), len(locations))]
+    snrs = rng.integers(5, 40, len(locations))
+    std_devs = rng.uniform(0, 5e-6, (len(locations), 2))
+    std_dev_alts = rng.uniform(0, 3, len(locations))
+    std_dev_snrs = rng.integers(0, 10, len(locations))
+    with open(file_path, 'w') as file:
+        file.write(data_loader.LABELS_CSV_HEADER + "\n")
+        for row in zip(lons, lats, alts, snrs, std_devs[:, 0], std_devs[:, 1], std_dev_alts, std_dev_snrs, names):
+            file.write("{:.7f};{:.7f};{:.7f};{};{:.7f};{:.7f};{:.7f};{};{}\n".format(*row))
+    return len(locations)
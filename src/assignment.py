@@ -0,0 +1,190 @@
+"""
+This module provides a globally optimal one-to-one assignment of labels to point clouds (or segments), solved on
+sparse candidate pairs split into independent connected components.
+"""
+import numpy as np
+
+import spatial_index
+
+# standard deviations below this value (in meters) are clamped, so that a label with a null std-dev keeps a finite cost
+MIN_STD_DEV = 0.01
+
+def get_candidate_pairs(target_locations, label_locations, max_distance: float):
+    """
+    Find all the (label, target) pairs that are at most max_distance apart.
+
+    Returns:
+    tuple: Three arrays (label indices, target indices, distances), one entry per candidate pair.
+    """
+    target_locations = np.asarray(target_locations, dtype=np.float64).reshape(-1, 2)
+    label_locations = np.asarray(label_locations, dtype=np.float64).reshape(-1, 2)
+    if np.isfinite(max_distance) and max_distance > 0:
+        return spatial_index.GridIndex(target_locations, max_distance).query_pairs(label_locations, max_distance)
+    # without a finite radius every pair is a candidate
+    label_ids, target_ids = np.divmod(np.arange(len(label_locations) * len(target_locations)), max(len(target_locations), 1))
+    diff = target_locations[target_ids] - label_locations[label_ids]
+    distances = np.sqrt(diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1])
+    within = distances <= max_distance
+    return label_ids[within], target_ids[within], distances[within]
+
+def get_connected_components(label_ids, target_ids, n_labels: int, n_targets: int):
+    """
+    Split a bipartite graph of candidate pairs into its connected components.
+
+    Components are found by propagating the smallest node id along the edges, with pointer jumping,
+    so that the number of vectorized passes grows with the logarithm of the component diameter.
+
+    Returns:
+    np.ndarray: The component of each edge, numbered from 0 in order of first appearance of their smallest node.
+    """
+    if len(label_ids) == 0:
+        return np.empty(0, dtype=np.int64)
+    # labels are nodes 0..n_labels-1, targets are the following nodes
+    sources = np.asarray(label_ids, dtype=np.int64)
+    destinations = np.asarray(target_ids, dtype=np.int64) + n_labels
+    components = np.arange(n_labels + n_targets)
+    while True:
+        smallest = np.minimum(components[sources], components[destinations])
+        updated = components.copy()
+        np.minimum.at(updated, sources, smallest)
+        np.minimum.at(updated, destinations, smallest)
+        # pointer jumping: every node points to the root of its root
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, components):
+            break
+        components = updated
+    _, edge_components = np.unique(components[sources], return_inverse=True)
+    return edge_components.reshape(-1)
+
+def solve_assignment(cost):
+    """
+    Solve a rectangular assignment problem with the Hungarian algorithm (shortest augmenting paths, with potentials).
+
+    Parameters:
+    cost (np.ndarray): An (n, m) matrix of finite costs, with n <= m.
+
+    Returns:
+    np.ndarray: The column assigned to each row, minimising the total cost.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    n, m = cost.shape
+    if n > m:
+        raise ValueError(f"Cannot assign {n} rows to {m} columns.")
+    # 1-based potentials and column assignment, column 0 being a virtual start column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_column = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        row_of_column[0] = row
+        column = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = row_of_column[column]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            u[row_of_column[used]] += delta
+            v[used] -= delta
+            min_reduced[1:][free] -= delta
+            column = next_column
+            if row_of_column[column] == 0:
+                break
+        # augment along the alternating path
+        while column:
+            previous = way[column]
+            row_of_column[column] = row_of_column[previous]
+            column = previous
+    assignment = np.full(n, -1, dtype=np.int64)
+    assigned_columns = np.flatnonzero(row_of_column[1:])
+    assignment[row_of_column[1:][assigned_columns] - 1] = assigned_columns
+    return assignment
+
+def _solve_component(label_ids, target_ids, costs):
+    """
+    Find a maximum one-to-one matching of minimum cost among the candidate pairs of one component.
+
+    Every label gets a private "unmatched" column whose cost is larger than any complete matching, so that
+    the solver first maximises the number of matched labels, then minimises their total cost.
+
+    Returns:
+    np.ndarray: The indices of the selected pairs.
+    """
+    labels, label_rows = np.unique(label_ids, return_inverse=True)
+    targets, target_columns = np.unique(target_ids, return_inverse=True)
+    n, m = len(labels), len(targets)
+    if n == 1 or m == 1:
+        # a single label or a single target: only one pair can be matched, the cheapest one
+        return np.array([np.argmin(costs)])
+    unmatched_cost = (costs.max() + 1.0) * (min(n, m) + 1)
+    forbidden_cost = unmatched_cost * (n + 1)
+    cost = np.full((n, m + n), forbidden_cost)
+    cost[label_rows, target_columns] = costs
+    cost[np.arange(n), m + np.arange(n)] = unmatched_cost
+    assignment = solve_assignment(cost)
+    pair_index = np.full((n, m), -1, dtype=np.int64)
+    pair_index[label_rows, target_columns] = np.arange(len(costs))
+    rows = np.flatnonzero(assignment < m)
+    return pair_index[rows, assignment[rows]]
+
+def assign(target_locations, label_locations, max_distance: float, std_devs=None):
+    """
+    Assign labels to targets (point clouds or segments) one-to-one, globally: as many labels as possible are matched
+    to a distinct target within max_distance, and among those matchings, the one of minimum total cost is chosen.
+
+    The cost of a pair is the distance between the label and the target, or, if std_devs is given, the distance
+    divided by the standard deviation of the label (a precise label far from a target is an unlikely match).
+
+    Only the candidate pairs within max_distance are considered, and each connected component of the candidate
+    graph is solved independently, so that the work stays close to linear in the number of labels for sparse scenes.
+
+    Parameters:
+    target_locations (array-like): An (N, 2) array of target locations.
+    label_locations (array-like): An (M, 2) array of label locations.
+    max_distance (float): The maximum distance admissible between a label and its target.
+    std_devs (array-like): The standard deviation of the location of each label, in meters (optional).
+
+    Returns:
+    tuple: Three arrays (label indices, target indices, distances), one entry per matched label, sorted by label.
+    """
+    label_ids, target_ids, distances = get_candidate_pairs(target_locations, label_locations, max_distance)
+    costs = distances
+    if std_devs is not None:
+        std_devs = np.asarray(std_devs, dtype=np.float64)
+        std_devs = np.where(np.isfinite(std_devs), np.maximum(std_devs, MIN_STD_DEV), 1.0)
+        costs = distances / std_devs[label_ids]
+    components = get_connected_components(label_ids, target_ids, len(label_locations), len(target_locations))
+
+    if len(components) == 0:
+        return label_ids, target_ids, distances
+
+    # the cheapest pair of each label (ties broken towards the lowest target)
+    by_label = np.lexsort((target_ids, costs, label_ids))
+    first = np.ones(len(by_label), dtype=bool)
+    first[1:] = label_ids[by_label[1:]] != label_ids[by_label[:-1]]
+    cheapest = by_label[first]
+    # a component where no two labels share their cheapest target is solved by those pairs: every label gets its
+    # minimum cost, which is optimal. Only the other components need the solver.
+    claims = np.bincount(target_ids[cheapest], minlength=len(target_locations))
+    conflicts = np.bincount(components[cheapest], weights=claims[target_ids[cheapest]] > 1, minlength=components.max() + 1) > 0
+    selected = [cheapest[~conflicts[components[cheapest]]]]
+
+    conflicted_pairs = np.flatnonzero(conflicts[components])
+    order = conflicted_pairs[np.argsort(components[conflicted_pairs], kind="stable")]
+    boundaries = np.flatnonzero(np.diff(components[order])) + 1
+    for pairs in np.split(order, boundaries) if len(order) else []:
+        selected.append(pairs[_solve_component(label_ids[pairs], target_ids[pairs], costs[pairs])])
+    selected = np.concatenate(selected)
+    selected = selected[np.argsort(label_ids[selected], kind="stable")]
+    return label_ids[selected], target_ids[selected], distances[selected]
@@ -0,0 +1,164 @@
+"""
+This module provides a persistent catalog of point cloud extents, so that unchanged files are not read
+again to be localised when the same point clouds are matched against new labels.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+import segments
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+
+def get_file_signature(file_path: str) -> dict:
+    """
+    Get the size and modification time of a file, which tell whether it changed.
+    """
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _to_floats(values):
+    return None if values is None else [float(value) for value in values]
+
+class Catalog:
+    """
+    This class holds the scan (see point_cloud.PointCloud.scan) of each point cloud file, keyed by its absolute path,
+    along with the size and modification time of the file when it was scanned.
+
+    An entry is only reused if the file still has the same size and modification time, and was scanned with
+    the same discriminative scalar field. The headers of the files are not kept: they are read back with the points.
+
+    Parameters:
+    path (str): The path to the JSON file the catalog is stored in.
+    entries (dict): The entries of the catalog, keyed by absolute file path.
+    """
+
+    def __init__(self, path: str, entries: dict = None):
+        self.path = path
+        self.entries = entries if entries is not None else {}
+        self.n_hits = 0
+        self.n_misses = 0
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a catalog from its file, or start an empty one if the file does not exist or cannot be used.
+        """
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, 'r') as file:
+                content = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the point cloud catalog {path} ({e}), all files will be scanned again.")
+            return cls(path)
+        if content.get("version") != CATALOG_VERSION:
+            logger.warning(f"Point cloud catalog {path} has an unsupported version, all files will be scanned again.")
+            return cls(path)
+        return cls(path, content["entries"])
+
+    def lookup(self, file_path: str, scalar_field_name: str = None):
+        """
+        Get the scan of a file from the catalog.
+
+        Parameters:
+        file_path (str): The path to the point cloud file.
+        scalar_field_name (str): The discriminative scalar field the file must have been scanned with.
+
+        Returns:
+        dict: The scan of the file, to be given to point_cloud.PointCloud.from_scan, or None if the file is
+              not in the catalog or changed since it was scanned.
+        """
+        entry = self.entries.get(os.path.abspath(file_path))
+        if (entry is None or entry["discriminative_scalar_field_name"] != scalar_field_name
+                or any(entry[key] != value for key, value in get_file_signature(file_path).items())):
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        segment_extents = entry["segment_extents"]
+        if segment_extents is not None:
+            segment_extents = segments.SegmentExtents(
+                np.array(segment_extents["values"], dtype=segment_extents["dtype"]), segment_extents["counts"],
+                segment_extents["mins"], segment_extents["maxs"], segment_extents["sums"])
+        localisations = entry["localisations"]
+        if localisations is not None:
+            # JSON keys are strings: the segment values are stored as [value, north, east] rows instead
+            localisations = {value: (north, east) for value, north, east in localisations}
+        return {
+            "file_path": file_path,
+            "type_str": entry["type_str"],
+            "header": None,
+            "discriminative_scalar_field_name": entry["discriminative_scalar_field_name"],
+            "n_clusters": entry["n_clusters"],
+            "bbox": tuple(entry["bbox"]),
+            "segment_extents": segment_extents,
+            "localisation": None if entry["localisation"] is None else tuple(entry["localisation"]),
+            "localisations": localisations,
+        }
+
+    def update(self, scan: dict):
+        """
+        Add or replace the entry of a scanned file.
+
+        Parameters:
+        scan (dict): The scan of the file (see point_cloud.PointCloud.scan).
+        """
+        segment_extents = scan["segment_extents"]
+        if segment_extents is not None:
+            segment_extents = {
+                "dtype": segment_extents.values.dtype.str,
+                "values": segment_extents.values.tolist(),
+                "counts": segment_extents.counts.tolist(),
+                "mins": segment_extents.mins.tolist(),
+                "maxs": segment_extents.maxs.tolist(),
+                "sums": segment_extents.sums.tolist(),
+            }
+        localisations = scan["localisations"]
+        if localisations is not None:
+            localisations = [[float(value), float(north), float(east)] for value, (north, east) in localisations.items()]
+        self.entries[os.path.abspath(scan["file_path"])] = {
+            **get_file_signature(scan["file_path"]),
+            "type_str": scan["type_str"],
+            "discriminative_scalar_field_name": scan["discriminative_scalar_field_name"],
+            "n_clusters": scan["n_clusters"],
+            "bbox": _to_floats(scan["bbox"]),
+            "segment_extents": segment_extents,
+            "localisation": _to_floats(scan["localisation"]),
+            "localisations": localisations,
+        }
+
+    def prune(self, directory_path: str):
+        """
+        Remove the entries of the files of a directory that no longer exist.
+        Entries of files in other directories, or of other formats or depths than the current run lists, are kept,
+        so that one catalog can serve several datasets and runs.
+
+        Returns:
+        int: The number of removed entries.
+        """
+        prefix = os.path.join(os.path.abspath(directory_path), "")
+        stale = [path for path in self.entries if path.startswith(prefix) and not os.path.exists(path)]
+        for path in stale:
+            del self.entries[path]
+        return len(stale)
+
+    def save(self):
+        """
+        Write the catalog to its file. The file is replaced atomically, so that an interrupted run leaves the previous catalog.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump({"version": CATALOG_VERSION, "entries": self.entries}, file)
+        os.replace(temporary_path, self.path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"Catalog(path={self.path!r}, n_entries={len(self)})"
@@ -1,12 +1,78 @@
 """
 This module provides functions to load data from las and CSV files.
 """
+import concurrent.futures
+import logging
 import os
-import laspy
-import plyfile
-import label, utils, point_cloud
 
-def load_pc_files_from_directory(directory_path, depth=1, scalar_field_name=None):
+import numpy as np
+import formats, instrumentation, label, parallel, utils, point_cloud
+
+logger = logging.getLogger(__name__)
+
+def list_pc_files(directory_path, depth=1, type_strs=None):
+    """
+    List the .las and .ply files to load from the specified directory, in a deterministic (sorted) order.
+
+    Parameters:
+    directory_path (str): The path to the directory containing .las or .ply files.
+    depth (int): The depth of directory (see load_pc_files_from_directory).
+    type_strs (list): The formats of the files to list (see formats), all the registered formats by default.
+
+    Returns:
+    list: The paths of the point cloud files (only the first one if depth is 0).
+    """
+    extensions = formats.get_extensions(type_strs)
+    file_paths = []
+    if depth == 0 or depth == 1:
+        for filename in sorted(os.listdir(directory_path)):
+            file_path = os.path.join(directory_path, filename)
+            if filename.endswith(extensions) and os.path.isfile(file_path):
+                file_paths.append(file_path)
+        if depth == 0:
+            file_paths = file_paths[:1]
+    elif depth == 2:
+        for root, dirs, files in os.walk(directory_path):
+            dirs.sort()
+            if root == directory_path:
+                continue
+            for filename in sorted(files):
+                if filename.endswith(extensions):
+                    file_paths.append(os.path.join(root, filename))
+    return file_paths
+
+def load_pc_file(file_path, scalar_field_name=None, lazy=False):
+    """
+    Load a single .las or .ply file.
+
+    Parameters:
+    file_path (str): The path to the point cloud file.
+    scalar_field_name (str): The name of the scalar field that discriminates the segments (if any).
+    lazy (bool): If True, only read what is needed to localise the point cloud (see point_cloud.PointCloud.from_file).
+                 LAS point clouds with a discriminative scalar field are streamed once to localise their segments
+                 (see point_cloud.PointCloud.from_segmented_file), PLY ones are always read entirely.
+
+    Returns:
+    point_cloud.PointCloud: The point cloud, with its points in memory unless lazy.
+    """
+    type_str = _get_type_str(file_path)
+    if lazy and scalar_field_name is None:
+        return point_cloud.PointCloud.from_file(file_path, type_str=type_str)
+    if lazy and type_str == "LAS":
+        return point_cloud.PointCloud.from_segmented_file(file_path, type_str, scalar_field_name)
+    with instrumentation.stage("load"):
+        pc = formats.get_backend(type_str).read(file_path)
+    return point_cloud.PointCloud(pc, type_str=type_str, discriminative_scalar_field_name=scalar_field_name, file_path=file_path)
+
+def scan_pc_file(file_path, scalar_field_name=None, lazy=False):
+    """
+    Load a single point cloud file and return only its compact description (see point_cloud.PointCloud.scan).
+
+    This is what worker processes run, so that the points never travel back to the parent process.
+    """
+    return load_pc_file(file_path, scalar_field_name, lazy).scan()
+
+def load_pc_files_from_directory(directory_path, depth=1, scalar_field_name=None, workers=1, lazy=True, catalog=None, type_strs=None):
     """
     Load all .las or .ply files from the specified directory.
 
@@ -16,53 +82,85 @@ def load_pc_files_from_directory(directory_path, depth=1, scalar_field_name=None
                  1 if all files are in the same directory,
                  2 if all files are in subdirectories of directory_path).
     scalar_field_name (str): The name of the scalar field to load (if any).
+    workers (int): The number of processes reading the files. With more than one worker,
+                   the files are parsed and localised in a process pool and the returned point clouds
+                   only hold their localisation and header: their points are read again when needed.
+                   With depth 0 and a scalar field, the chunks of the single file are spread over the
+                   workers instead (see point_cloud.PointCloud.from_segmented_file).
+    lazy (bool): If True (default), only the headers (and, for PLY, the x/y bounds) are read at scan time:
+                 the points of a file are read when its label is stored, one file at a time.
+    catalog (catalog.Catalog): If given, files that did not change since they were recorded in the catalog are
+                               not read: their point clouds are rebuilt from it, without their points. The other
+                               files are scanned and recorded, and the catalog is saved.
+    type_strs (list): The formats of the files to load (see formats), all the registered formats by default.
+                      The backend of a format is only imported when a file of that format is read.
 
     Returns:
-    list: A list of point_cloud.PointCloud objects.
+    list: A list of point_cloud.PointCloud objects, in the order of list_pc_files whatever the number of workers.
     """
-
-    point_clouds = []
+    file_paths = list_pc_files(directory_path, depth, type_strs)
     if depth == 0:
-        filename = os.listdir(directory_path)[0]
-        print(f"Loading single point cloud file: {filename}")
-        if filename.endswith('.las'):
-            file_path = os.path.join(directory_path, filename)
-            las_data = laspy.read(file_path)
-            pc = point_cloud.PointCloud(las_data, type_str="LAS", scalar_field_name=scalar_field_name)
-            return [pc]
-        elif filename.endswith('.ply'):
-            file_path = os.path.join(directory_path, filename)
-            ply_data = plyfile.PlyData.read(file_path)
-            pc = point_cloud.PointCloud(ply_data, type_str="PLY", scalar_field_name=scalar_field_name)
-            return [pc]
-    elif depth == 1:
-        for filename in os.listdir(directory_path):
-            if filename.endswith('.las'):
-                file_path = os.path.join(directory_path, filename)
-                las_data = laspy.read(file_path)
-                pc = point_cloud.PointCloud(las_data, type_str="LAS")
-                point_clouds.append(pc)
-            elif filename.endswith('.ply'):
-                file_path = os.path.join(directory_path, filename)
-                ply_data = plyfile.PlyData.read(file_path)
-                pc = point_cloud.PointCloud(ply_data, type_str="PLY")
-                point_clouds.append(pc)
-    elif depth == 2:
-        for root, dirs, files in os.walk(directory_path):
-            for dir in dirs:
-                dir_path = os.path.join(root, dir)
-                for filename in os.listdir(dir_path):
-                    if filename.endswith('.las'):
-                        file_path = os.path.join(dir_path, filename)
-                        las_data = laspy.read(file_path)
-                        pc = point_cloud.PointCloud(las_data)
-                        point_clouds.append(pc)
-                    elif filename.endswith('.ply'):
-                        file_path = os.path.join(dir_path, filename)
-                        ply_data = plyfile.PlyData.read(file_path)
-                        pc = point_cloud.PointCloud(ply_data, type_str="PLY")
-                        point_clouds.append(pc)
-    return point_clouds
+        if file_paths:
+            logger.info(f"Loading single point cloud file: {os.path.basename(file_paths[0])}")
+    else:
+        # the scalar field only applies to the single file mode
+        scalar_field_name = None
+
+    instrumentation.count("point_cloud_files", len(file_paths))
+    with instrumentation.stage("scan"):
+        if catalog is None:
+            return _scan_pc_files(file_paths, scalar_field_name, workers, lazy)
+        scans = [catalog.lookup(file_path, scalar_field_name) for file_path in file_paths]
+        scanned_point_clouds = iter(_scan_pc_files([file_path for file_path, scan in zip(file_paths, scans) if scan is None], scalar_field_name, workers, lazy))
+        point_clouds = []
+        for scan in scans:
+            if scan is not None:
+                point_clouds.append(point_cloud.PointCloud.from_scan(scan))
+                if scalar_field_name is not None:
+                    point_clouds[-1].workers = workers
+            else:
+                point_clouds.append(next(scanned_point_clouds))
+                catalog.update(point_clouds[-1].scan())
+        n_scanned = scans.count(None)
+        if catalog.prune(directory_path) or n_scanned:
+            catalog.save()
+        logger.info(f"Reused {len(file_paths) - n_scanned} point cloud files from the catalog {catalog.path}, scanned {n_scanned}.")
+        return point_clouds
+
+def _get_type_str(file_path):
+    type_str = formats.get_type_str(file_path)
+    if type_str is None:
+        raise ValueError(f"Unsupported point cloud file format: {file_path}")
+    return type_str
+
+def _scan_pc_files(file_paths, scalar_field_name, workers, lazy):
+    if workers > 1 and len(file_paths) == 1 and scalar_field_name is not None:
+        # a single segmented file: its chunks are spread over the workers instead
+        type_str = _get_type_str(file_paths[0])
+        if parallel.supports_chunks(file_paths[0], type_str):
+            return [point_cloud.PointCloud.from_segmented_file(file_paths[0], type_str, scalar_field_name, workers)]
+    if workers <= 1 or len(file_paths) <= 1:
+        return [load_pc_file(file_path, scalar_field_name, lazy) for file_path in file_paths]
+    # the stages run in the worker processes are not timed, only the whole scan is
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        scans = executor.map(scan_pc_file, file_paths, [scalar_field_name] * len(file_paths), [lazy] * len(file_paths), chunksize=max(1, len(file_paths) // (4 * workers)))
+        return [point_cloud.PointCloud.from_scan(scan) for scan in scans]
+
+LABELS_CSV_HEADER = "#Mean longitude;Mean latitude;Mean altitude;SNR;stddev longitude;stddev latitude;stddev altitude;stddev SNR; label"
+
+# one structured row per line of the labels CSV, parsed in a single pass by numpy (the label names as Python strings,
+# so that their length is not capped)
+_LABELS_CSV_DTYPE = np.dtype([
+    ('longitude', np.float64),
+    ('latitude', np.float64),
+    ('altitude', np.float64),
+    ('snr', np.float64),
+    ('std_dev_longitude', np.float64),
+    ('std_dev_latitude', np.float64),
+    ('std_dev_altitude', np.float64),
+    ('std_dev_snr', np.float64),
+    ('label', object),
+])
 
 def load_labels_from_csv(labels_csv_path, classes_csv_path):
     """
@@ -73,21 +171,20 @@ def load_labels_from_csv(labels_csv_path, classes_csv_path):
     classes_csv_path (str): The path to the CSV file containing the reference label table.
 
     Returns:
-    list: A list of Label objects (see label module).
+    label.LabelSet: The labels, stored column-wise (missing values such as `nan` std-devs are kept as NaN).
     """
-    labels = []
     with open(labels_csv_path, 'r') as file:
-        lines = file.readlines()
-        if lines[0].strip() != "#Mean longitude;Mean latitude;Mean altitude;SNR;stddev longitude;stddev latitude;stddev altitude;stddev SNR; label":
-            raise ValueError(f"Unexpected header format. Expected:\n'#Mean longitude;Mean latitude;Mean altitude;SNR;stddev longitude;stddev latitude;stddev altitude;stddev SNR; label', \ngot:\n'{lines[0].strip()}'")
-        for line in lines[1:]:  # Skip header
-            parts = line.strip().split(';')
-            if len(parts) != 9:
-                raise ValueError(f"Unexpected number of columns in line: {line.strip()}")
-            line_label = label.Label(
-                label=utils.get_label_index(parts[8], classes_csv_path),
-                geolocation=(float(parts[0]), float(parts[1]), float(parts[2])),
-                std_devs=(float(parts[4]), float(parts[5]), float(parts[6]))
-            )
-            labels.append(line_label)
-    return labels
+        header = file.readline().strip()
+        if header != LABELS_CSV_HEADER:
+            raise ValueError(f"Unexpected header format. Expected:\n'{LABELS_CSV_HEADER}', \ngot:\n'{header}'")
+        try:
+            rows = np.loadtxt(file, delimiter=';', dtype=_LABELS_CSV_DTYPE, comments=None, ndmin=1)
+        except ValueError as e:
+            raise ValueError(f"Unexpected content in {labels_csv_path}, expected 9 columns per line: {e}") from e
+    return label.LabelSet(
+        classes=utils.get_label_indices(rows['label'], classes_csv_path),
+        geolocations=np.column_stack((rows['longitude'], rows['latitude'], rows['altitude'])),
+        std_devs=np.column_stack((rows['std_dev_longitude'], rows['std_dev_latitude'], rows['std_dev_altitude'])),
+        snrs=rows['snr'],
+        std_dev_snrs=rows['std_dev_snr']
+    )
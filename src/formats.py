@@ -0,0 +1,63 @@
+"""
+This module registers the point cloud formats by file extension.
+
+Each format has a backend module (las_stream for LAS, ply_stream for PLY) that is only imported, with its library,
+the first time a file of that format is read: a job that only reads LAS files never imports plyfile, and the other
+way around. A backend module provides:
+
+- read(file_path): the points of a file (laspy.LasData, or a memory-mapped plyfile.PlyData).
+- read_bounds(file_path, chunk_size): the header and the x/y mins and maxs of a file, without loading its points.
+- read_header(file_path), get_point_count(file_path).
+- supports_chunks(file_path): whether ranges of points can be read independently (see parallel).
+"""
+import importlib
+
+# format -> (file extensions, backend module name), in registration order
+_FORMATS = {}
+
+def register(type_str: str, extensions, module_name: str):
+    """
+    Register a point cloud format.
+
+    Parameters:
+    type_str (str): The name of the format, as in point_cloud.PointCloud.type_str.
+    extensions (tuple): The file extensions of the format, with their dot.
+    module_name (str): The name of the backend module, imported the first time it is needed.
+    """
+    _FORMATS[type_str] = (tuple(extensions), module_name)
+
+def get_type_strs() -> list:
+    return list(_FORMATS)
+
+def get_extensions(type_strs=None) -> tuple:
+    """
+    Get the file extensions of the given formats (all the registered formats by default).
+    """
+    if type_strs is None:
+        type_strs = _FORMATS
+    extensions = ()
+    for type_str in type_strs:
+        if type_str not in _FORMATS:
+            raise ValueError(f"Unknown point cloud format: {type_str}. Known formats: {', '.join(_FORMATS)}.")
+        extensions += _FORMATS[type_str][0]
+    return extensions
+
+def get_type_str(file_path: str):
+    """
+    Get the format of a file from its extension, or None if no registered format has it.
+    """
+    for type_str, (extensions, _) in _FORMATS.items():
+        if file_path.endswith(extensions):
+            return type_str
+    return None
+
+def get_backend(type_str: str):
+    """
+    Get the backend module of a format, importing it (and its library) on first use.
+    """
+    if type_str not in _FORMATS:
+        raise ValueError(f"Unknown point cloud type: {type_str}")
+    return importlib.import_module(_FORMATS[type_str][1])
+
+register("LAS", (".las",), "las_stream")
+register("PLY", (".ply",), "ply_stream")
@@ -0,0 +1,169 @@
+"""
+This module provides the incremental storage of labelled point clouds: a manifest records, for each output file,
+its source file and which label was assigned to each of its segments, so that a later run only rewrites the outputs
+whose assignments changed.
+"""
+import json
+import logging
+import os
+
+import catalog, formats, instrumentation, output_writer
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+# the key of the assignment of a point cloud labelled as a whole
+WHOLE_CLOUD = "*"
+
+def get_assignments(point_cloud) -> dict:
+    """
+    Get the label assigned to each segment of a point cloud, as label hashes (see label.Label.get_hash).
+
+    Returns:
+    dict: A dictionary mapping segment keys (the scalar field values as strings, or WHOLE_CLOUD) to label hashes.
+    """
+    if point_cloud.segment_labels:
+        return {repr(float(value)): lbl.get_hash() for value, lbl in point_cloud.segment_labels.items()}
+    if point_cloud.label is not None:
+        return {WHOLE_CLOUD: point_cloud.label.get_hash()}
+    return {}
+
+class Manifest:
+    """
+    This class holds the entries of the outputs of previous runs, keyed by output file name. Each entry records:
+    - the source file of the output, with its size and modification time when it was labelled;
+    - the size and modification time of the output when it was written;
+    - the hash of the label assigned to each segment of the output.
+
+    Parameters:
+    folder_path (str): The output folder, where the manifest is stored.
+    entries (dict): The entries of the manifest.
+    """
+
+    def __init__(self, folder_path: str, entries: dict = None):
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, MANIFEST_FILE_NAME)
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, folder_path: str):
+        """
+        Load the manifest of an output folder, or start an empty one if there is none (all outputs are then written).
+        """
+        path = os.path.join(folder_path, MANIFEST_FILE_NAME)
+        if not os.path.exists(path):
+            return cls(folder_path)
+        try:
+            with open(path, 'r') as file:
+                content = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the manifest {path} ({e}), all outputs will be written again.")
+            return cls(folder_path)
+        if content.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Manifest {path} has an unsupported version, all outputs will be written again.")
+            return cls(folder_path)
+        return cls(folder_path, content["entries"])
+
+    def save(self):
+        """
+        Write the manifest. The file is replaced atomically, so that an interrupted run leaves the previous manifest.
+        """
+        os.makedirs(self.folder_path, exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, file)
+        os.replace(temporary_path, self.path)
+
+    def get_changes(self, point_cloud, output_path: str, assignments: dict):
+        """
+        Compare the assignments of a point cloud with those recorded for its output.
+
+        Returns:
+        set: The keys of the segments whose label changed, or None if the output must be written entirely
+             (new output, changed source, or output modified or removed since it was written).
+        """
+        entry = self.entries.get(os.path.basename(output_path))
+        if entry is None or point_cloud.file_path is None or entry["source"] != os.path.abspath(point_cloud.file_path):
+            return None
+        if entry["source_signature"] != catalog.get_file_signature(point_cloud.file_path):
+            return None
+        if not os.path.exists(output_path) or entry["output_signature"] != catalog.get_file_signature(output_path):
+            return None
+        previous = entry["assignments"]
+        return {key for key in previous.keys() | assignments.keys() if previous.get(key) != assignments.get(key)}
+
+    def record(self, point_cloud, output_path: str, assignments: dict):
+        """
+        Record the output of a point cloud, just written or updated.
+        """
+        self.entries[os.path.basename(output_path)] = {
+            "source": os.path.abspath(point_cloud.file_path) if point_cloud.file_path else None,
+            "source_signature": catalog.get_file_signature(point_cloud.file_path) if point_cloud.file_path else None,
+            "output_signature": catalog.get_file_signature(output_path),
+            "assignments": assignments,
+        }
+
+def store_point_clouds(point_clouds, folder_path: str, chunk_size: int = None, workers: int = 1,
+                       max_pending_bytes: int = output_writer.DEFAULT_MAX_PENDING_BYTES) -> dict:
+    """
+    Store labelled point clouds in a folder, only touching the outputs whose assignments changed since the last run.
+
+    - Outputs whose source and assignments did not change are left untouched on disk.
+    - Binary PLY outputs of segmented point clouds are updated in place: only the points of the segments
+      whose label changed are rewritten (see ply_stream.update_classification).
+    - Other outputs with changes are written again entirely, concurrently (see output_writer.write_point_clouds).
+    - Outputs of previous runs that are not produced anymore (their point cloud lost all its labels) are removed.
+
+    Parameters:
+    point_clouds (list): The labelled point clouds (a point cloud listed several times is stored once).
+    folder_path (str): The output folder.
+    chunk_size (int): The chunk size given to store_pc.
+    workers (int): The maximum number of concurrent writes.
+    max_pending_bytes (int): The memory budget of the writes in progress, in bytes.
+
+    Returns:
+    dict: The number of outputs "written", "updated" (in place), "unchanged" and "removed".
+    """
+    manifest = Manifest.load(folder_path)
+    stats = {"written": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    output_names = set()
+    unique_point_clouds = list({id(pc): pc for pc in point_clouds}.values())
+    output_paths = output_writer.assign_output_paths(unique_point_clouds, folder_path)
+    to_write = []
+    for point_cloud, output_path in zip(unique_point_clouds, output_paths):
+        output_names.add(os.path.basename(output_path))
+        assignments = get_assignments(point_cloud)
+        changes = manifest.get_changes(point_cloud, output_path, assignments)
+        if changes is not None and not changes:
+            stats["unchanged"] += 1
+            continue
+        if changes is not None and point_cloud.segment_labels and point_cloud.type_str == "PLY":
+            labels_by_key = {repr(float(value)): lbl for value, lbl in point_cloud.segment_labels.items()}
+            mapping = {float(key): (labels_by_key[key].label if key in labels_by_key else None) for key in changes}
+            with instrumentation.stage("write"):
+                updated = formats.get_backend("PLY").update_classification(output_path, point_cloud.discriminative_scalar_field_name, mapping, fallback_path=point_cloud.file_path)
+            if updated:
+                logger.debug(f"Updated {len(changes)} segments of {output_path} in place.")
+                manifest.record(point_cloud, output_path, assignments)
+                stats["updated"] += 1
+                continue
+        to_write.append((point_cloud, output_path, assignments))
+
+    output_writer.write_point_clouds([pc for pc, _, _ in to_write], folder_path, chunk_size=chunk_size, workers=workers,
+                                     max_pending_bytes=max_pending_bytes, output_paths=[path for _, path, _ in to_write])
+    for point_cloud, output_path, assignments in to_write:
+        manifest.record(point_cloud, output_path, assignments)
+    stats["written"] = len(to_write)
+
+    for output_name in sorted(set(manifest.entries) - output_names):
+        output_path = os.path.join(folder_path, output_name)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        del manifest.entries[output_name]
+        stats["removed"] += 1
+    manifest.save()
+    for name, value in stats.items():
+        instrumentation.count(f"outputs_{name}", value)
+    logger.info(f"Incremental store in {folder_path}: {stats['written']} outputs written, {stats['updated']} updated in place, {stats['unchanged']} unchanged, {stats['removed']} removed.")
+    return stats
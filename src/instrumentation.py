@@ -0,0 +1,258 @@
+"""
+This module provides the instrumentation of the pipeline: logging configuration, stage timers with
+memory counters, match statistics, and the JSON run report gathering them.
+
+Instrumented code calls `stage` and `record_matches`, which are no-ops unless a run report is active
+(see `RunReport.activate`), so that library users pay nothing for them.
+"""
+import contextlib
+import datetime
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# the report stages and matches are recorded in, if any
+_active_report = None
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as one JSON object per line, with the fields given in their `extra`.
+    """
+    _RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+def configure_logging(level: str = "INFO", json_format: bool = False):
+    """
+    Configure the logging of the pipeline on stderr.
+
+    Parameters:
+    level (str): The minimal level of the logged messages (DEBUG, INFO, WARNING, ERROR).
+    json_format (bool): If True, log one JSON object per line instead of plain text.
+    """
+    handler = logging.StreamHandler()
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+def get_peak_rss_bytes():
+    """
+    Get the peak resident memory of the whole process so far, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes on Linux and the BSDs
+    return peak if sys.platform == "darwin" else peak * 1024
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Time a stage of the pipeline in the active run report, if any.
+
+    A stage can run several times (e.g. once per file): its calls and durations add up. Stages can be nested,
+    the time and memory of a stage include those of the stages it contains.
+    """
+    report = _active_report
+    if report is None:
+        yield
+        return
+    report._enter(name)
+    try:
+        yield
+    finally:
+        report._exit(name)
+
+def record_matches(distances, n_targets: int, max_distance: float):
+    """
+    Record the result of a matching in the active run report, if any.
+
+    Parameters:
+    distances (np.ndarray): The distance of each label to its match, inf for skipped labels.
+    n_targets (int): The number of point clouds or segments that received a label.
+    max_distance (float): The maximum matching distance, the upper edge of the distance histogram.
+    """
+    if _active_report is not None:
+        _active_report.match_statistics.record(distances, n_targets, max_distance)
+
+def count(name: str, value: int):
+    """
+    Add a value to a counter of the active run report, if any (see `RunReport.count`).
+    """
+    if _active_report is not None:
+        _active_report.count(name, value)
+
+class MatchStatistics:
+    """
+    This class accumulates the number of matched and skipped labels and the distribution of the matching distances.
+    """
+    N_HISTOGRAM_BINS = 10
+
+    def __init__(self):
+        self.n_labels = 0
+        self.n_targets = 0
+        self.max_distance = 0.0
+        self._distances = []
+
+    def record(self, distances, n_targets: int, max_distance: float):
+        distances = np.asarray(distances, dtype=np.float64)
+        self.n_labels += len(distances)
+        self.n_targets += n_targets
+        self.max_distance = max(self.max_distance, max_distance)
+        self._distances.append(distances[np.isfinite(distances)])
+
+    def to_dict(self) -> dict:
+        matched_distances = np.concatenate(self._distances) if self._distances else np.empty(0)
+        upper = self.max_distance if np.isfinite(self.max_distance) and self.max_distance > 0 else (matched_distances.max(initial=0.0) or 1.0)
+        counts, edges = np.histogram(matched_distances, bins=self.N_HISTOGRAM_BINS, range=(0.0, upper))
+        return {
+            "n_labels": self.n_labels,
+            "n_matched": len(matched_distances),
+            "n_skipped": self.n_labels - len(matched_distances),
+            "n_labelled_targets": self.n_targets,
+            "mean_distance": float(matched_distances.mean()) if len(matched_distances) else None,
+            "distance_histogram": {"bin_edges": edges.tolist(), "counts": counts.tolist()},
+        }
+
+class RunReport:
+    """
+    This class gathers the stage timings, memory counters and match statistics of a run.
+
+    Stages can be recorded from several threads (e.g. concurrent writes, see output_writer): each thread has its
+    own stack of nested stages. The traced memory is process-wide, so the peak of a stage run concurrently
+    includes the allocations of the other threads.
+
+    The resident memory is only known as the peak of the whole process so far: each stage records this peak when it
+    ends (process_peak_rss_bytes) and how much its calls raised it (peak_rss_increase_bytes), which is 0 for a stage
+    that stays below the peak of an earlier one. The peak memory of each stage needs trace_memory.
+
+    Parameters:
+    trace_memory (bool): If True, the peak of the memory allocated through Python (numpy arrays included) is
+                         measured per stage with tracemalloc, which slows down allocation-heavy code.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.started = datetime.datetime.now()
+        self.parameters = {}
+        self.counters = {}
+        self.stages = {}
+        self.match_statistics = MatchStatistics()
+        self.seconds = None
+        self._start_time = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self):
+        # the stages entered and not exited yet by the current thread
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Make this report the one stages and matches are recorded in, for the duration of the context.
+        """
+        global _active_report
+        previous = _active_report
+        _active_report = self
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        self._start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds = time.perf_counter() - self._start_time
+            if started_tracing:
+                tracemalloc.stop()
+            _active_report = previous
+
+    def _enter(self, name: str):
+        if self.trace_memory and tracemalloc.is_tracing():
+            # the peak is reset for the new stage: keep the one reached so far by the enclosing stage
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        # [name, start time, peak of the stages nested in it, process peak RSS at the start]
+        self._stack.append([name, time.perf_counter(), 0, get_peak_rss_bytes()])
+
+    def _exit(self, name: str):
+        _, start, nested_peak, start_peak_rss = self._stack.pop()
+        seconds = time.perf_counter() - start
+        with self._lock:
+            entry = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            if self.trace_memory and tracemalloc.is_tracing():
+                peak = max(tracemalloc.get_traced_memory()[1], nested_peak)
+                entry["peak_traced_memory_bytes"] = max(entry.get("peak_traced_memory_bytes", 0), peak)
+                if self._stack:
+                    self._stack[-1][2] = max(self._stack[-1][2], peak)
+                tracemalloc.reset_peak()
+            peak_rss = get_peak_rss_bytes()
+            entry["process_peak_rss_bytes"] = peak_rss
+            if peak_rss is not None:
+                entry["peak_rss_increase_bytes"] = entry.get("peak_rss_increase_bytes", 0) + peak_rss - start_peak_rss
+
+    def count(self, name: str, value: int):
+        """
+        Add a value to a counter of the report (e.g. the number of points read), used to compute throughputs.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        seconds = self.seconds
+        if seconds is None and self._start_time is not None:
+            seconds = time.perf_counter() - self._start_time
+        throughput = {}
+        if seconds:
+            for name, value in self.counters.items():
+                throughput[f"{name}_per_second"] = value / seconds
+        return {
+            "started": self.started.isoformat(timespec='seconds'),
+            "seconds": seconds,
+            "parameters": self.parameters,
+            "counters": self.counters,
+            "throughput": throughput,
+            "process_peak_rss_bytes": get_peak_rss_bytes(),
+            "stages": self.stages,
+            "matches": self.match_statistics.to_dict(),
+        }
+
+    def write(self, file_path: str):
+        """
+        Write the report as JSON.
+        """
+        with open(file_path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+        logger.info(f"Run report written to {file_path}")
@@ -1,3 +1,7 @@
+import hashlib
+
+import numpy as np
+
 import utils
 
 class Label:
@@ -15,11 +19,8 @@ class Label:
 
     def get_2d_location(self, coord_system="LV95"):
         if coord_system == "LV95":
-            if self.geolocation[0] < 180 and self.geolocation[1] < 90:
-                lv95_coords = utils.convert_wgs84_to_lv95(self.geolocation[0], self.geolocation[1], self.geolocation[2])
-                return (lv95_coords[0], lv95_coords[1])
-            else:
-                return (self.geolocation[0], self.geolocation[1])
+            location = utils.to_lv95_2d([self.geolocation[0]], [self.geolocation[1]])[0]
+            return (location[0], location[1])
         elif coord_system == "WGS84":
             if self.geolocation[0] > 180 and self.geolocation[1] > 90:
                 wgs84_coords = utils.convert_lv95_to_wgs84(self.geolocation[0], self.geolocation[1], self.geolocation[2])
@@ -29,5 +30,88 @@ class Label:
         else:
             raise ValueError(f"Unknown coordinate system: {coord_system}")
 
+    def get_hash(self) -> str:
+        """
+        Get a digest of the class, geolocation and standard deviations of the label, which identifies a label row across runs.
+        """
+        row = (int(self.label), tuple(float(value) for value in self.geolocation), tuple(float(value) for value in self.std_devs))
+        return hashlib.sha1(repr(row).encode()).hexdigest()
+
     def __repr__(self):
         return f"Label(label={self.label}, geolocation={self.geolocation}, std_devs={self.std_devs})"
+
+
+class LabelSet:
+    """
+    This class holds a whole set of labels as NumPy columns, one entry per label.
+
+    Individual rows can still be accessed as Label objects by indexing the set.
+    """
+
+    def __init__(self, classes, geolocations, std_devs=None, snrs=None, std_dev_snrs=None):
+        self.classes = np.asarray(classes, dtype=np.int64).reshape(-1)
+        geolocations = np.asarray(geolocations, dtype=np.float64).reshape(-1, 3)
+        self.longitudes = geolocations[:, 0]
+        self.latitudes = geolocations[:, 1]
+        self.altitudes = geolocations[:, 2]
+        n = len(self.classes)
+        if len(geolocations) != n:
+            raise ValueError(f"Got {n} label classes but {len(geolocations)} geolocations.")
+        self.std_devs = np.zeros((n, 3)) if std_devs is None else np.asarray(std_devs, dtype=np.float64).reshape(-1, 3)
+        self.snrs = np.full(n, np.nan) if snrs is None else np.asarray(snrs, dtype=np.float64).reshape(-1)
+        self.std_dev_snrs = np.full(n, np.nan) if std_dev_snrs is None else np.asarray(std_dev_snrs, dtype=np.float64).reshape(-1)
+
+    @classmethod
+    def from_labels(cls, labels):
+        """
+        Build a LabelSet from a list of Label objects.
+        """
+        if isinstance(labels, LabelSet):
+            return labels
+        return cls(
+            classes=[lbl.label for lbl in labels],
+            geolocations=[lbl.geolocation[:3] for lbl in labels],
+            std_devs=[lbl.std_devs[:3] for lbl in labels]
+        )
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __getitem__(self, index):
+        return Label(
+            label=int(self.classes[index]),
+            geolocation=(float(self.longitudes[index]), float(self.latitudes[index]), float(self.altitudes[index])),
+            std_devs=tuple(float(v) for v in self.std_devs[index])
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def get_std_dev_norms(self):
+        """
+        Vectorized Label.get_std_dev_norm over all the labels (NaN where a std-dev is missing).
+        """
+        lon_m = self.std_devs[:, 0] * 111111 # Approx conversion of degrees to meters for lat/lon
+        lat_m = self.std_devs[:, 1] * 111111
+        return np.sqrt(lon_m * lon_m + lat_m * lat_m + self.std_devs[:, 2] * self.std_devs[:, 2])
+
+    def get_sorted_order(self):
+        """
+        Get the label indices sorted by standard deviation norm (ascending, labels with missing std-devs last).
+        """
+        return np.argsort(self.get_std_dev_norms(), kind="stable")
+
+    def get_2d_locations(self):
+        """
+        Get the LV95 2D locations of all the labels, converted in one vectorized call.
+
+        Returns:
+        np.ndarray: An (N, 2) array of (north, east) LV95 coordinates, in the order of the labels.
+        """
+        if len(self) == 0:
+            return np.empty((0, 2), dtype=np.float64)
+        return utils.to_lv95_2d(self.longitudes, self.latitudes)
+
+    def __repr__(self):
+        return f"LabelSet(n_labels={len(self)})"
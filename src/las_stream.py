@@ -0,0 +1,183 @@
+"""
+This module provides chunked streaming functions for LAS files too large to be loaded in memory.
+
+It is the backend of the LAS format (see formats): the only module reading LAS files that imports laspy at load time.
+"""
+import laspy
+import numpy as np
+
+import segments
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+def read(file_path: str):
+    return laspy.read(file_path)
+
+def read_header(file_path: str):
+    with laspy.open(file_path) as reader:
+        return reader.header
+
+def read_bounds(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Get the header and the x/y bounds of a LAS file: only the header is read, its mins/maxs give the bounds.
+    """
+    header = read_header(file_path)
+    return header, header.mins, header.maxs
+
+def get_point_count(file_path: str) -> int:
+    return read_header(file_path).point_count
+
+def supports_chunks(file_path: str) -> bool:
+    return True
+
+def read_range(file_path: str, start: int, stop: int):
+    """
+    Read the points [start, stop) of a LAS file, seeking to the first one.
+    """
+    with laspy.open(file_path) as reader:
+        reader.seek(start)
+        return reader.read_points(stop - start)
+
+def iter_chunks(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    with laspy.open(file_path) as reader:
+        yield from reader.chunk_iterator(chunk_size)
+
+def copy_with_classification(src_path: str, dst_path: str, classification_chunks, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Copy a LAS file chunk by chunk, setting the classification of the points of each chunk from the next
+    array of classification_chunks.
+
+    Returns:
+    int: The number of points written.
+    """
+    n_points = 0
+    first_chunk = None
+    with laspy.open(src_path) as reader:
+        with laspy.open(dst_path, mode='w', header=reader.header) as writer:
+            for points, classification in zip(reader.chunk_iterator(chunk_size), classification_chunks):
+                if first_chunk is None:
+                    first_chunk = points
+                points.classification[:] = classification
+                writer.write_points(points)
+                n_points += len(points)
+            if first_chunk is not None:
+                _reset_extra_bytes_stats(writer.header, first_chunk)
+    return n_points
+
+def compute_extents(file_path: str, scalar_field_name: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Compute the 2D extents of a LAS file, or of each of its segments, in one streamed pass.
+
+    Parameters:
+    file_path (str): The path to the LAS file.
+    scalar_field_name (str): The dimension (standard or extra bytes) that discriminates the segments, or None for the whole file.
+    chunk_size (int): The maximum number of points held in memory at once.
+
+    Returns:
+    dict: A dictionary mapping each segment value to its (min_x, min_y, max_x, max_y) extent.
+          Without scalar_field_name, the whole file is one segment keyed by None and only its header is read.
+    """
+    if scalar_field_name is None:
+        header = read_header(file_path)
+        mins, maxs = header.mins, header.maxs
+        return {None: (mins[0], mins[1], maxs[0], maxs[1])}
+    extents = compute_segment_extents(file_path, scalar_field_name, chunk_size)
+    return {value: (extents.mins[i, 0], extents.mins[i, 1], extents.maxs[i, 0], extents.maxs[i, 1]) for i, value in enumerate(extents.values.tolist())}
+
+def compute_segment_extents(file_path: str, scalar_field_name: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Compute the extents, centroids and point counts of all the segments of a LAS file in one streamed pass.
+
+    Returns:
+    segments.SegmentExtents: The statistics of each segment, with x, y, z as axes.
+    """
+    with laspy.open(file_path) as reader:
+        if scalar_field_name not in reader.header.point_format.dimension_names:
+            raise ValueError(f"Dimension '{scalar_field_name}' not found in LAS point cloud {file_path}.")
+        parts = []
+        for chunk in reader.chunk_iterator(chunk_size):
+            parts.append(segments.SegmentExtents.compute(np.asarray(chunk[scalar_field_name]), chunk.x, chunk.y, chunk.z))
+            parts = [segments.SegmentExtents.merge(parts)]
+    return segments.SegmentExtents.merge(parts)
+
+def write_labelled(src_path: str, dst_path: str, classification=None, scalar_field_name: str = None, mapping: dict = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Copy a LAS file chunk by chunk, setting the classification of its points on the way.
+
+    Either a single classification is given for all the points, or a mapping from the values of
+    scalar_field_name to classifications (points of unmapped segments keep their classification).
+    For files that fit in memory, the output is byte-identical to labelling the loaded LasData and writing it.
+
+    Parameters:
+    src_path (str): The path to the LAS file to read.
+    dst_path (str): The path to the LAS file to write.
+    classification (int): The classification of all the points.
+    scalar_field_name (str): The dimension that discriminates the segments, used with mapping.
+    mapping (dict): A dictionary mapping segment values to classifications.
+    chunk_size (int): The maximum number of points held in memory at once.
+
+    Returns:
+    int: The number of points written.
+    """
+    if (classification is None) == (mapping is None):
+        raise ValueError("Exactly one of classification and mapping must be given.")
+    if mapping is not None:
+        table = segments.build_lookup_table(mapping)
+    n_points = 0
+    first_chunk = None
+    with laspy.open(src_path) as reader:
+        with laspy.open(dst_path, mode='w', header=reader.header) as writer:
+            for chunk in reader.chunk_iterator(chunk_size):
+                if first_chunk is None:
+                    first_chunk = chunk
+                if mapping is None:
+                    chunk.classification[:] = int(classification)
+                elif mapping:
+                    mapped, mapped_classifications = segments.lookup(chunk[scalar_field_name], table)
+                    classifications = np.array(chunk.classification)
+                    classifications[mapped] = mapped_classifications
+                    chunk.classification[:] = classifications
+                writer.write_points(chunk)
+                n_points += len(chunk)
+            if first_chunk is not None:
+                _reset_extra_bytes_stats(writer.header, first_chunk)
+    return n_points
+
+def _reset_extra_bytes_stats(header, first_chunk):
+    """
+    Set the min/max of the extra dimensions of header as writing all the points at once sets them: laspy derives
+    them from the first value of the points given to each write, so that a chunked write would otherwise depend on
+    the chunk size.
+    """
+    vlrs = header.vlrs.get("ExtraBytesVlr")
+    if vlrs:
+        vlrs[0].partial_reset()
+        vlrs[0].grow(first_chunk)
+
+class SegmentedWriter:
+    """
+    Write points with a classification and a segment id into a LAS 1.4 file (point format 6, whose classification
+    takes values up to 255), chunk by chunk. Negative classes (labels missing from the class table) are written as 0,
+    "never classified", since the classification of LAS files is unsigned.
+    """
+
+    def __init__(self, file_path: str, offsets, scales, segment_id_field: str):
+        self.segment_id_field = segment_id_field
+        self.header = laspy.LasHeader(version="1.4", point_format=6)
+        self.header.add_extra_dim(laspy.ExtraBytesParams(name=segment_id_field, type=np.float64))
+        self.header.scales = np.array(scales, dtype=np.float64)
+        self.header.offsets = np.array(offsets, dtype=np.float64)
+        self.writer = laspy.open(file_path, mode='w', header=self.header)
+
+    def write(self, xs, ys, zs, classifications, segment_ids):
+        points = laspy.ScaleAwarePointRecord.zeros(len(xs), header=self.header)
+        points.x, points.y, points.z = xs, ys, zs
+        classifications = np.asarray(classifications)
+        if classifications.size and classifications.max() > np.iinfo(np.uint8).max:
+            raise ValueError(f"Class {classifications.max()} does not fit in the classification of a LAS file (up to 255).")
+        points.classification = np.where(classifications < 0, 0, classifications).astype(np.uint8)
+        points[self.segment_id_field] = segment_ids
+        self.writer.write_points(points)
+
+    def close(self):
+        self.writer.close()
@@ -1,35 +1,135 @@
 import argparse
+import logging
 import os
 
-import data_loader, matcher
+import catalog, data_loader, formats, incremental, instrumentation, matcher, output_writer, propagation
 
-def main(dir_depth: int, max_distance: float, scalar_field_name: str):
-    point_clouds = data_loader.load_pc_files_from_directory('./data/point_clouds', depth=dir_depth, scalar_field_name=scalar_field_name)
+logger = logging.getLogger(__name__)
+
+def main(dir_depth: int, max_distance: float, scalar_field_name: str, *, workers: int = 1, chunk_size: int = None, report_path: str = None, trace_memory: bool = False, catalog_path: str = None, incremental_mode: bool = False,
+         assignment_method: str = "greedy", weight_by_std_dev: bool = False, write_workers: int = 1, merged_output_path: str = None,
+         footprint_cell_size: float = None, propagate_mode: bool = False, point_clouds_path: str = './data/point_clouds', labels_path: str = './data/labels',
+         class_table_path: str = './class_table.csv', output_path: str = './output_pc', type_strs: list = None):
+    report = instrumentation.RunReport(trace_memory=trace_memory)
+    report.parameters = {"dir_depth": dir_depth, "max_distance": max_distance, "scalar_field_name": scalar_field_name, "workers": workers, "chunk_size": chunk_size, "catalog": catalog_path, "incremental": incremental_mode,
+                         "assignment": assignment_method, "weight_by_std_dev": weight_by_std_dev, "write_workers": write_workers, "merged_output": merged_output_path,
+                         "footprint_cell_size": footprint_cell_size, "propagate": propagate_mode, "point_clouds": point_clouds_path, "labels": labels_path,
+                         "class_table": class_table_path, "output": output_path, "formats": type_strs}
+    with report.activate():
+        run(dir_depth, max_distance, scalar_field_name, workers=workers, chunk_size=chunk_size, catalog_path=catalog_path, incremental_mode=incremental_mode,
+            assignment_method=assignment_method, weight_by_std_dev=weight_by_std_dev, write_workers=write_workers, merged_output_path=merged_output_path,
+            footprint_cell_size=footprint_cell_size, propagate_mode=propagate_mode, point_clouds_path=point_clouds_path, labels_path=labels_path,
+            class_table_path=class_table_path, output_path=output_path, type_strs=type_strs)
+    if report_path:
+        report.write(report_path)
+    return report
+
+def run(dir_depth: int, max_distance: float, scalar_field_name: str, *, workers: int = 1, chunk_size: int = None, catalog_path: str = None, incremental_mode: bool = False,
+        assignment_method: str = "greedy", weight_by_std_dev: bool = False, write_workers: int = 1, merged_output_path: str = None,
+        footprint_cell_size: float = None, propagate_mode: bool = False, point_clouds_path: str = './data/point_clouds', labels_path: str = './data/labels',
+        class_table_path: str = './class_table.csv', output_path: str = './output_pc', type_strs: list = None):
+    if incremental_mode and merged_output_path:
+        raise ValueError("The incremental mode updates one output per point cloud, it cannot be combined with a merged output.")
+    if propagate_mode and (incremental_mode or merged_output_path):
+        raise ValueError("The propagation mode writes one output per point cloud file, it cannot be combined with the incremental mode or a merged output.")
+    pc_catalog = catalog.Catalog.load(catalog_path) if catalog_path else None
+    point_clouds = data_loader.load_pc_files_from_directory(point_clouds_path, depth=dir_depth, scalar_field_name=scalar_field_name, workers=workers, catalog=pc_catalog,
+                                                            type_strs=type_strs)
     
-    label_csv_files = [f for f in os.listdir('./data/labels') if f.endswith('.csv')]
-    if not label_csv_files:
-        raise FileNotFoundError("No CSV file found in ./data/labels/")
-    label_csv_path = os.path.join('./data/labels', label_csv_files[0])
-    labels = data_loader.load_labels_from_csv(label_csv_path, './class_table.csv')
-    print(f"Loaded {len(labels)} labels and {len(point_clouds)} point cloud files.")
+    if os.path.isdir(labels_path):
+        label_csv_files = [f for f in os.listdir(labels_path) if f.endswith('.csv')]
+        if not label_csv_files:
+            raise FileNotFoundError(f"No CSV file found in {labels_path}")
+        label_csv_path = os.path.join(labels_path, label_csv_files[0])
+    else:
+        label_csv_path = labels_path
+    with instrumentation.stage("load_labels"):
+        labels = data_loader.load_labels_from_csv(label_csv_path, class_table_path)
+    instrumentation.count("labels", len(labels))
+    logger.info(f"Loaded {len(labels)} labels and {len(point_clouds)} point cloud files.")
+
+    if propagate_mode:
+        os.makedirs(output_path, exist_ok=True)
+        for pc, pc_output_path in zip(point_clouds, output_writer.assign_output_paths(point_clouds, output_path)):
+            propagation.propagate_labels_to_file(pc.file_path, pc_output_path, pc.type_str, labels, max_distance,
+                                                 chunk_size=chunk_size or propagation.DEFAULT_CHUNK_SIZE, workers=workers)
+        return
 
     if dir_depth == 0:
-        new_point_cloud = matcher.match_point_cloud_with_labels(point_clouds[0], labels, scalar_field_name, max_distance)
-        print("Matched point cloud with labels.")
-        new_point_cloud.store_pc("./output_pc")
+        with instrumentation.stage("match"):
+            new_point_cloud = matcher.match_point_cloud_with_labels(point_clouds[0], labels, scalar_field_name, max_distance, assignment_method, weight_by_std_dev,
+                                                                    footprint_cell_size)
+        logger.info("Matched point cloud with labels.")
+        new_point_clouds = [new_point_cloud]
     else:
-        new_point_clouds = matcher.match_point_clouds_with_labels(point_clouds, labels, max_distance)
-        print(f"Matched {len(new_point_clouds)} point clouds with labels.")
-        for new_pc in new_point_clouds:
-            new_pc.store_pc("./output_pc")
+        if footprint_cell_size is not None:
+            logger.warning("Footprints are only used to match the segments of a single point cloud (--dir_depth 0), point clouds are matched by their centers.")
+        with instrumentation.stage("match"):
+            new_point_clouds = matcher.match_point_clouds_with_labels(point_clouds, labels, max_distance, assignment_method, weight_by_std_dev)
+        logger.info(f"Matched {len(new_point_clouds)} point clouds with labels.")
+
+    if merged_output_path:
+        output_writer.write_merged(new_point_clouds, merged_output_path, chunk_size=chunk_size or output_writer.DEFAULT_CHUNK_SIZE)
+    elif incremental_mode:
+        incremental.store_point_clouds(new_point_clouds, output_path, chunk_size=chunk_size, workers=write_workers)
+    else:
+        output_writer.write_point_clouds(new_point_clouds, output_path, chunk_size=chunk_size, workers=write_workers)
+
+def serve(dir_depth: int, scalar_field_name: str, *, workers: int = 1, catalog_path: str = None, host: str = "127.0.0.1", port: int = 8765,
+          unix_socket_path: str = None, watch_interval: float = 5.0, point_clouds_path: str = './data/point_clouds', class_table_path: str = './class_table.csv',
+          output_path: str = './output_pc', type_strs: list = None):
+    """
+    Run the match service (see service.MatchService) on the point clouds of point_clouds_path until interrupted.
+
+    The service and asyncio are only imported here, so that one-shot runs do not pay for them at startup.
+    """
+    import asyncio
+    import service
+    match_service = service.MatchService(point_clouds_path, depth=dir_depth, scalar_field_name=scalar_field_name, class_table_path=class_table_path,
+                                         output_path=output_path, catalog_path=catalog_path, workers=workers, watch_interval=watch_interval, type_strs=type_strs)
+    try:
+        asyncio.run(match_service.serve_forever(host, port, unix_socket_path))
+    except KeyboardInterrupt:
+        logger.info("Match service stopped.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process point clouds and labels.")
     parser.add_argument('--dir_depth', type=int, default=2, help='Depth of the directory to scan for LAS files.\n If set to 0, we suppose only one file is provided, and contains a scalar field that distinguishes the different segments\nIf set to 1, all las files are supposed to be in the same directory.\nIf set to 2, all las files are supposed to be in subdirectories of the given directory.')
     parser.add_argument('--scalar_field_name', type=str, default=None, help='Name of the scalar field that distinguishes the different segments in the point cloud (if any). Default is None.')
     parser.add_argument('--max_distance', type=float, default=2.0, help='Maximum distance for matching point clouds to labels (in meters). Default is 2.0.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to read and localise the point cloud files, or the chunks of the single file with --dir_depth 0 and --scalar_field_name. Default is 1 (no process pool).')
+    parser.add_argument('--chunk_size', type=int, default=None, help='If set, LAS files are relabelled and written by streaming this many points at a time instead of loading them entirely. Default is None (files are loaded).')
+    parser.add_argument('--log_level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='Minimal level of the logged messages. DEBUG also logs every skipped label. Default is INFO.')
+    parser.add_argument('--log_format', type=str, default='text', choices=['text', 'json'], help='Format of the logs: plain text, or one JSON object per line. Default is text.')
+    parser.add_argument('--report', type=str, default=None, help='If set, path of the JSON run report (stage timings, memory peaks, throughput and match statistics). Default is None (no report).')
+    parser.add_argument('--trace_memory', action='store_true', help='Measure the peak memory allocated in each stage with tracemalloc, which slows down the run. Otherwise only the peak resident memory of the whole process, and how much each stage raised it, are reported.')
+    parser.add_argument('--catalog', type=str, default=None, help='If set, path of a catalog of the point cloud extents, written on the first run: later runs only read the files that are new or changed since. Default is None (all files are read).')
+    parser.add_argument('--incremental', action='store_true', help='Only write the outputs whose label assignments changed since the previous incremental run (recorded in the .manifest.json of --output_dir). Unchanged outputs are left untouched, outputs that lost all their labels are removed.')
+    parser.add_argument('--assignment', type=str, default='greedy', choices=['greedy', 'optimal'], help='"greedy": labels sorted by std-dev each take their nearest point cloud, a point cloud can be claimed by several labels (the last one wins). "optimal": one-to-one assignment matching as many labels as possible at a minimum total distance. Default is greedy.')
+    parser.add_argument('--weight_by_std_dev', action='store_true', help='With the optimal assignment, divide the distance of each label by its std-dev norm.')
+    parser.add_argument('--write_workers', type=int, default=1, help='Number of threads writing the output files at once. Fewer point clouds are loaded at once if they would exceed 1 GiB. Default is 1.')
+    parser.add_argument('--merged_output', type=str, default=None, help='If set, path of a single .las or .ply file receiving the labelled points of all the point clouds, with a classification and a segment id per point, instead of one file per point cloud in --output_dir. Default is None.')
+    parser.add_argument('--footprint_cell_size', type=float, default=None, help='With --dir_depth 0, match a label with the segment whose footprint (a 2D occupancy grid with cells of this size, in meters) contains it, and only fall back to the distance to the segment centers for labels outside all the footprints. Default is None (segment centers only).')
+    parser.add_argument('--propagate', action='store_true', help='Instead of matching point clouds or segments with labels, give each point of every point cloud the class of the nearest label within --max_distance (in XY), or -1 (0 in LAS files) if there is none. Labels whose name is missing from the class table are dropped. Points are classified --chunk_size at a time (default 1000000) by --workers processes.')
+    parser.add_argument('--serve', action='store_true', help='Instead of matching the labels of --labels once, index the point clouds once and serve match requests over HTTP (see src/service.py) until interrupted.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='With --serve, the address the service listens on. Default is 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8765, help='With --serve, the port the service listens on. Default is 8765.')
+    parser.add_argument('--socket', type=str, default=None, help='With --serve, the path of a Unix socket the service also listens on. Default is None.')
+    parser.add_argument('--point_clouds_dir', type=str, default='./data/point_clouds', help='Directory of the point cloud files. Default is ./data/point_clouds.')
+    parser.add_argument('--labels', type=str, default='./data/labels', help='Labels CSV file, or directory whose first CSV file holds the labels. Default is ./data/labels.')
+    parser.add_argument('--class_table', type=str, default='./class_table.csv', help='Path to the class table giving the index of each label name. Default is ./class_table.csv.')
+    parser.add_argument('--output_dir', type=str, default='./output_pc', help='Directory of the output point clouds (and of the incremental manifest). Default is ./output_pc.')
+    parser.add_argument('--formats', nargs='+', choices=formats.get_type_strs(), default=None, help='Only read the point cloud files of these formats. The reader of a format is only imported when a file of that format is read. Default is all the formats.')
+    parser.add_argument('--watch_interval', type=float, default=5.0, help='With --serve, how often (in seconds) the point cloud files are checked for changes, which reloads the index. 0 disables it. Default is 5.')
     args = parser.parse_args()
-    dir_depth = args.dir_depth
-    scalar_field_name = args.scalar_field_name
-    max_distance = args.max_distance
-    main(dir_depth, max_distance, scalar_field_name)
\ No newline at end of file
+    instrumentation.configure_logging(args.log_level, json_format=args.log_format == 'json')
+    if args.serve:
+        serve(args.dir_depth, args.scalar_field_name, workers=args.workers, catalog_path=args.catalog, host=args.host, port=args.port,
+              unix_socket_path=args.socket, watch_interval=args.watch_interval, point_clouds_path=args.point_clouds_dir,
+              class_table_path=args.class_table, output_path=args.output_dir, type_strs=args.formats)
+    else:
+        main(args.dir_depth, args.max_distance, args.scalar_field_name, workers=args.workers, chunk_size=args.chunk_size, report_path=args.report,
+             trace_memory=args.trace_memory, catalog_path=args.catalog, incremental_mode=args.incremental, assignment_method=args.assignment,
+             weight_by_std_dev=args.weight_by_std_dev, write_workers=args.write_workers, merged_output_path=args.merged_output,
+             footprint_cell_size=args.footprint_cell_size, propagate_mode=args.propagate, point_clouds_path=args.point_clouds_dir,
+             labels_path=args.labels, class_table_path=args.class_table, output_path=args.output_dir, type_strs=args.formats)
\ No newline at end of file
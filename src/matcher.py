@@ -1,53 +1,181 @@
 """
 This module contains the functions that match point clouds with labels.
 """
+import logging
+
 import numpy as np
 
-def match_point_clouds_with_labels(point_clouds, labels, max_distance=2.0):
-    # Sort labels by their standard deviation norm (ascending)
-    sorted_labels = sorted(labels, key=lambda lbl: lbl.get_std_dev_norm())
+import assignment, instrumentation, label, spatial_index
+
+ASSIGNMENT_METHODS = ("greedy", "optimal")
+
+logger = logging.getLogger(__name__)
+
+def match_point_clouds_with_labels(point_clouds, labels, max_distance=2.0, assignment_method="greedy", weight_by_std_dev=False):
+    """
+    Match point clouds with labels, and apply to each matched point cloud the class of its label.
+
+    Parameters:
+    point_clouds (list): The point clouds to label.
+    labels (label.LabelSet or list): The labels.
+    max_distance (float): The maximum distance between a label and the center of its point cloud, in meters.
+    assignment_method (str): "greedy" (default): labels sorted by std-dev norm each take their nearest point cloud,
+                             a later label overwriting the label of a point cloud already taken.
+                             "optimal": each point cloud gets at most one label and each label at most one point cloud,
+                             matching as many labels as possible at a minimum total distance (see assignment.assign).
+    weight_by_std_dev (bool): With the optimal assignment, weight the distance of each label by its std-dev norm.
+
+    Returns:
+    list: The matched point clouds (with the greedy assignment, a point cloud appears once per label it got).
+    """
+    _check_assignment_method(assignment_method)
+    labels = label.LabelSet.from_labels(labels)
     matched_point_clouds = []
+    distances = np.full(len(labels), np.inf)
+
+    if assignment_method == "optimal":
+        if point_clouds:
+            pc_locations = np.array([pc.localisation for pc in point_clouds], dtype=np.float64)
+            label_ids, pc_ids, pair_distances = assignment.assign(pc_locations, labels.get_2d_locations(), max_distance,
+                                                                  labels.get_std_dev_norms() if weight_by_std_dev else None)
+            distances[label_ids] = pair_distances
+            with instrumentation.stage("label"):
+                for label_index, pc_index in zip(label_ids, pc_ids):
+                    lbl = labels[label_index]
+                    point_clouds[pc_index].label = lbl
+                    point_clouds[pc_index].apply_label(lbl)
+                    matched_point_clouds.append(point_clouds[pc_index])
+        _log_matches(distances, len(matched_point_clouds), max_distance, "point cloud")
+        return matched_point_clouds
 
+    # Sort labels by their standard deviation norm (ascending)
+    sorted_order = labels.get_sorted_order()
     if len(point_clouds) > 1:
-        for lbl in sorted_labels:
-            best_pc = None
-            best_distance = float('inf')
-            for pc in point_clouds:
-                distance = np.linalg.norm(np.array(pc.localisation) - np.array(lbl.get_2d_location()))
-                if distance < best_distance:
-                    best_distance = distance
-                    best_pc = pc
-            if best_distance > max_distance:
-                print(f"No suitable point cloud found for label at {lbl.geolocation} (best distance: {best_distance:.2f}m but max distance is {max_distance}m). Skipping this label.")
-                continue
-            best_pc.label = lbl
-            best_pc.apply_label(lbl)
-            matched_point_clouds.append(best_pc)
+        pc_locations = np.array([pc.localisation for pc in point_clouds], dtype=np.float64)
+        label_locations = labels.get_2d_locations()[sorted_order]
+        nearest, distances = spatial_index.nearest_neighbours(pc_locations, label_locations, max_distance)
+        log_skipped = logger.isEnabledFor(logging.DEBUG)
+        with instrumentation.stage("label"):
+            for label_index, pc_index in zip(sorted_order, nearest):
+                if pc_index < 0:
+                    if log_skipped:
+                        logger.debug(f"No suitable point cloud found for label at {labels[label_index].geolocation} (no point cloud within max distance {max_distance}m). Skipping this label.")
+                    continue
+                lbl = labels[label_index]
+                best_pc = point_clouds[pc_index]
+                best_pc.label = lbl
+                best_pc.apply_label(lbl)
+                matched_point_clouds.append(best_pc)
+    _log_matches(distances, len({id(pc) for pc in matched_point_clouds}), max_distance, "point cloud")
     return matched_point_clouds
 
 
-def match_point_cloud_with_labels(point_cloud, labels, discriminative_scalar_field_name, max_distance=2.0):
+def match_point_cloud_with_labels(point_cloud, labels, discriminative_scalar_field_name, max_distance=2.0, assignment_method="greedy", weight_by_std_dev=False,
+                                  footprint_cell_size=None):
+    """
+    Match the segments of a point cloud with labels, and apply to the points of each matched segment the class of its label.
+
+    Parameters:
+    point_cloud (point_cloud.PointCloud): The point cloud, with its segments localised.
+    labels (label.LabelSet or list): The labels.
+    discriminative_scalar_field_name (str): The scalar field that discriminates the segments.
+    max_distance (float): The maximum distance between a label and the center of its segment, in meters.
+    assignment_method (str): "greedy" (default): each label takes its nearest segment, the last label of a segment wins.
+                             "optimal": one-to-one assignment of minimum total distance (see match_point_clouds_with_labels).
+    weight_by_std_dev (bool): With the optimal assignment, weight the distance of each label by its std-dev norm.
+    footprint_cell_size (float): If set, a label inside the footprint of a segment (see point_cloud.PointCloud.get_footprints,
+                                 rasterized with cells of this size) is matched with it whatever its distance to the center
+                                 of the segment. Only the other labels are matched by distance to the segment centers.
+
+    Returns:
+    point_cloud.PointCloud: The labelled point cloud.
+    """
+    _check_assignment_method(assignment_method)
+    labels = label.LabelSet.from_labels(labels)
     matched_scalar_field_values = {}
-    for lbl in labels:
-        if point_cloud.n_clusters > 1 and discriminative_scalar_field_name is not None:
-            best_sfv = None
-            best_distance = float('inf')
-            for sfv, loc in point_cloud.localisations.items():
-                distance = np.linalg.norm(np.array(loc) - np.array(lbl.get_2d_location()))
-                if distance < best_distance:
-                    best_distance = distance
-                    best_sfv = sfv
-            if best_distance > max_distance:
-                print(f"No suitable segment found in point cloud for label at {lbl.geolocation} (best distance: {best_distance:.2f}m but max distance is {max_distance}m). Skipping this label.")
-                continue
-            matched_scalar_field_values[best_sfv] = lbl
+    label_locations = labels.get_2d_locations()
+    if point_cloud.n_clusters > 1 and discriminative_scalar_field_name is not None:
+        scalar_field_values = list(point_cloud.localisations.keys())
+        segment_locations = np.array(list(point_cloud.localisations.values()), dtype=np.float64)
+        if footprint_cell_size is not None:
+            inside = _get_enclosing_segments(point_cloud, scalar_field_values, label_locations, footprint_cell_size)
+        else:
+            inside = np.full(len(labels), -1, dtype=np.int64)
+        nearest = np.full(len(labels), -1, dtype=np.int64)
+        distances = np.full(len(labels), np.inf)
+        if assignment_method == "optimal":
+            # a segment goes to the label inside its footprint nearest to its center, the other labels are assigned by distance
+            hits = np.flatnonzero(inside >= 0)
+            hit_distances = np.linalg.norm(label_locations[hits] - segment_locations[inside[hits]], axis=1)
+            order = np.lexsort((hit_distances, inside[hits]))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = inside[hits][order[1:]] != inside[hits][order[:-1]]
+            winners = hits[order[first]]
+            nearest[winners] = inside[winners]
+            distances[winners] = hit_distances[order[first]]
+            remaining_labels = np.setdiff1d(np.arange(len(labels)), winners)
+            remaining_segments = np.setdiff1d(np.arange(len(segment_locations)), inside[winners])
+            std_devs = labels.get_std_dev_norms()[remaining_labels] if weight_by_std_dev else None
+            label_ids, segment_ids, pair_distances = assignment.assign(segment_locations[remaining_segments], label_locations[remaining_labels],
+                                                                       max_distance, std_devs)
+            nearest[remaining_labels[label_ids]] = remaining_segments[segment_ids]
+            distances[remaining_labels[label_ids]] = pair_distances
         else:
-            distance = np.linalg.norm(np.array(point_cloud.localisation) - np.array(lbl.get_2d_location()))
-            if distance > max_distance:
-                print(f"No suitable point cloud found for label at {lbl.geolocation} (distance: {distance:.2f}m but max distance is {max_distance}m). Skipping this label.")
-                continue
-    
-    for sfv, lbl in matched_scalar_field_values.items():
-        print(f"Applying label {lbl.label} to segment with scalar field value {sfv}.")
-        point_cloud.apply_label_to_scalar_field(sfv, lbl)
-    return point_cloud
\ No newline at end of file
+            outside = np.flatnonzero(inside < 0)
+            nearest[outside], distances[outside] = spatial_index.nearest_neighbours(segment_locations, label_locations[outside], max_distance)
+            hits = np.flatnonzero(inside >= 0)
+            nearest[hits] = inside[hits]
+            distances[hits] = np.linalg.norm(label_locations[hits] - segment_locations[inside[hits]], axis=1)
+        if logger.isEnabledFor(logging.DEBUG):
+            for label_index in np.flatnonzero(nearest < 0):
+                logger.debug(f"No suitable segment found in point cloud for label at {labels[label_index].geolocation} (no segment within max distance {max_distance}m). Skipping this label.")
+        for label_index in np.flatnonzero(nearest >= 0):
+            matched_scalar_field_values[scalar_field_values[nearest[label_index]]] = labels[label_index]
+    else:
+        distances = np.linalg.norm(label_locations - np.asarray(point_cloud.localisation, dtype=np.float64), axis=1)
+        if logger.isEnabledFor(logging.DEBUG):
+            for label_index in np.flatnonzero(distances > max_distance):
+                logger.debug(f"No suitable point cloud found for label at {labels[label_index].geolocation} (distance: {distances[label_index]:.2f}m but max distance is {max_distance}m). Skipping this label.")
+        # no label is applied to a point cloud without segments: all the labels count as skipped
+        distances = np.full(len(labels), np.inf)
+    _log_matches(distances, len(matched_scalar_field_values), max_distance, "segment")
+
+    if matched_scalar_field_values:
+        logger.info(f"Applying labels to {len(matched_scalar_field_values)} segments.")
+        with instrumentation.stage("label"):
+            point_cloud.apply_labels(matched_scalar_field_values)
+    return point_cloud
+
+
+def _get_enclosing_segments(point_cloud, scalar_field_values, label_locations, cell_size: float):
+    """
+    Find the segment whose footprint contains each label.
+
+    Returns:
+    np.ndarray: The index (into scalar_field_values) of the segment of each label, -1 for labels outside
+                all the footprints or inside the footprint of a segment that is not localised (e.g. the ground).
+    """
+    with instrumentation.stage("localise"):
+        footprints = point_cloud.get_footprints(cell_size)
+    positions = {value: index for index, value in enumerate(scalar_field_values)}
+    segment_indices = np.array([positions.get(value, -1) for value in footprints.values.tolist()] + [-1], dtype=np.int64)
+    inside = segment_indices[footprints.lookup(label_locations[:, 0], label_locations[:, 1])]
+    logger.info(f"{np.count_nonzero(inside >= 0)} of {len(inside)} labels are inside the footprint of a segment.")
+    return inside
+
+
+def _check_assignment_method(assignment_method: str):
+    if assignment_method not in ASSIGNMENT_METHODS:
+        raise ValueError(f"Unknown assignment method '{assignment_method}', expected one of {ASSIGNMENT_METHODS}.")
+
+
+def _log_matches(distances, n_targets: int, max_distance: float, target_name: str):
+    """
+    Log a summary of a matching, instead of one message per skipped label, and record it in the run report.
+    """
+    n_skipped = int(np.count_nonzero(~np.isfinite(distances)))
+    if n_skipped:
+        logger.info(f"Skipped {n_skipped} of {len(distances)} labels with no {target_name} within max distance {max_distance}m (see the DEBUG messages).")
+    logger.info(f"Matched {len(distances) - n_skipped} labels with {n_targets} {target_name}s.",
+                extra={"n_labels": len(distances), "n_skipped": n_skipped, "n_targets": n_targets})
+    instrumentation.record_matches(distances, n_targets, max_distance)
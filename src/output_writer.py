@@ -0,0 +1,321 @@
+"""
+This module provides the output stage of the pipeline: labelled point clouds are written concurrently, through a
+bounded thread pool, under collision-free file names, or streamed together into one merged file.
+"""
+import concurrent.futures
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+
+import formats, instrumentation, segments, utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+# the estimated size of the point clouds being written at once, above which no new write is started
+DEFAULT_MAX_PENDING_BYTES = 1 << 30
+SEGMENT_ID_FIELDS = {"LAS": "SegmentId", "PLY": "scalar_SegmentId"}
+MERGED_FORMATS = {".las": "LAS", ".ply": "PLY"}
+# the offset of the coordinates of a merged LAS file is rounded to this many units of its scale
+LAS_OFFSET_ROUNDING = 1_000_000
+# the scale of the coordinates of a merged LAS file when none of the point clouds is a LAS file (PLY coordinates in meters)
+LAS_SCALE = 0.001
+
+def assign_output_paths(point_clouds, folder_path: str) -> list:
+    """
+    Get a distinct output path for each point cloud.
+
+    Point clouds are named after their localisation (see point_cloud.PointCloud.get_output_path), which can be
+    the same for two point clouds: all the point clouds sharing a name then get a suffix made of the hash of their
+    source file path, so that no output overwrites another and names do not depend on the order of the point clouds.
+
+    Returns:
+    list: The output path of each point cloud, in the order of point_clouds.
+    """
+    paths = [pc.get_output_path(folder_path) for pc in point_clouds]
+    n_uses = {}
+    for path in paths:
+        n_uses[path] = n_uses.get(path, 0) + 1
+    unique_paths = []
+    n_unnamed = {}
+    for pc, path in zip(point_clouds, paths):
+        if n_uses[path] > 1:
+            stem, extension = os.path.splitext(path)
+            if pc.file_path is not None:
+                suffix = hashlib.sha1(os.path.abspath(pc.file_path).encode("utf-8")).hexdigest()[:8]
+            else:
+                # in-memory point clouds have no source: they are numbered in the order they are given
+                suffix = str(n_unnamed.get(path, 0))
+                n_unnamed[path] = n_unnamed.get(path, 0) + 1
+            path = f"{stem}_{suffix}{extension}"
+        unique_paths.append(path)
+    if len(set(unique_paths)) != len(unique_paths):
+        raise ValueError("Several point clouds are read from the same file: they would be written to the same output.")
+    return unique_paths
+
+def estimate_write_bytes(point_cloud) -> int:
+    """
+    Estimate the memory taken by the write of a point cloud: the size of its file if it has to be loaded for
+    the write, nothing if its points are in memory already.
+    """
+    if point_cloud.pc is not None or point_cloud.file_path is None:
+        return 0
+    try:
+        return os.path.getsize(point_cloud.file_path)
+    except OSError:
+        return 0
+
+class _MemoryBudget:
+    """
+    A counter of the bytes taken by the writes in progress: a write waits until enough of the others finished.
+    A write larger than the whole budget is started alone, so that it cannot wait forever.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, n_bytes: int):
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_use == 0 or self.in_use + n_bytes <= self.max_bytes)
+            self.in_use += n_bytes
+
+    def release(self, n_bytes: int):
+        with self._condition:
+            self.in_use -= n_bytes
+            self._condition.notify_all()
+
+def write_point_clouds(point_clouds, folder_path: str, chunk_size: int = None, workers: int = 1,
+                       max_pending_bytes: int = DEFAULT_MAX_PENDING_BYTES, output_paths: list = None) -> list:
+    """
+    Write labelled point clouds in a folder, one file each, with up to `workers` writes running at once.
+
+    The folder is created once, and the writes are started in order by a bounded thread pool: a write only starts
+    once the estimated size of the point clouds being written (see estimate_write_bytes) leaves room for it within
+    max_pending_bytes, so that at most a few point clouds are loaded at once whatever the number of workers.
+    The first error of a write is raised once the writes already started are finished.
+
+    Parameters:
+    point_clouds (list): The labelled point clouds (a point cloud listed several times is written once).
+    folder_path (str): The output folder.
+    chunk_size (int): The chunk size given to store_pc.
+    workers (int): The maximum number of concurrent writes.
+    max_pending_bytes (int): The memory budget of the writes in progress, in bytes.
+    output_paths (list): The output path of each (unique) point cloud, by default given by assign_output_paths.
+
+    Returns:
+    list: The path of each written file, in the order of the unique point clouds.
+    """
+    unique_point_clouds = list({id(pc): pc for pc in point_clouds}.values())
+    if output_paths is None:
+        output_paths = assign_output_paths(unique_point_clouds, folder_path)
+    os.makedirs(folder_path, exist_ok=True)
+    if workers <= 1:
+        for point_cloud, output_path in zip(unique_point_clouds, output_paths):
+            point_cloud.store_pc(folder_path, chunk_size=chunk_size, output_path=output_path)
+        return output_paths
+
+    budget = _MemoryBudget(max_pending_bytes)
+    failed = threading.Event()
+
+    def write(point_cloud, output_path, n_bytes):
+        try:
+            point_cloud.store_pc(folder_path, chunk_size=chunk_size, output_path=output_path)
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            budget.release(n_bytes)
+
+    futures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for point_cloud, output_path in zip(unique_point_clouds, output_paths):
+            n_bytes = estimate_write_bytes(point_cloud)
+            # back-pressure: wait for room in the memory budget before queuing the next write
+            budget.acquire(n_bytes)
+            if failed.is_set():
+                budget.release(n_bytes)
+                break
+            futures.append(executor.submit(write, point_cloud, output_path, n_bytes))
+    for future in futures:
+        future.result()
+    return output_paths
+
+def _iter_labelled_points(point_cloud, segment_id, chunk_size: int):
+    """
+    Iterate over the labelled points of a point cloud, chunk by chunk.
+
+    A point cloud labelled as a whole is streamed from its file if it is not in memory, with its label as
+    classification and segment_id as segment id. Of a segmented point cloud, only the points of the labelled
+    segments are kept, with their scalar field value as segment id.
+
+    Yields:
+    tuple: The x, y, z coordinates, classifications and segment ids of a chunk of points.
+    """
+    if point_cloud.segment_labels:
+        point_cloud.load()
+        table = segments.build_lookup_table({sfv: lbl.label for sfv, lbl in point_cloud.segment_labels.items()})
+        scalar_field = point_cloud.get_scalar_field()
+        xs, ys, zs = _get_coordinates(point_cloud.pc, point_cloud.type_str)
+        for start in range(0, len(scalar_field), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            values = np.asarray(scalar_field[chunk])
+            mapped, classifications = segments.lookup(values, table)
+            yield (np.asarray(xs[chunk])[mapped], np.asarray(ys[chunk])[mapped], np.asarray(zs[chunk])[mapped],
+                   classifications, values[mapped])
+        return
+    if point_cloud.label is None:
+        return
+    classification = point_cloud.label.label
+    if point_cloud.pc is None and point_cloud.type_str == "LAS":
+        for points in formats.get_backend("LAS").iter_chunks(point_cloud.file_path, chunk_size):
+            n = len(points)
+            yield np.asarray(points.x), np.asarray(points.y), np.asarray(points.z), np.full(n, classification), np.full(n, segment_id)
+        return
+    if point_cloud.pc is None:
+        ply_data = formats.get_backend("PLY").read(point_cloud.file_path, mmap='r')
+    else:
+        ply_data = point_cloud.pc
+    xs, ys, zs = _get_coordinates(ply_data, point_cloud.type_str)
+    for start in range(0, len(xs), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        n = len(xs[chunk])
+        yield np.asarray(xs[chunk]), np.asarray(ys[chunk]), np.asarray(zs[chunk]), np.full(n, classification), np.full(n, segment_id)
+
+def _get_coordinates(pc, type_str: str):
+    if type_str == "PLY":
+        vertex = pc['vertex'].data
+        return vertex['x'], vertex['y'], vertex['z']
+    return pc.x, pc.y, pc.z
+
+def _count_labelled_points(point_cloud) -> int:
+    """
+    Count the points _iter_labelled_points yields, from the segment extents or the header of the point cloud.
+    """
+    if point_cloud.segment_labels:
+        if point_cloud.segment_extents is None:
+            point_cloud.load()
+            point_cloud.segment_extents = point_cloud.get_segment_extents()
+        extents = point_cloud.segment_extents
+        return int(extents.counts[np.isin(extents.values, list(point_cloud.segment_labels))].sum())
+    if point_cloud.label is None:
+        return 0
+    if point_cloud.pc is not None:
+        return len(point_cloud.pc.points) if point_cloud.type_str == "LAS" else point_cloud.pc['vertex'].count
+    return formats.get_backend(point_cloud.type_str).get_point_count(point_cloud.file_path)
+
+class _PlySink:
+    """
+    Write the points of a merged binary PLY file, whose number of vertices is known in advance.
+    """
+
+    def __init__(self, file_path: str, n_points: int):
+        self.dtype = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                               ('scalar_Classification', '<f4'), (SEGMENT_ID_FIELDS["PLY"], '<f8')])
+        self.n_points = n_points
+        self.n_written = 0
+        self.file = open(file_path, 'wb')
+        header = ["ply", "format binary_little_endian 1.0", f"element vertex {n_points}"]
+        header += [f"property {'double' if self.dtype[name] == np.float64 else 'float'} {name}" for name in self.dtype.names]
+        header.append("end_header")
+        self.file.write(("\n".join(header) + "\n").encode("ascii"))
+
+    def write(self, xs, ys, zs, classifications, segment_ids):
+        records = np.empty(len(xs), dtype=self.dtype)
+        records['x'], records['y'], records['z'] = xs, ys, zs
+        records['scalar_Classification'] = classifications
+        records[SEGMENT_ID_FIELDS["PLY"]] = segment_ids
+        records.tofile(self.file)
+        self.n_written += len(records)
+
+    def close(self):
+        self.file.close()
+        if self.n_written != self.n_points:
+            raise ValueError(f"Wrote {self.n_written} vertices instead of the {self.n_points} announced in the PLY header.")
+
+def _get_las_scales_and_offsets(point_clouds):
+    """
+    Get the scales and offsets of the coordinates of a merged LAS file.
+
+    Each axis takes the finest scale of the LAS point clouds, so that no input loses precision, and LAS_SCALE if
+    there are none. The x/y offsets are the min corner of the point clouds, rounded to LAS_OFFSET_ROUNDING units.
+
+    Raises:
+    ValueError: If the coordinates are in WGS84 (degrees) and some point clouds are not LAS files, which give no
+                scale fine enough for them, or if the coordinates do not fit in the 32-bit integers of LAS.
+    """
+    # the point clouds rebuilt from a catalog have no header: it is read back from their file
+    las_scales = [np.asarray((pc.header if pc.header is not None else formats.get_backend("LAS").read_header(pc.file_path)).scales,
+                             dtype=np.float64) for pc in point_clouds if pc.type_str == "LAS"]
+    bboxes = np.array([pc.bbox for pc in point_clouds if pc.bbox is not None], dtype=np.float64).reshape(-1, 4)
+    mins = bboxes[:, :2].min(axis=0) if len(bboxes) else np.zeros(2)
+    maxs = bboxes[:, 2:].max(axis=0) if len(bboxes) else np.zeros(2)
+    if len(las_scales) < len(point_clouds) and utils.is_wgs84([mins[0], maxs[0]], [mins[1], maxs[1]]):
+        raise ValueError("Cannot write a merged LAS file of point clouds in WGS84 (degrees) that are not all LAS files, "
+                         f"as their coordinates would be rounded to {LAS_SCALE} degrees: write a .ply merged output instead.")
+    scales = np.min(las_scales, axis=0) if las_scales else np.full(3, LAS_SCALE)
+    rounding = scales[:2] * LAS_OFFSET_ROUNDING
+    offsets = np.floor(mins / rounding) * rounding
+    if np.any((maxs - offsets) / scales[:2] > np.iinfo(np.int32).max):
+        raise ValueError(f"The point clouds span too large an extent ({mins} to {maxs}) for a merged LAS file with scales {scales[:2]}: "
+                         "write a .ply merged output instead.")
+    return scales, list(offsets) + [0.0]
+
+def write_merged(point_clouds, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Stream the labelled points of several point clouds into one LAS or PLY file (chosen by the extension of
+    output_path), with a classification and a segment id per point, instead of writing one file per point cloud.
+
+    Point clouds labelled as a whole are numbered from 1 in the order they are given, which is their segment id;
+    segmented point clouds keep their scalar field value as segment id and only the points of their labelled
+    segments are written. Only the coordinates, classification and segment id of the points are kept.
+    A CSV file next to the output (output_path + ".segments.csv") lists the source file and label of each segment.
+
+    Parameters:
+    point_clouds (list): The labelled point clouds (a point cloud listed several times is written once).
+    output_path (str): The path of the merged file, ending with .las or .ply.
+    chunk_size (int): The maximum number of points read from a point cloud at once.
+
+    Returns:
+    int: The number of points written.
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in MERGED_FORMATS:
+        raise ValueError(f"Unsupported merged output format: '{extension}' (expected one of {', '.join(MERGED_FORMATS)}).")
+    unique_point_clouds = list({id(pc): pc for pc in point_clouds}.values())
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with instrumentation.stage("write"):
+        if MERGED_FORMATS[extension] == "PLY":
+            sink = _PlySink(output_path, sum(_count_labelled_points(pc) for pc in unique_point_clouds))
+        else:
+            scales, offsets = _get_las_scales_and_offsets(unique_point_clouds)
+            sink = formats.get_backend("LAS").SegmentedWriter(output_path, offsets, scales, SEGMENT_ID_FIELDS["LAS"])
+        n_points = 0
+        rows = []
+        try:
+            for segment_id, point_cloud in enumerate(unique_point_clouds, start=1):
+                for chunk in _iter_labelled_points(point_cloud, segment_id, chunk_size):
+                    sink.write(*chunk)
+                    n_points += len(chunk[0])
+                if point_cloud.segment_labels:
+                    rows += [(value, point_cloud.file_path, lbl) for value, lbl in sorted(point_cloud.segment_labels.items())]
+                elif point_cloud.label is not None:
+                    rows.append((segment_id, point_cloud.file_path, point_cloud.label))
+        finally:
+            sink.close()
+
+    with open(output_path + ".segments.csv", 'w') as file:
+        file.write("segment_id;source_file;label;longitude;latitude;altitude\n")
+        for segment_id, file_path, lbl in rows:
+            longitude, latitude, altitude = lbl.geolocation
+            file.write(f"{segment_id};{file_path};{lbl.label};{longitude};{latitude};{altitude}\n")
+    instrumentation.count("points_written", n_points)
+    logger.info(f"Wrote {n_points} points of {len(rows)} labelled segments to {output_path}.")
+    return n_points
@@ -0,0 +1,162 @@
+"""
+This module provides the chunk-parallel processing of a single large point cloud file: worker processes read chunks
+of the file (memory-mapped for binary PLY, by seeking for LAS), compute partial per-segment extents that are reduced
+with SegmentExtents.merge, and relabel their chunks into a classification column shared through a memory-mapped file.
+"""
+import collections
+import concurrent.futures
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+import formats, segments
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# the file the chunks of a worker process are read from, set once per process by _init_worker
+worker_state = {}
+
+def supports_chunks(file_path: str, type_str: str) -> bool:
+    """
+    Tell whether the chunks of a file can be read independently: LAS files, and binary PLY files without list properties.
+    """
+    return formats.get_backend(type_str).supports_chunks(file_path)
+
+def _init_worker(file_path: str, type_str: str, scalar_field_name: str):
+    worker_state.update(file_path=file_path, type_str=type_str, scalar_field_name=scalar_field_name)
+    if type_str == "PLY":
+        # memory-mapped once per process: a chunk only pages in its own vertices
+        worker_state["vertex"] = formats.get_backend("PLY").open_vertices(file_path)
+
+def read_range(start: int, stop: int):
+    """
+    Get the x, y, z coordinates, the scalar field values (None without a scalar field) and the points [start, stop)
+    of the file of the worker.
+    """
+    state = worker_state
+    name = state["scalar_field_name"]
+    if state["type_str"] == "LAS":
+        points = formats.get_backend("LAS").read_range(state["file_path"], start, stop)
+        if name is None:
+            return points.x, points.y, points.z, None, points
+        if name not in points.point_format.dimension_names:
+            raise ValueError(f"Dimension '{name}' not found in LAS point cloud.")
+        return points.x, points.y, points.z, np.asarray(points[name]), points
+    points = state["vertex"][start:stop]
+    if name is None:
+        return points['x'], points['y'], points['z'], None, points
+    if name not in points.dtype.names:
+        raise ValueError(f"Scalar field '{name}' not found in PLY point cloud.")
+    return points['x'], points['y'], points['z'], points[name], points
+
+def _extents_range(start: int, stop: int):
+    xs, ys, zs, values, _ = read_range(start, stop)
+    return segments.SegmentExtents.compute(values, xs, ys, zs)
+
+def iter_ranges(function, arguments: tuple, file_path: str, type_str: str, scalar_field_name: str, chunk_size: int, workers: int):
+    """
+    Iterate over the results of function(start, stop, *arguments) on consecutive chunks of chunk_size points of a file, in order.
+
+    function reads its chunk with read_range (scalar_field_name may be None if it needs no scalar field), and can keep
+    per-process data in worker_state, which lasts for the whole iteration. With several workers, chunks are handled
+    by a process pool reading them from the file, and at most 2 * workers chunks are in flight.
+    """
+    n_points = formats.get_backend(type_str).get_point_count(file_path)
+    ranges = [(start, min(start + chunk_size, n_points)) for start in range(0, n_points, chunk_size)]
+    init_arguments = (file_path, type_str, scalar_field_name)
+    if workers <= 1 or len(ranges) <= 1:
+        _init_worker(*init_arguments)
+        try:
+            for start, stop in ranges:
+                yield function(start, stop, *arguments)
+        finally:
+            worker_state.clear()
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_arguments) as executor:
+        pending = collections.deque()
+        for start, stop in ranges:
+            pending.append(executor.submit(function, start, stop, *arguments))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def compute_segment_extents(file_path: str, type_str: str, scalar_field_name: str, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Compute the extents of all the segments of a file, with each chunk of points handled by a worker process.
+
+    Parameters:
+    file_path (str): The path to the point cloud file (see supports_chunks).
+    type_str (str): The format of the file, "LAS" or "PLY".
+    scalar_field_name (str): The scalar field that discriminates the segments.
+    workers (int): The number of processes.
+    chunk_size (int): The number of points per chunk.
+
+    Returns:
+    segments.SegmentExtents: The extents of the segments, with x, y, z as axes.
+    """
+    parts = []
+    for part in iter_ranges(_extents_range, (), file_path, type_str, scalar_field_name, chunk_size, workers):
+        parts.append(part)
+        if len(parts) > max(workers, 1):
+            parts = [segments.SegmentExtents.merge(parts)]
+    return segments.SegmentExtents.merge(parts)
+
+def _classify_range(start: int, stop: int, table, column_path: str, dtype: str, n_points: int, initialised: bool):
+    """
+    Write the classification of the points [start, stop) of the file of the worker into their part of the shared column.
+    """
+    _, _, _, values, points = read_range(start, stop)
+    column = np.memmap(column_path, dtype=dtype, mode='r+', shape=(n_points,))
+    chunk = column[start:stop]
+    if not initialised:
+        if worker_state["type_str"] == "LAS":
+            chunk[:] = np.asarray(points.classification)
+        elif 'scalar_Classification' in points.dtype.names:
+            chunk[:] = points['scalar_Classification']
+        else:
+            chunk[:] = -1
+    mapped, classifications = segments.lookup(values, table)
+    chunk[mapped] = classifications
+    column.flush()
+
+def compute_classification(file_path: str, type_str: str, scalar_field_name: str, mapping: dict, classification=None,
+                           workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Compute the classification of every point of a file after labelling some of its segments, chunk by chunk in
+    worker processes that write their part of the column into a shared memory-mapped file.
+
+    Parameters:
+    file_path (str): The path to the point cloud file (see supports_chunks).
+    type_str (str): The format of the file, "LAS" or "PLY".
+    scalar_field_name (str): The scalar field that discriminates the segments.
+    mapping (dict): A dictionary mapping segment values to classifications.
+    classification (np.ndarray): The current classification of the points, updated by mapping. By default, the
+                                 classification of the file (for PLY files without scalar_Classification, -1).
+    workers (int): The number of processes.
+    chunk_size (int): The number of points per chunk.
+
+    Returns:
+    np.ndarray: The classification of each point (float32 for PLY files, uint8 for LAS files).
+    """
+    n_points = formats.get_backend(type_str).get_point_count(file_path)
+    dtype = np.dtype(np.uint8 if type_str == "LAS" else np.float32)
+    table = segments.build_lookup_table(mapping)
+    descriptor, column_path = tempfile.mkstemp(suffix=".classification")
+    os.close(descriptor)
+    try:
+        column = np.memmap(column_path, dtype=dtype, mode='w+', shape=(max(n_points, 1),))
+        if classification is not None:
+            column[:n_points] = classification
+        column.flush()
+        del column
+        arguments = (table, column_path, dtype.str, max(n_points, 1), classification is not None)
+        for _ in iter_ranges(_classify_range, arguments, file_path, type_str, scalar_field_name, chunk_size, workers):
+            pass
+        return np.fromfile(column_path, dtype=dtype, count=n_points)
+    finally:
+        os.remove(column_path)
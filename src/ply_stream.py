@@ -0,0 +1,178 @@
+"""
+This module provides zero-copy functions for binary PLY files: the vertex data stays memory-mapped
+and the output is streamed chunk by chunk with its classification column.
+
+It is the backend of the PLY format (see formats): the only module that imports plyfile at load time.
+"""
+import numpy as np
+import numpy.lib.recfunctions as rfn
+from plyfile import PlyData, PlyElement, PlyListProperty
+
+import segments
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+CLASSIFICATION_FIELD = 'scalar_Classification'
+
+def read(file_path: str, mmap='c'):
+    """
+    Read a PLY file. Binary vertex data is memory-mapped (copy-on-write by default): pages are read only when accessed.
+    """
+    return PlyData.read(file_path, mmap=mmap)
+
+def read_header(file_path: str):
+    return read(file_path, mmap='r').header
+
+def read_bounds(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Get the header and the x/y bounds of a PLY file, streamed chunk by chunk so that memory-mapped vertices are
+    never fully paged in at once.
+    """
+    ply_data = read(file_path, mmap='r')
+    xs = ply_data['vertex']['x']
+    ys = ply_data['vertex']['y']
+    mins = [np.inf, np.inf]
+    maxs = [-np.inf, -np.inf]
+    for start in range(0, len(xs), chunk_size):
+        chunk_xs = xs[start:start + chunk_size]
+        chunk_ys = ys[start:start + chunk_size]
+        mins = [min(mins[0], chunk_xs.min()), min(mins[1], chunk_ys.min())]
+        maxs = [max(maxs[0], chunk_xs.max()), max(maxs[1], chunk_ys.max())]
+    return ply_data.header, mins, maxs
+
+def get_point_count(file_path: str) -> int:
+    return read(file_path, mmap='r')['vertex'].count
+
+def supports_chunks(file_path: str) -> bool:
+    return supports_streaming(read(file_path, mmap='r'))
+
+def open_vertices(file_path: str):
+    """
+    Get the read-only memory-mapped vertex records of a binary PLY file: a slice only pages in its own vertices.
+    """
+    return read(file_path, mmap='r')['vertex'].data
+
+def append_classification(data, classification):
+    """
+    Get a copy of vertex records with a scalar_Classification float property appended.
+    """
+    return rfn.append_fields(data, CLASSIFICATION_FIELD, np.asarray(classification, dtype=np.float32), usemask=False, dtypes=[np.float32])
+
+def replace_vertex_data(ply_data, data):
+    """
+    Get a PLY point cloud with new vertex records and the other elements of ply_data.
+    """
+    elements = [PlyElement.describe(data, 'vertex') if el.name == 'vertex' else el for el in ply_data.elements]
+    return PlyData(elements, text=ply_data.text)
+
+def supports_streaming(ply_data) -> bool:
+    """
+    Tell whether a PLY point cloud can be written by `write_with_classification`.
+
+    It must be binary (little- or big-endian), have a vertex element, and no list properties
+    (their rows have variable sizes and cannot be copied as fixed-size records).
+    """
+    if ply_data.text or 'vertex' not in [el.name for el in ply_data.elements]:
+        return False
+    return not any(isinstance(prop, PlyListProperty) for el in ply_data.elements for prop in el.properties)
+
+def get_classification(ply_data, default: float = -1):
+    """
+    Get a writable copy of the classification column of a PLY point cloud, initialised with default if the column does not exist.
+
+    Only this column is copied: the other vertex properties stay memory-mapped.
+    """
+    vertex = ply_data['vertex'].data
+    if CLASSIFICATION_FIELD in vertex.dtype.names:
+        return np.array(vertex[CLASSIFICATION_FIELD], dtype=np.float32)
+    return np.full(len(vertex), default, dtype=np.float32)
+
+def write_with_classification(ply_data, classification, dst_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Write a binary PLY point cloud with the given classification column, streaming its vertex records chunk by chunk.
+
+    The header (format, comments, obj_info) and the original vertex bytes are kept; the classification
+    replaces the scalar_Classification property, or is appended as a new float property. Only one chunk of
+    output records is held in memory at once, never a second copy of the whole point cloud.
+
+    Parameters:
+    ply_data (plyfile.PlyData): The point cloud, typically read with memory-mapping.
+    classification (array-like or iterator): The classification of each vertex, or an iterator over the classifications
+                                             of consecutive chunks of chunk_size vertices (computed as they are written).
+    dst_path (str): The path to the PLY file to write.
+    chunk_size (int): The maximum number of vertices copied at once.
+    """
+    if not supports_streaming(ply_data):
+        raise ValueError("Only binary PLY point clouds without list properties can be streamed.")
+    byte_order = ply_data.byte_order
+    vertex = ply_data['vertex']
+    header = ply_data.header
+    out_dtype = vertex.dtype(byte_order)
+    if CLASSIFICATION_FIELD not in out_dtype.names:
+        header = header.replace(vertex.header, vertex.header + f"\nproperty float {CLASSIFICATION_FIELD}", 1)
+        out_dtype = np.dtype(out_dtype.descr + [(CLASSIFICATION_FIELD, byte_order + 'f4')])
+    if hasattr(classification, '__len__'):
+        classification = np.asarray(classification)
+        if len(classification) != vertex.count:
+            raise ValueError(f"Got {len(classification)} classifications for {vertex.count} vertices.")
+        chunks = (classification[start:start + chunk_size] for start in range(0, vertex.count, chunk_size))
+    else:
+        chunks = iter(classification)
+
+    with open(dst_path, 'wb') as stream:
+        stream.write(header.encode('ascii'))
+        stream.write(b'\n')
+        for element in ply_data.elements:
+            data = element.data
+            if element.name != 'vertex':
+                stream.write(data.astype(element.dtype(byte_order), copy=False).tobytes())
+                continue
+            for start in range(0, len(data), chunk_size):
+                chunk = data[start:start + chunk_size]
+                records = np.empty(len(chunk), dtype=out_dtype)
+                for name in chunk.dtype.names:
+                    records[name] = chunk[name]
+                records[CLASSIFICATION_FIELD] = next(chunks)
+                stream.write(records.tobytes())
+
+def update_classification(file_path: str, scalar_field_name: str, mapping: dict, fallback_path: str = None) -> bool:
+    """
+    Set, in place, the classification of the points of some segments of a binary PLY file with a scalar_Classification property.
+
+    The file is memory-mapped for writing: only the pages holding points of the given segments are read and written.
+
+    Parameters:
+    file_path (str): The path to the PLY file to update.
+    scalar_field_name (str): The scalar field that discriminates the segments.
+    mapping (dict): A dictionary mapping segment values to their new classification, or to None for segments that
+                    lose their label: their points get the classification they have in fallback_path (the file the
+                    PLY file was labelled from, with the same points in the same order), or -1.
+    fallback_path (str): The path to the PLY file giving the classification of unlabelled points.
+
+    Returns:
+    bool: True if the file was updated, False if it cannot be updated in place (text PLY, missing properties).
+    """
+    with open(file_path, 'r+b') as stream:
+        ply_data = PlyData.read(stream, mmap='r+')
+        if ply_data.text or 'vertex' not in [el.name for el in ply_data.elements]:
+            return False
+        names = ply_data['vertex'].data.dtype.names
+        if CLASSIFICATION_FIELD not in names or scalar_field_name not in names:
+            return False
+        vertex = ply_data['vertex'].data
+        changed, _ = segments.lookup(vertex[scalar_field_name], segments.build_lookup_table({value: 0 for value in mapping}))
+        if not changed.any():
+            return True
+        if fallback_path is not None:
+            fallback_vertex = PlyData.read(fallback_path, mmap='r')['vertex'].data
+            if CLASSIFICATION_FIELD in fallback_vertex.dtype.names:
+                classification = np.array(fallback_vertex[CLASSIFICATION_FIELD][changed], dtype=np.float32)
+            else:
+                classification = np.full(np.count_nonzero(changed), -1, dtype=np.float32)
+        else:
+            classification = np.full(np.count_nonzero(changed), -1, dtype=np.float32)
+        labelled = {value: classification_value for value, classification_value in mapping.items() if classification_value is not None}
+        mapped, mapped_classifications = segments.lookup(vertex[scalar_field_name][changed], segments.build_lookup_table(labelled))
+        classification[mapped] = mapped_classifications
+        vertex[CLASSIFICATION_FIELD][changed] = classification
+        vertex.flush()
+    return True
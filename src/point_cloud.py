@@ -1,168 +1,458 @@
+import logging
 import os
 
 import numpy as np
-import numpy.lib.recfunctions as rfn
-from plyfile import PlyElement, PlyData
 
-import utils
+import formats, instrumentation, parallel, segments, utils
+
+logger = logging.getLogger(__name__)
+
+def _bbox_2d_center(mins, maxs):
+    """
+    Get the (north, east) LV95 center of a 2D bounding box given in WGS84 or LV95.
+    """
+    mean_x = (mins[0] + maxs[0]) / 2
+    mean_y = (mins[1] + maxs[1]) / 2
+    if utils.is_wgs84(mean_x, mean_y):
+        # once per file: only logged at the DEBUG level not to flood the logs of large directories
+        logger.debug("Point cloud seems to be in WGS84 coordinates, converting to LV95.")
+    center = utils.to_lv95_2d([mean_x], [mean_y])[0]
+    return (center[0], center[1])
 
 class PointCloud:
     """
     This class represents a point cloud with its associated data.
     """
 
-    def __init__(self, pc, pc_label=None, type_str="LAS", discriminative_scalar_field_name=None):
+    def __init__(self, pc, pc_label=None, type_str="LAS", discriminative_scalar_field_name=None, file_path=None):
         self.pc = pc
         self.type_str = type_str
         self.label = pc_label
         self.discriminative_scalar_field_name = discriminative_scalar_field_name
-        if self.discriminative_scalar_field_name:
-            if self.type_str == "LAS":
-                self.n_clusters = len(np.unique(self.pc.classification))
-            elif self.type_str == "PLY":
-                if self.discriminative_scalar_field_name not in self.pc['vertex'].data.dtype.names:
-                    raise ValueError(f"Scalar field '{self.discriminative_scalar_field_name}' not found in PLY point cloud.")
-                self.n_clusters = len(np.unique(self.pc['vertex'][self.discriminative_scalar_field_name]))
-        else:
-            self.n_clusters = 1
-        if self.n_clusters == 1:
-            self.localisation = self.get_bbox_2d_center()
-            self.localisations = None
-        else:
-            self.localisation = None
-            self.localisations = self.get_bbox_2d_centers()
+        self.file_path = file_path
+        self.header = self.pc.header
+        self.classification = None
+        self.segment_labels = {}
+        self.workers = 1
+        with instrumentation.stage("localise"):
+            self.bbox = self.get_bbox_2d()
+            if self.discriminative_scalar_field_name:
+                self.segment_extents = self.get_segment_extents()
+                self.n_clusters = len(self.segment_extents)
+            else:
+                self.segment_extents = None
+                self.n_clusters = 1
+            if self.n_clusters == 1:
+                self.localisation = self.get_bbox_2d_center()
+                self.localisations = None
+            else:
+                self.localisation = None
+                self.localisations = self.get_bbox_2d_centers(self.segment_extents)
 
+    @classmethod
+    def from_file(cls, file_path: str, type_str="LAS", pc_label=None, chunk_size: int = 1_000_000):
+        """
+        Build a lazy point cloud from a file, reading only what is needed to localise it.
 
-    def get_bbox_2d_center(self):
+        For LAS files only the header is read, its mins/maxs give the bounding box. For PLY files the header
+        is read and the x/y bounds are streamed over the (memory-mapped, if binary) vertices (see the read_bounds
+        function of the format backends).
+        The points are read the first time they are needed (see `load`).
+        """
+        with instrumentation.stage("localise"):
+            header, mins, maxs = formats.get_backend(type_str).read_bounds(file_path, chunk_size)
+            localisation = _bbox_2d_center(mins, maxs)
+        return cls.from_scan({
+            "file_path": file_path,
+            "type_str": type_str,
+            "header": header,
+            "discriminative_scalar_field_name": None,
+            "n_clusters": 1,
+            "bbox": (mins[0], mins[1], maxs[0], maxs[1]),
+            "segment_extents": None,
+            "localisation": localisation,
+            "localisations": None,
+        }, pc_label=pc_label)
+
+    @classmethod
+    def from_segmented_file(cls, file_path: str, type_str: str, discriminative_scalar_field_name: str, workers: int = 1,
+                            chunk_size: int = parallel.DEFAULT_CHUNK_SIZE):
+        """
+        Build a lazy segmented point cloud from a file, computing the extents of its segments chunk by chunk in
+        worker processes (see parallel.compute_segment_extents) instead of loading its points. With a single
+        worker, LAS files are streamed in one pass (see las_stream.compute_segment_extents).
+
+        The point cloud keeps the number of workers: its labels are applied chunk-parallel too (see apply_labels).
+        The file must support chunked reads (see parallel.supports_chunks).
+        """
+        with instrumentation.stage("localise"):
+            if type_str == "LAS" and workers <= 1:
+                extents = formats.get_backend("LAS").compute_segment_extents(file_path, discriminative_scalar_field_name, chunk_size)
+            else:
+                extents = parallel.compute_segment_extents(file_path, type_str, discriminative_scalar_field_name, workers, chunk_size)
+            header = formats.get_backend(type_str).read_header(file_path)
+            if type_str == "LAS":
+                bbox = (header.mins[0], header.mins[1], header.maxs[0], header.maxs[1])
+            else:
+                mins, maxs = extents.mins.min(axis=0, initial=np.inf), extents.maxs.max(axis=0, initial=-np.inf)
+                bbox = (mins[0], mins[1], maxs[0], maxs[1])
+            point_cloud = cls.from_scan({
+                "file_path": file_path,
+                "type_str": type_str,
+                "header": header,
+                "discriminative_scalar_field_name": discriminative_scalar_field_name,
+                "n_clusters": len(extents),
+                "bbox": bbox,
+                "segment_extents": extents,
+                "localisation": _bbox_2d_center(bbox[:2], bbox[2:]) if len(extents) == 1 else None,
+                "localisations": None,
+            })
+            if point_cloud.n_clusters != 1:
+                point_cloud.localisations = point_cloud.get_bbox_2d_centers(extents)
+        point_cloud.workers = workers
+        return point_cloud
+
+    @classmethod
+    def from_scan(cls, scan: dict, pc_label=None):
+        """
+        Build a point cloud from the compact result of a scan (see `scan`), without its points.
+
+        The points are read back from the file the first time they are needed.
+        """
+        point_cloud = cls.__new__(cls)
+        point_cloud.pc = None
+        point_cloud.classification = None
+        point_cloud.segment_labels = {}
+        point_cloud.workers = 1
+        point_cloud.label = pc_label
+        point_cloud.file_path = scan["file_path"]
+        point_cloud.type_str = scan["type_str"]
+        point_cloud.header = scan["header"]
+        point_cloud.discriminative_scalar_field_name = scan["discriminative_scalar_field_name"]
+        point_cloud.n_clusters = scan["n_clusters"]
+        point_cloud.bbox = scan["bbox"]
+        point_cloud.segment_extents = scan["segment_extents"]
+        point_cloud.localisation = scan["localisation"]
+        point_cloud.localisations = scan["localisations"]
+        return point_cloud
+
+    def scan(self) -> dict:
+        """
+        Get the compact description of the point cloud: everything but its points.
+
+        Returns:
+        dict: The file path, type, header, number of clusters, 2D bounding box, segment extents
+              and localisation(s) of the point cloud.
+        """
+        return {
+            "file_path": self.file_path,
+            "type_str": self.type_str,
+            "header": self.header,
+            "discriminative_scalar_field_name": self.discriminative_scalar_field_name,
+            "n_clusters": self.n_clusters,
+            "bbox": self.bbox,
+            "segment_extents": self.segment_extents,
+            "localisation": self.localisation,
+            "localisations": self.localisations,
+        }
+
+    def load(self):
+        """
+        Read the points of the point cloud from its file, if they are not in memory yet.
+        """
+        if self.pc is not None:
+            return
+        if self.file_path is None:
+            raise ValueError("Point cloud has neither points nor a file to read them from.")
+        with instrumentation.stage("load"):
+            # binary PLY vertex data is memory-mapped (copy-on-write): pages are read only when accessed
+            self.pc = formats.get_backend(self.type_str).read(self.file_path)
+        if self.header is None:
+            self.header = self.pc.header
+        if self.type_str == "LAS" and self.classification is not None:
+            # the column computed chunk-parallel from the file (see apply_labels)
+            self.pc.classification[:] = self.classification
+        elif self.segment_labels and self.classification is None:
+            # the labels were given while the points were not in memory (see apply_labels)
+            self._apply_classes({sfv: lbl.label for sfv, lbl in self.segment_labels.items()})
+
+    def release(self):
+        """
+        Drop the points (and pending classification) of a point cloud that can be read back from its file.
+        """
+        if self.file_path is not None:
+            self.pc = None
+            self.classification = None
+
+    def _streams_classification(self) -> bool:
+        """
+        Tell whether the classification is held in a separate column instead of being written into the points,
+        which is the case of binary PLY point clouds (their vertices stay memory-mapped, see ply_stream).
+        """
+        return self.type_str == "PLY" and formats.get_backend("PLY").supports_streaming(self.pc)
+
+    def get_bbox_2d(self):
+        """
+        Get the 2D bounding box of the point cloud, in its own coordinates.
+
+        Returns:
+        tuple: The (min_x, min_y, max_x, max_y) bounds of the points.
+        """
         if self.type_str == "PLY":
             points = self.pc['vertex']
             xs = points['x']
             ys = points['y']
-            zs = points['z']
-            mean_x = (min(xs) + max(xs)) / 2
-            mean_y = (min(ys) + max(ys)) / 2
-            mean_z = (min(zs) + max(zs)) / 2
-            if mean_x < 180 and mean_y < 90:
-                print("Point cloud seems to be in WGS84 coordinates, converting to LV95.")
-                mean_x, mean_y, mean_z = utils.convert_wgs84_to_lv95(mean_x, mean_y, mean_z)
-            return (mean_y, mean_x)
+            return (xs.min(), ys.min(), xs.max(), ys.max())
         elif self.type_str == "LAS":
-            mean = (self.pc.header.mins + self.pc.header.maxs) / 2
-            if mean[0] < 180 and mean[1] < 90:
-                print("Point cloud seems to be in WGS84 coordinates, converting to LV95.")
-                mean = utils.convert_wgs84_to_lv95(mean[0], mean[1], mean[2])
-        return (mean[1], mean[0])
+            mins, maxs = self.pc.header.mins, self.pc.header.maxs
+            return (mins[0], mins[1], maxs[0], maxs[1])
+
+    def get_bbox_2d_center(self):
+        bbox = self.get_bbox_2d()
+        return _bbox_2d_center(bbox[:2], bbox[2:])
     
-    def get_bbox_2d_centers(self):
+    def get_scalar_field(self):
+        """
+        Get the values of the discriminative scalar field: a PLY vertex property, or a LAS dimension (standard or extra bytes).
+        """
+        if self.type_str == "PLY":
+            if self.discriminative_scalar_field_name not in self.pc['vertex'].data.dtype.names:
+                raise ValueError(f"Scalar field '{self.discriminative_scalar_field_name}' not found in PLY point cloud.")
+            return self.pc['vertex'].data[self.discriminative_scalar_field_name]
+        elif self.type_str == "LAS":
+            if self.discriminative_scalar_field_name not in self.pc.point_format.dimension_names:
+                raise ValueError(f"Dimension '{self.discriminative_scalar_field_name}' not found in LAS point cloud.")
+            return np.asarray(self.pc[self.discriminative_scalar_field_name])
+
+    def get_segment_extents(self):
+        """
+        Get the extents, centroids and point counts of all the segments of the point cloud, computed in one pass.
+
+        Returns:
+        segments.SegmentExtents: The statistics of each segment, with x, y, z as axes.
+        """
+        if self.type_str == "PLY":
+            data = self.pc['vertex'].data
+            xs, ys, zs = data['x'], data['y'], data['z']
+        else:
+            xs, ys, zs = self.pc.x, self.pc.y, self.pc.z
+        return segments.SegmentExtents.compute(self.get_scalar_field(), xs, ys, zs)
+
+    def get_footprints(self, cell_size: float, chunk_size: int = 1_000_000):
+        """
+        Get the 2D footprints of all the segments of the point cloud, in the LV95 (north, east) frame of the localisations.
+
+        The points are loaded if needed, and rasterized chunk_size points at a time, so that the coordinates
+        converted to LV95 are never held for the whole point cloud at once.
+
+        Parameters:
+        cell_size (float): The side of the cells of the occupancy grid, in meters.
+        chunk_size (int): The maximum number of points rasterized at once.
+
+        Returns:
+        segments.Footprints: The occupied cells of each segment.
+        """
+        self.load()
+        scalar_field = self.get_scalar_field()
+        if self.type_str == "PLY":
+            data = self.pc['vertex'].data
+            xs, ys = data['x'], data['y']
+        else:
+            xs, ys = self.pc.x, self.pc.y
+        parts = []
+        for start in range(0, len(scalar_field), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            locations = utils.to_lv95_2d(xs[chunk], ys[chunk])
+            parts.append(segments.Footprints.compute(scalar_field[chunk], locations[:, 0], locations[:, 1], cell_size))
+            parts = [segments.Footprints.merge(parts)]
+        if not parts:
+            return segments.Footprints(cell_size, scalar_field[:0], np.empty((0, 2)), [], [])
+        return parts[0]
+
+    def get_bbox_2d_centers(self, extents=None):
         """
         Get the 2D centers of the bounding boxes for each segment in the point cloud.
 
+        Parameters:
+        extents (segments.SegmentExtents): The extents of the segments, computed if not given.
+
         Returns:
         dict: A dictionary mapping scalar field values to their corresponding (lat, lon) centers.
         """
+        if extents is None:
+            extents = self.get_segment_extents()
+        bbox_centers = extents.get_bbox_centers()
+        if utils.is_wgs84(bbox_centers[:, 0], bbox_centers[:, 1]):
+            logger.info("Point cloud seems to be in WGS84 coordinates, converting to LV95.")
+        locations = utils.to_lv95_2d(bbox_centers[:, 0], bbox_centers[:, 1])
         centers = {}
-        if self.type_str == "PLY":
-            points = self.pc['vertex']
-            data = points.data
-            scalar_field = data[self.discriminative_scalar_field_name]
-            scalar_field_values = np.unique(scalar_field)
-            for sfv in scalar_field_values:
-                mask = scalar_field == sfv
-                xs = data['x'][mask]
-                ys = data['y'][mask]
-                zs = data['z'][mask]
-                mean_x = (min(xs) + max(xs)) / 2
-                mean_y = (min(ys) + max(ys)) / 2
-                mean_z = (min(zs) + max(zs)) / 2
-                if mean_x < 180 and mean_y < 90:
-                    print("Point cloud seems to be in WGS84 coordinates, converting to LV95.")
-                    mean_x, mean_y, mean_z = utils.convert_wgs84_to_lv95(mean_x, mean_y, mean_z)
-                centers[sfv] = (mean_y, mean_x)
-            if 0 in centers:
-                del centers[0]
-                print("Removed segment with scalar field value 0 from localisations because it is assumed to be the ground.")
-        else:
-            raise NotImplementedError("get_bbox_2d_centers is only implemented for PLY point clouds.")
+        for sfv, location in zip(extents.values, locations):
+            centers[sfv] = (location[0], location[1])
+        if 0 in centers:
+            del centers[0]
+            logger.info("Removed segment with scalar field value 0 from localisations because it is assumed to be the ground.")
         return centers
-    
+
     def apply_label(self, pc_label: int):
+        if self.pc is None:
+            # lazy point cloud: the label is applied when the points are loaded to be stored
+            self.label = pc_label
+            return
         if self.type_str == "LAS":
             self.pc.classification[:] = int(pc_label.label)
+        elif self._streams_classification():
+            self.classification = np.full(self.pc['vertex'].count, float(pc_label.label), dtype=np.float32)
         elif self.type_str == "PLY":
-            vertex = self.pc['vertex']
-            data = vertex.data
+            ply_stream = formats.get_backend("PLY")
+            data = self.pc['vertex'].data
 
             if 'scalar_Classification' in data.dtype.names:
                 data['scalar_Classification'][:] = float(pc_label.label)
             else:
-                data = rfn.append_fields(
-                    data,
-                    'scalar_Classification',
-                    np.full(data.shape, float(pc_label.label), dtype=np.float32),
-                    usemask=False,
-                    dtypes=[np.float32]
-                )
-
-            elements = []
-            for el in self.pc.elements:
-                if el.name == 'vertex':
-                    elements.append(PlyElement.describe(data, 'vertex'))
-                else:
-                    elements.append(el)
-            self.pc = PlyData(elements, text=self.pc.text)
+                data = ply_stream.append_classification(data, np.full(data.shape, float(pc_label.label), dtype=np.float32))
+            self.pc = ply_stream.replace_vertex_data(self.pc, data)
 
     def apply_label_to_scalar_field(self, scalar_field_value: int, pc_label: int):
         """
         applies a given label to all points in the point cloud with the given scalar field value
         """
-        if self.type_str == "PLY":
-            vertex = self.pc['vertex']
-            data = vertex.data
+        self.apply_labels({scalar_field_value: pc_label})
 
-            if 'scalar_Classification' in data.dtype.names:
-                print("scalar_Classification field already exists in PLY point cloud. Updating values.")
-                data['scalar_Classification'][data[self.discriminative_scalar_field_name] == scalar_field_value] = float(pc_label.label)
+    def apply_labels(self, mapping: dict):
+        """
+        Apply labels to several segments at once: all the points of a segment get the label of its scalar field value.
+
+        The classification of each point is gathered from a segment id -> class lookup table in one vectorized pass.
+        For PLY point clouds without a scalar_Classification field, the field is allocated once and points of
+        unlabelled segments get -1. For binary PLY point clouds, only this column is held in memory (see
+        get_classification), the memory-mapped vertices are neither copied nor modified.
+
+        With several workers, the classification column of a lazy LAS or binary PLY point cloud is computed
+        chunk-parallel from its file (see parallel.compute_classification), without loading it. Otherwise, the labels
+        of a lazy LAS point cloud are only recorded: they are applied when its points are loaded, or streamed to the
+        output by store_pc.
+
+        The labels of the segments are kept in segment_labels.
+
+        Parameters:
+        mapping (dict): A dictionary mapping scalar field values to labels (label.Label objects).
+        """
+        self.segment_labels.update(mapping)
+        classes = {sfv: lbl.label for sfv, lbl in mapping.items()}
+        if self.pc is None:
+            if self.workers > 1 and parallel.supports_chunks(self.file_path, self.type_str):
+                self.classification = parallel.compute_classification(self.file_path, self.type_str, self.discriminative_scalar_field_name, classes,
+                                                                      self.classification, self.workers)
+                return
+            if self.type_str == "LAS":
+                return
+            # the labels recorded above are applied by load
+            self.load()
+            return
+        self._apply_classes(classes)
 
+    def _apply_classes(self, classes: dict):
+        """
+        Set the classification of the points of the loaded point cloud from a segment value -> class mapping.
+        """
+        table = segments.build_lookup_table(classes)
+        mapped, classifications = segments.lookup(self.get_scalar_field(), table)
+        if self.type_str == "LAS":
+            las_classification = np.array(self.pc.classification)
+            las_classification[mapped] = classifications
+            self.pc.classification[:] = las_classification
+        elif self._streams_classification():
+            if self.classification is None:
+                self.classification = formats.get_backend("PLY").get_classification(self.pc)
+            self.classification[mapped] = classifications
+        elif self.type_str == "PLY":
+            data = self.pc['vertex'].data
+            if 'scalar_Classification' in data.dtype.names:
+                data['scalar_Classification'][mapped] = classifications
             else:
-                print("scalar_Classification field does not exist in PLY point cloud. Creating new field.")
-                data = rfn.append_fields(
-                    data,
-                    'scalar_Classification',
-                    np.full(data.shape, float(-1), dtype=np.float32),
-                    usemask=False,
-                    dtypes=[np.float32]
-                )
-                data['scalar_Classification'][data[self.discriminative_scalar_field_name] == scalar_field_value] = float(pc_label.label)
-
-            elements = []
-            for el in self.pc.elements:
-                if el.name == 'vertex':
-                    elements.append(PlyElement.describe(data, 'vertex'))
-                else:
-                    elements.append(el)
-            self.pc = PlyData(elements, text=self.pc.text)
-        
-        else:
-            raise NotImplementedError("apply_label_to_scalar_field is only implemented for PLY point clouds.")
+                labelled = np.empty(data.shape, dtype=data.dtype.descr + [('scalar_Classification', np.float32)])
+                for name in data.dtype.names:
+                    labelled[name] = data[name]
+                labelled['scalar_Classification'] = -1
+                labelled['scalar_Classification'][mapped] = classifications
+                data = labelled
+            self.pc = formats.get_backend("PLY").replace_vertex_data(self.pc, data)
+
+    def get_classification(self):
+        """
+        Get the classification of each point, as it will be written by store_pc.
 
-    def store_pc(self, folder_path: str):
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
+        Returns:
+        numpy.ndarray: The classification of each point, or None for a PLY point cloud without classification.
+        """
+        self.load()
+        if self.classification is not None:
+            return self.classification
         if self.type_str == "LAS":
-            if self.localisation is not None:
-                filename = f"pc_with_label_at_{self.localisation[0]}_{self.localisation[1]}.las"
-                output_path = os.path.join(folder_path, filename)
-                self.pc.write(output_path)
+            return np.asarray(self.pc.classification)
+        data = self.pc['vertex'].data
+        if 'scalar_Classification' in data.dtype.names:
+            return data['scalar_Classification']
+        return None
+
+    def get_output_path(self, folder_path: str) -> str:
+        """
+        Get the path of the file store_pc writes in the given folder.
+        """
+        extension = "las" if self.type_str == "LAS" else "ply"
+        if self.localisation is not None:
+            filename = f"pc_with_label_at_{self.localisation[0]}_{self.localisation[1]}.{extension}"
+        else:
+            filename = f"pc_with_labels.{extension}"
+        return os.path.join(folder_path, filename)
+
+    def store_pc(self, folder_path: str, chunk_size: int = None, output_path: str = None):
+        """
+        Write the point cloud, with its labels, in the given folder.
+
+        If chunk_size is given, a lazy LAS point cloud is streamed from its file to the output chunk_size points
+        at a time (see las_stream.write_labelled) instead of being loaded, so files larger than RAM can be labelled,
+        with its label or the labels of its segments. A lazy LAS point cloud whose classification column was
+        computed chunk-parallel (see apply_labels) is always streamed with it (see las_stream.copy_with_classification).
+        Binary PLY point clouds are always streamed from their memory-mapped vertices with their classification
+        column (see ply_stream.write_with_classification).
+
+        If output_path is given, the point cloud is written there instead of get_output_path(folder_path), and the
+        folder is assumed to exist (see output_writer.write_point_clouds, which creates it once for all the writes).
+        """
+        if output_path is None:
+            os.makedirs(folder_path, exist_ok=True)
+            output_path = self.get_output_path(folder_path)
+        with instrumentation.stage("write"):
+            if self.type_str == "LAS" and self.pc is None and self.classification is not None:
+                las_stream = formats.get_backend("LAS")
+                chunk_size = chunk_size or las_stream.DEFAULT_CHUNK_SIZE
+                classification_chunks = (self.classification[start:start + chunk_size] for start in range(0, len(self.classification), chunk_size))
+                n_points = las_stream.copy_with_classification(self.file_path, output_path, classification_chunks, chunk_size)
+                instrumentation.count("points_written", n_points)
+                return
+            if chunk_size is not None and self.type_str == "LAS" and self.pc is None and (self.label is not None or self.segment_labels):
+                las_stream = formats.get_backend("LAS")
+                if self.segment_labels:
+                    n_points = las_stream.write_labelled(self.file_path, output_path, scalar_field_name=self.discriminative_scalar_field_name,
+                                                         mapping={sfv: lbl.label for sfv, lbl in self.segment_labels.items()}, chunk_size=chunk_size)
+                else:
+                    n_points = las_stream.write_labelled(self.file_path, output_path, classification=self.label.label, chunk_size=chunk_size)
+                instrumentation.count("points_written", n_points)
+                return
+            # a lazy point cloud is only loaded for the time of the write, so that one file at a time is in memory
+            release = self.pc is None
+            if release:
+                self.load()
+                if self.label is not None:
+                    with instrumentation.stage("label"):
+                        self.apply_label(self.label)
+            if self.classification is not None and self.type_str == "PLY":
+                ply_stream = formats.get_backend("PLY")
+                ply_stream.write_with_classification(self.pc, self.classification, output_path,
+                                                     chunk_size or ply_stream.DEFAULT_CHUNK_SIZE)
             else:
-                filename = "pc_with_labels.las"
-                output_path = os.path.join(folder_path, filename)
                 self.pc.write(output_path)
-        elif self.type_str == "PLY":
-            if self.localisation is not None:
-                filename = f"pc_with_label_at_{self.localisation[0]}_{self.localisation[1]}.ply"
-                output_path = os.path.join(folder_path, filename)
-                self.pc.write(output_path)
-            else:
-                filename = "pc_with_labels.ply"
-                output_path = os.path.join(folder_path, filename)
-                self.pc.write(output_path)
\ No newline at end of file
+            instrumentation.count("points_written", len(self.pc.points) if self.type_str == "LAS" else self.pc['vertex'].count)
+            if release:
+                self.release()
@@ -0,0 +1,134 @@
+"""
+This module provides the per-point propagation of labels to point clouds without segments: each point gets the class
+of the nearest label within a maximum distance, computed chunk by chunk, optionally by several processes.
+"""
+import logging
+
+import numpy as np
+
+import formats, instrumentation, label, parallel, spatial_index, utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+# the classification of the points without a label within reach: -1 in the scalar_Classification of PLY files, as
+# for the unlabelled segments (see ply_stream.get_classification), 0 ("never classified") in the unsigned classification
+# of LAS files. Labels with a negative class, such as the -1 utils.get_label_index gives to unknown names, are dropped.
+NO_LABEL = -1
+LAS_NO_LABEL = 0
+
+def get_nearest_classes(xs, ys, label_locations, label_classes, max_distance: float, index=None):
+    """
+    Get the class of the nearest label of each point, in the XY plane.
+
+    Parameters:
+    xs, ys (array-like): The coordinates of the points (WGS84 or LV95, see utils.to_lv95_2d).
+    label_locations (np.ndarray): The (north, east) LV95 locations of the labels.
+    label_classes (np.ndarray): The class of each label.
+    max_distance (float): The maximum distance between a point and its label, in meters.
+    index (spatial_index.GridIndex): A grid index over label_locations with a cell size of max_distance, to reuse across chunks.
+
+    Returns:
+    np.ndarray: The class of the nearest label of each point (ties going to the first label), NO_LABEL if none is within max_distance.
+    """
+    locations = utils.to_lv95_2d(xs, ys)
+    if index is not None:
+        nearest, _ = index.query_nearest(locations, max_distance)
+    else:
+        nearest, _ = spatial_index.nearest_neighbours(label_locations, locations, max_distance)
+    classes = np.full(len(nearest), NO_LABEL, dtype=np.int64)
+    found = nearest >= 0
+    classes[found] = label_classes[nearest[found]]
+    return classes
+
+def _build_index(label_locations, max_distance: float):
+    if np.isfinite(max_distance) and max_distance > 0:
+        return spatial_index.GridIndex(label_locations, max_distance)
+    return None
+
+def _classify_range(start: int, stop: int, label_locations, label_classes, max_distance: float):
+    """
+    Get the classes of the points [start, stop) of the file of the worker (see parallel.iter_ranges).
+    """
+    state = parallel.worker_state
+    if "label_index" not in state:
+        # built once per process, for all its chunks
+        state["label_index"] = _build_index(label_locations, max_distance)
+    xs, ys, _, _, _ = parallel.read_range(start, stop)
+    return get_nearest_classes(xs, ys, label_locations, label_classes, max_distance, state["label_index"])
+
+def _iter_classes(file_path: str, type_str: str, label_locations, label_classes, max_distance: float, chunk_size: int, workers: int):
+    """
+    Iterate over the classes of consecutive chunks of chunk_size points of a file, in order, classified by workers processes.
+    """
+    arguments = (label_locations, label_classes, max_distance)
+    return parallel.iter_ranges(_classify_range, arguments, file_path, type_str, None, chunk_size, workers)
+
+def propagate_labels_to_file(src_path: str, dst_path: str, type_str: str, labels, max_distance: float = 2.0,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1) -> dict:
+    """
+    Write a copy of a point cloud file where each point has the class of the nearest label within max_distance in XY.
+
+    Points without a label within reach get NO_LABEL in the scalar_Classification of PLY files, LAS_NO_LABEL in the
+    classification of LAS files. Labels with a negative class (names missing from the class table) are dropped. LAS files and binary PLY files are streamed: only a few chunks of points are in memory at once.
+    Text PLY files are loaded.
+
+    Parameters:
+    src_path (str): The path to the point cloud file.
+    dst_path (str): The path to the file to write, of the same format.
+    type_str (str): The format of the file, "LAS" or "PLY".
+    labels (label.LabelSet or list): The labels.
+    max_distance (float): The maximum distance between a point and its label, in meters.
+    chunk_size (int): The number of points classified at once.
+    workers (int): The number of processes classifying the chunks.
+
+    Returns:
+    dict: The number of points written ("n_points") and of points that got a label ("n_labelled").
+    """
+    labels = label.LabelSet.from_labels(labels)
+    valid = labels.classes >= 0
+    if not valid.all():
+        logger.warning(f"Dropped {int(np.count_nonzero(~valid))} labels without a valid class (missing from the class table).")
+    label_locations = labels.get_2d_locations()[valid]
+    label_classes = labels.classes[valid]
+    n_labelled = 0
+
+    def count_labelled(classes_chunks):
+        nonlocal n_labelled
+        for classes in classes_chunks:
+            n_labelled += int(np.count_nonzero(classes != NO_LABEL))
+            yield classes
+
+    with instrumentation.stage("label"):
+        if type_str == "LAS":
+            las_stream = formats.get_backend("LAS")
+            classes_chunks = count_labelled(_iter_classes(src_path, type_str, label_locations, label_classes, max_distance, chunk_size, workers))
+            las_classes_chunks = (np.where(classes == NO_LABEL, LAS_NO_LABEL, classes) for classes in classes_chunks)
+            n_points = las_stream.copy_with_classification(src_path, dst_path, las_classes_chunks, chunk_size)
+        elif type_str == "PLY":
+            ply_stream = formats.get_backend("PLY")
+            ply_data = ply_stream.read(src_path, mmap='r')
+            n_points = ply_data['vertex'].count
+            if not ply_stream.supports_streaming(ply_data):
+                # text vertices cannot be memory-mapped: every worker process would parse the whole file
+                workers = 1
+            classes_chunks = count_labelled(_iter_classes(src_path, type_str, label_locations, label_classes, max_distance, chunk_size, workers))
+            if ply_stream.supports_streaming(ply_data):
+                ply_stream.write_with_classification(ply_data, (classes.astype(np.float32) for classes in classes_chunks), dst_path, chunk_size)
+            else:
+                _write_text_ply(ply_data, np.concatenate(list(classes_chunks)) if n_points else np.empty(0), dst_path)
+        else:
+            raise ValueError(f"Unknown point cloud type: {type_str}")
+    instrumentation.count("points_written", n_points)
+    logger.info(f"Propagated labels to {n_labelled} of {n_points} points of {src_path}.")
+    return {"n_points": n_points, "n_labelled": n_labelled}
+
+def _write_text_ply(ply_data, classification, dst_path: str):
+    ply_stream = formats.get_backend("PLY")
+    data = ply_data['vertex'].data
+    if ply_stream.CLASSIFICATION_FIELD in data.dtype.names:
+        data = data.copy()
+        data[ply_stream.CLASSIFICATION_FIELD] = classification
+    else:
+        data = ply_stream.append_classification(data, classification)
+    ply_stream.replace_vertex_data(ply_data, data).write(dst_path)
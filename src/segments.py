@@ -0,0 +1,316 @@
+"""
+This module provides a vectorized group-by engine computing per-segment statistics of point clouds.
+"""
+import numpy as np
+
+# integral segment ids are encoded with a dense table instead of a sort if they span less than this many values,
+# and at most _MAX_DENSE_RANGE_PER_POINT values per point, so that a few sparse ids do not allocate a large table
+_MAX_DENSE_RANGE = 1 << 26
+_MAX_DENSE_RANGE_PER_POINT = 8
+
+def encode_segment_ids(segment_ids):
+    """
+    Encode segment ids as dense integer codes.
+
+    Integral ids (even stored as floats, like PLY scalar fields) spanning a range that is both bounded and small
+    relative to the number of points are encoded in O(N) with a lookup table. Other ids fall back to np.unique,
+    which sorts them.
+
+    Parameters:
+    segment_ids (array-like): The segment id of each point.
+
+    Returns:
+    tuple: The sorted distinct segment ids (same dtype as the input) and the code of each point (an index into them).
+    """
+    segment_ids = np.asarray(segment_ids)
+    if len(segment_ids) == 0:
+        return segment_ids[:0], np.empty(0, dtype=np.int64)
+    max_range = min(_MAX_DENSE_RANGE, _MAX_DENSE_RANGE_PER_POINT * len(segment_ids))
+    if segment_ids.dtype.kind in "iu":
+        # in int64, so that the range and offsets of narrow integer ids (e.g. int8 LAS extra bytes) do not overflow
+        low, high = int(segment_ids.min()), int(segment_ids.max())
+        if high - low < max_range:
+            return _encode_dense(segment_ids.astype(np.int64) - low, low, segment_ids.dtype)
+    else:
+        low, high = segment_ids.min(), segment_ids.max()
+        if np.isfinite(low) and np.isfinite(high) and high - low < max_range:
+            offsets = (segment_ids - low).astype(np.int64)
+            if np.array_equal(offsets + low, segment_ids):
+                return _encode_dense(offsets, low, segment_ids.dtype)
+    values, codes = np.unique(segment_ids, return_inverse=True)
+    return values, codes.reshape(-1)
+
+def _encode_dense(offsets, low, dtype):
+    present = np.bincount(offsets) > 0
+    table = np.cumsum(present) - 1
+    values = (np.flatnonzero(present) + low).astype(dtype)
+    return values, table[offsets]
+
+
+def build_lookup_table(mapping: dict):
+    """
+    Build a lookup table from a segment id -> value mapping, to be used with `lookup`.
+
+    Returns:
+    tuple: The sorted segment ids and their values, as two arrays.
+    """
+    keys = np.array(sorted(mapping), dtype=np.float64)
+    values = np.array([mapping[key] for key in sorted(mapping)])
+    return keys, values
+
+
+def lookup(segment_ids, table):
+    """
+    Gather the value of the segment of every point in one vectorized pass.
+
+    Parameters:
+    segment_ids (array-like): The segment id of each point.
+    table (tuple): The lookup table built by `build_lookup_table`.
+
+    Returns:
+    tuple: A boolean array telling which points belong to a mapped segment, and the values of those points.
+    """
+    keys, values = table
+    segment_ids = np.asarray(segment_ids, dtype=np.float64)
+    if len(keys) == 0:
+        return np.zeros(segment_ids.shape, dtype=bool), values[:0]
+    positions = np.searchsorted(keys, segment_ids)
+    np.minimum(positions, len(keys) - 1, out=positions)
+    mapped = keys[positions] == segment_ids
+    return mapped, values[positions[mapped]]
+
+
+class SegmentExtents:
+    """
+    This class holds the extent, centroid and point count of every segment of a point cloud.
+
+    Extents of parts of a cloud (chunks of a stream, slices handled by different processes)
+    can be merged into the extents of the whole cloud.
+    """
+
+    def __init__(self, values, counts, mins, maxs, sums):
+        self.values = np.asarray(values)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.mins = np.asarray(mins, dtype=np.float64)
+        self.maxs = np.asarray(maxs, dtype=np.float64)
+        self.sums = np.asarray(sums, dtype=np.float64)
+
+    @classmethod
+    def compute(cls, segment_ids, *coordinates):
+        """
+        Compute the extents of all the segments in one pass over the points.
+
+        Parameters:
+        segment_ids (array-like): The segment id of each point.
+        coordinates (array-like): One array per axis (e.g. xs, ys, zs) with the coordinates of each point.
+
+        Returns:
+        SegmentExtents: One entry per distinct segment id, sorted by id.
+        """
+        values, codes = encode_segment_ids(segment_ids)
+        n_segments = len(values)
+        n_axes = len(coordinates)
+        counts = np.bincount(codes, minlength=n_segments)
+        mins = np.full((n_segments, n_axes), np.inf)
+        maxs = np.full((n_segments, n_axes), -np.inf)
+        sums = np.empty((n_segments, n_axes))
+        for axis, axis_coordinates in enumerate(coordinates):
+            axis_coordinates = np.asarray(axis_coordinates, dtype=np.float64)
+            np.minimum.at(mins[:, axis], codes, axis_coordinates)
+            np.maximum.at(maxs[:, axis], codes, axis_coordinates)
+            sums[:, axis] = np.bincount(codes, weights=axis_coordinates, minlength=n_segments)
+        return cls(values, counts, mins, maxs, sums)
+
+    @classmethod
+    def merge(cls, parts):
+        """
+        Merge the extents of disjoint parts of a point cloud.
+
+        The parts can be merged as they are computed, chunk by chunk (as Footprints.merge can), so that memory stays
+        bounded by the chunk size and the number of segments whatever the size of the point cloud.
+
+        Parameters:
+        parts (list): SegmentExtents computed on the parts, with the same axes.
+
+        Returns:
+        SegmentExtents: The extents of the union of the parts.
+        """
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls(np.empty(0), np.empty(0), np.empty((0, 0)), np.empty((0, 0)), np.empty((0, 0)))
+        if len(parts) == 1:
+            return parts[0]
+        values, codes = encode_segment_ids(np.concatenate([part.values for part in parts]))
+        n_segments = len(values)
+        n_axes = parts[0].mins.shape[1]
+        counts = np.bincount(codes, weights=np.concatenate([part.counts for part in parts]), minlength=n_segments).astype(np.int64)
+        mins = np.full((n_segments, n_axes), np.inf)
+        maxs = np.full((n_segments, n_axes), -np.inf)
+        sums = np.zeros((n_segments, n_axes))
+        np.minimum.at(mins, codes, np.concatenate([part.mins for part in parts]))
+        np.maximum.at(maxs, codes, np.concatenate([part.maxs for part in parts]))
+        np.add.at(sums, codes, np.concatenate([part.sums for part in parts]))
+        return cls(values, counts, mins, maxs, sums)
+
+    def __len__(self):
+        return len(self.values)
+
+    def get_bbox_centers(self):
+        """
+        Get the center of the bounding box of each segment, as an (K, n_axes) array.
+        """
+        return (self.mins + self.maxs) / 2
+
+    def get_centroids(self):
+        """
+        Get the mean of the points of each segment, as an (K, n_axes) array.
+        """
+        return self.sums / self.counts[:, None]
+
+    def __repr__(self):
+        return f"SegmentExtents(n_segments={len(self)})"
+
+
+class Footprints:
+    """
+    This class holds the 2D footprint of every segment of a point cloud, as a sparse occupancy grid:
+    for each cell of a grid of square cells that contains points, the segments with points in it and their number.
+
+    Footprints of parts of a cloud can be merged, like SegmentExtents. A location is looked up in O(log K)
+    for K occupied cells, and falls inside the footprint of the densest segment of its cell.
+
+    Parameters:
+    cell_size (float): The side of the cells, in the unit of the coordinates.
+    values (array-like): The distinct segment ids, sorted.
+    cells (array-like): An (N, 2) array with the integral coordinates of the cell of each entry.
+    segment_indices (array-like): The segment of each entry, as an index into values.
+    counts (array-like): The number of points of each entry.
+    """
+
+    def __init__(self, cell_size: float, values, cells, segment_indices, counts):
+        if not cell_size > 0:
+            raise ValueError(f"Cell size must be strictly positive, got {cell_size}.")
+        self.cell_size = float(cell_size)
+        self.values = np.asarray(values)
+        self.cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        self.segment_indices = np.asarray(segment_indices, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        # the densest segment of each occupied cell (the lowest segment index on ties), sorted by cell key
+        if len(self.cells):
+            self.origin = self.cells.min(axis=0)
+            self.width = int(self.cells[:, 1].max() - self.origin[1] + 1)
+            keys = self._cell_keys(self.cells)
+            order = np.lexsort((self.segment_indices, -self.counts, keys))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = keys[order[1:]] != keys[order[:-1]]
+            self.cell_keys = keys[order[first]]
+            self.cell_segments = self.segment_indices[order[first]]
+        else:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.width = 0
+            self.cell_keys = np.empty(0, dtype=np.int64)
+            self.cell_segments = np.empty(0, dtype=np.int64)
+
+    def _cell_keys(self, cells):
+        local = cells - self.origin
+        return local[:, 0] * self.width + local[:, 1]
+
+    @classmethod
+    def compute(cls, segment_ids, xs, ys, cell_size: float):
+        """
+        Compute the footprints of all the segments in one pass over the points.
+
+        Parameters:
+        segment_ids (array-like): The segment id of each point.
+        xs, ys (array-like): The 2D coordinates of each point.
+        cell_size (float): The side of the cells of the grid.
+
+        Returns:
+        Footprints: The occupied cells of each segment.
+        """
+        values, codes = encode_segment_ids(segment_ids)
+        cells = np.floor(np.column_stack((np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))) / cell_size).astype(np.int64)
+        cells, segment_indices, counts = _count_entries(cells, codes, np.ones(len(codes), dtype=np.int64), len(values))
+        return cls(cell_size, values, cells, segment_indices, counts)
+
+    @classmethod
+    def merge(cls, parts):
+        """
+        Merge the footprints of disjoint parts of a point cloud, computed with the same cell size.
+
+        Parameters:
+        parts (list): Footprints computed on the parts.
+
+        Returns:
+        Footprints: The footprints of the union of the parts.
+        """
+        parts = list(parts)
+        if not parts:
+            raise ValueError("Cannot merge an empty list of footprints: the cell size is unknown.")
+        if len({part.cell_size for part in parts}) > 1:
+            raise ValueError("Cannot merge footprints computed with different cell sizes.")
+        parts = [part for part in parts if len(part.cells)] or parts[:1]
+        if len(parts) == 1:
+            return parts[0]
+        values, codes = encode_segment_ids(np.concatenate([part.values for part in parts]))
+        offsets = np.cumsum([0] + [len(part.values) for part in parts])
+        segment_indices = np.concatenate([codes[offset:][part.segment_indices] for offset, part in zip(offsets, parts)])
+        cells, segment_indices, counts = _count_entries(np.concatenate([part.cells for part in parts]), segment_indices,
+                                                        np.concatenate([part.counts for part in parts]), len(values))
+        return cls(parts[0].cell_size, values, cells, segment_indices, counts)
+
+    def lookup(self, xs, ys):
+        """
+        Find the segment whose footprint contains each location.
+
+        Returns:
+        np.ndarray: The index (into values) of the densest segment of the cell of each location, -1 if the cell is empty.
+        """
+        cells = np.floor(np.column_stack((np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))) / self.cell_size).astype(np.int64)
+        result = np.full(len(cells), -1, dtype=np.int64)
+        if len(self.cell_keys) == 0:
+            return result
+        local = cells - self.origin
+        inside = np.flatnonzero((local >= 0).all(axis=1) & (local[:, 1] < self.width))
+        keys = self._cell_keys(cells[inside])
+        positions = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[positions] == keys
+        result[inside[found]] = self.cell_segments[positions[found]]
+        return result
+
+    def get_areas(self):
+        """
+        Get the area of the footprint of each segment (its number of occupied cells times the area of a cell).
+        """
+        return np.bincount(self.segment_indices, minlength=len(self.values)) * self.cell_size ** 2
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f"Footprints(n_segments={len(self)}, n_cells={len(self.cell_keys)}, cell_size={self.cell_size})"
+
+
+def _count_entries(cells, segment_indices, counts, n_segments: int):
+    """
+    Sum the counts of the (cell, segment) entries that are repeated.
+
+    Returns:
+    tuple: The distinct cells, segment indices and summed counts.
+    """
+    if len(cells) == 0:
+        return cells.reshape(0, 2), segment_indices[:0], counts[:0]
+    origin = cells.min(axis=0)
+    shape = cells.max(axis=0) - origin + 1
+    if int(shape[0]) * int(shape[1]) * n_segments < 1 << 62:
+        # one integer key per entry: sorting it is much faster than sorting rows
+        local = cells - origin
+        keys = (local[:, 0] * int(shape[1]) + local[:, 1]) * n_segments + segment_indices
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        cell_keys, unique_segments = np.divmod(unique_keys, n_segments)
+        unique_cells = np.column_stack(np.divmod(cell_keys, int(shape[1]))) + origin
+    else:
+        rows, inverse = np.unique(np.column_stack((cells, segment_indices)), axis=0, return_inverse=True)
+        unique_cells, unique_segments = rows[:, :2], rows[:, 2]
+    unique_counts = np.bincount(inverse.reshape(-1), weights=counts, minlength=len(unique_segments)).astype(np.int64)
+    return unique_cells, unique_segments, unique_counts
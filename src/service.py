@@ -0,0 +1,456 @@
+"""
+This module provides a long-running match service: the point clouds of a directory are scanned and indexed once, and
+batches of labels are matched against them over a small local HTTP API (asyncio, TCP or Unix socket).
+
+Endpoints (JSON bodies and responses):
+- GET /health: the state of the index.
+- POST /match: {"labels": [label rows], "max_distance": 2.0, "assignment": "greedy", "weight_by_std_dev": false, "write": false}
+  A label row is an object with the columns of the labels CSV: "longitude", "latitude", "altitude", "label" (class name
+  or index) and optionally "std_dev_longitude", "std_dev_latitude", "std_dev_altitude".
+  The response gives the target (point cloud file, and segment value) of each matched label, and the written files if
+  "write" is true (the labelled outputs main.py would write for these labels).
+- POST /reload: scan the directory again.
+
+The index is also reloaded when the point cloud files change (polled every watch_interval seconds). Concurrent greedy
+requests with the same max_distance are matched together in one vectorized query (see MatchService.batch_window).
+"""
+import asyncio
+import http.client
+import json
+import logging
+import socket
+import threading
+
+import numpy as np
+
+import assignment, catalog, data_loader, label, matcher, output_writer, point_cloud, spatial_index, utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+_STD_DEV_COLUMNS = ("std_dev_longitude", "std_dev_latitude", "std_dev_altitude")
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+def parse_label_rows(rows, class_table_path: str):
+    """
+    Build a LabelSet from label rows given as dictionaries (see the module docstring).
+
+    Returns:
+    label.LabelSet: The labels, in the order of the rows.
+
+    Raises:
+    ValueError: If the rows are not a list of objects, or a label class is unknown.
+    """
+    if not isinstance(rows, list):
+        raise ValueError("'labels' must be a list of label rows.")
+    classes = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise ValueError(f"Label row {i} must be an object, got {type(row).__name__}.")
+        cls = row["label"]
+        if isinstance(cls, str):
+            cls = int(utils.get_label_indices([cls], class_table_path)[0])
+            if cls < 0:
+                raise ValueError(f"Unknown label class '{row['label']}'.")
+        classes.append(int(cls))
+    return label.LabelSet(
+        classes=classes,
+        geolocations=[(float(row["longitude"]), float(row["latitude"]), float(row["altitude"])) for row in rows],
+        std_devs=[tuple(float(row.get(column, 0.0)) for column in _STD_DEV_COLUMNS) for row in rows],
+    )
+
+def get_directory_signature(directory_path: str, depth: int, type_strs=None):
+    """
+    Get the path, size and modification time of the point cloud files of a directory, which tell whether they changed.
+    """
+    return tuple((file_path, *catalog.get_file_signature(file_path).values()) for file_path in data_loader.list_pc_files(directory_path, depth, type_strs))
+
+class ServiceIndex:
+    """
+    This class holds the point clouds of a directory and the locations of the targets labels are matched with:
+    the segments of the point cloud with depth 0, the point clouds otherwise. Grid indices over the target locations
+    are built once per max_distance and kept.
+    """
+
+    def __init__(self, point_clouds, depth: int, signature=None):
+        self.point_clouds = point_clouds
+        self.depth = depth
+        self.signature = signature
+        self.segmented = depth == 0 and bool(point_clouds) and point_clouds[0].n_clusters > 1
+        if self.segmented:
+            self.target_values = list(point_clouds[0].localisations.keys())
+            self.locations = np.array(list(point_clouds[0].localisations.values()), dtype=np.float64).reshape(-1, 2)
+        else:
+            self.target_values = None
+            self.locations = np.array([pc.localisation for pc in point_clouds], dtype=np.float64).reshape(-1, 2)
+        self._grids = {}
+
+    def __len__(self):
+        return len(self.locations)
+
+    def nearest(self, label_locations, max_distance: float):
+        """
+        Find the nearest target of each label within max_distance.
+
+        Returns:
+        tuple: The index of the target of each label (-1 if none) and its distance.
+        """
+        if np.isfinite(max_distance) and max_distance > 0:
+            grid = self._grids.get(max_distance)
+            if grid is None:
+                grid = self._grids[max_distance] = spatial_index.GridIndex(self.locations, max_distance)
+            return grid.query_nearest(label_locations, max_distance)
+        return spatial_index.nearest_neighbours(self.locations, label_locations, max_distance)
+
+    def describe(self, target_index: int) -> dict:
+        """
+        Get the file (and segment value) of a target.
+        """
+        if self.segmented:
+            value = self.target_values[target_index]
+            return {"file": self.point_clouds[0].file_path, "segment": value.item() if hasattr(value, "item") else value}
+        return {"file": self.point_clouds[target_index].file_path}
+
+class _MatchRequest:
+    """
+    A parsed /match request waiting in the batch queue.
+    """
+
+    def __init__(self, labels, max_distance: float, assignment_method: str, weight_by_std_dev: bool, future):
+        self.labels = labels
+        self.max_distance = max_distance
+        self.assignment_method = assignment_method
+        self.weight_by_std_dev = weight_by_std_dev
+        self.future = future
+
+def match_batch(index: ServiceIndex, requests: list) -> list:
+    """
+    Match the labels of several requests with the targets of an index.
+
+    Greedy requests sharing a max_distance are answered by a single nearest neighbour query over all their labels:
+    the nearest target of a label does not depend on the other labels. Optimal requests are solved one by one.
+
+    Returns:
+    list: Two arrays per request, the target index (-1 if none) and distance of each of its labels.
+    """
+    results = [None] * len(requests)
+    groups = {}
+    for position, request in enumerate(requests):
+        if request.assignment_method == "greedy":
+            groups.setdefault(request.max_distance, []).append(position)
+            continue
+        targets = np.full(len(request.labels), -1, dtype=np.int64)
+        distances = np.full(len(request.labels), np.inf)
+        if len(index):
+            std_devs = request.labels.get_std_dev_norms() if request.weight_by_std_dev else None
+            label_ids, target_ids, pair_distances = assignment.assign(index.locations, request.labels.get_2d_locations(), request.max_distance, std_devs)
+            targets[label_ids] = target_ids
+            distances[label_ids] = pair_distances
+        results[position] = (targets, distances)
+    for max_distance, positions in groups.items():
+        label_locations = np.concatenate([requests[position].labels.get_2d_locations() for position in positions])
+        targets, distances = index.nearest(label_locations, max_distance)
+        bounds = np.cumsum([0] + [len(requests[position].labels) for position in positions])
+        for position, start, stop in zip(positions, bounds[:-1], bounds[1:]):
+            results[position] = (targets[start:stop], distances[start:stop])
+    return results
+
+class MatchService:
+    """
+    This class serves match requests against the point clouds of a directory, indexed once and reloaded when they change.
+
+    Parameters:
+    directory_path (str): The directory of the point cloud files.
+    depth (int): The depth of the directory (see data_loader.load_pc_files_from_directory).
+    scalar_field_name (str): The scalar field that discriminates the segments, with depth 0.
+    class_table_path (str): The path to the class table, to read the classes of the label rows.
+    output_path (str): The folder written outputs go to.
+    catalog_path (str): The path of a point cloud catalog, which makes reloads only read the changed files.
+    workers (int): The number of processes scanning the point cloud files.
+    batch_window (float): How long, in seconds, the first request of a batch waits for others to join it.
+    max_batch_labels (int): The number of labels above which a batch is matched without waiting.
+    watch_interval (float): How often, in seconds, the point cloud files are checked for changes (None: never).
+    type_strs (list): The formats of the point cloud files to serve (see formats), all the registered formats by default.
+    """
+
+    def __init__(self, directory_path: str, depth: int = 1, scalar_field_name: str = None, class_table_path: str = "./class_table.csv",
+                 output_path: str = "./output_pc", catalog_path: str = None, workers: int = 1, batch_window: float = 0.005,
+                 max_batch_labels: int = 100_000, watch_interval: float = 5.0, type_strs=None):
+        self.directory_path = directory_path
+        self.depth = depth
+        self.scalar_field_name = scalar_field_name
+        self.class_table_path = class_table_path
+        self.output_path = output_path
+        self.catalog_path = catalog_path
+        self.workers = workers
+        self.batch_window = batch_window
+        self.max_batch_labels = max_batch_labels
+        self.watch_interval = watch_interval
+        self.type_strs = type_strs
+        self.index = None
+        self.n_batches = 0
+        self.n_requests = 0
+        self.port = None
+        self._queue = None
+        self._servers = []
+        self._tasks = []
+        self._write_lock = threading.Lock()
+        self._reload_lock = None
+
+    def load(self) -> ServiceIndex:
+        """
+        Scan the point cloud files (through the catalog, if any) and replace the index.
+        """
+        signature = get_directory_signature(self.directory_path, self.depth, self.type_strs)
+        pc_catalog = catalog.Catalog.load(self.catalog_path) if self.catalog_path else None
+        point_clouds = data_loader.load_pc_files_from_directory(self.directory_path, depth=self.depth, scalar_field_name=self.scalar_field_name,
+                                                                workers=self.workers, catalog=pc_catalog, type_strs=self.type_strs)
+        self.index = ServiceIndex(point_clouds, self.depth, signature)
+        logger.info(f"Indexed {len(self.index)} {'segments' if self.index.segmented else 'point clouds'} of {self.directory_path}.")
+        return self.index
+
+    async def reload(self, force: bool = False) -> bool:
+        """
+        Load the index again if the point cloud files changed (or if force), without blocking the requests being served.
+
+        Returns:
+        bool: True if the index was reloaded.
+        """
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            if not force:
+                signature = await loop.run_in_executor(None, get_directory_signature, self.directory_path, self.depth, self.type_strs)
+                if self.index is not None and signature == self.index.signature:
+                    return False
+            await loop.run_in_executor(None, self.load)
+            return True
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, unix_socket_path: str = None):
+        """
+        Load the index, if not loaded yet, and start serving. With port 0, a free port is chosen (see self.port).
+        """
+        self._queue = asyncio.Queue()
+        self._reload_lock = asyncio.Lock()
+        if self.index is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.load)
+        if port is not None:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+            self.port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+            logger.info(f"Match service listening on http://{host}:{self.port}")
+        if unix_socket_path is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handle_connection, unix_socket_path))
+            logger.info(f"Match service listening on {unix_socket_path}")
+        self._tasks.append(asyncio.create_task(self._batch_loop()))
+        if self.watch_interval:
+            self._tasks.append(asyncio.create_task(self._watch_loop()))
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, unix_socket_path: str = None):
+        await self.start(host, port, unix_socket_path)
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self._servers))
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._tasks = []
+        self._servers = []
+
+    async def match(self, labels, max_distance: float = 2.0, assignment_method: str = "greedy", weight_by_std_dev: bool = False):
+        """
+        Queue labels to be matched in the next batch.
+
+        Returns:
+        tuple: The index the labels were matched against, and the target index and distance of each label.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_MatchRequest(labels, max_distance, assignment_method, weight_by_std_dev, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            n_labels = len(batch[0].labels)
+            deadline = loop.time() + self.batch_window
+            while n_labels < self.max_batch_labels:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                n_labels += len(request.labels)
+            index = self.index
+            try:
+                results = await loop.run_in_executor(None, match_batch, index, batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            self.n_batches += 1
+            for request, (targets, distances) in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result((index, targets, distances))
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                if await self.reload():
+                    logger.info("Point cloud files changed, index reloaded.")
+            except Exception:
+                logger.exception("Could not reload the index, the previous one is kept.")
+
+    def write(self, index: ServiceIndex, labels, max_distance: float, assignment_method: str, weight_by_std_dev: bool) -> list:
+        """
+        Write the outputs main.py would write for the given labels, labelling copies of the indexed point clouds.
+
+        Returns:
+        list: The paths of the written files.
+        """
+        copies = [point_cloud.PointCloud.from_scan(pc.scan()) for pc in index.point_clouds]
+        with self._write_lock:
+            if self.depth == 0:
+                if not copies:
+                    return []
+                matched = [matcher.match_point_cloud_with_labels(copies[0], labels, self.scalar_field_name, max_distance, assignment_method, weight_by_std_dev)]
+                matched = [pc for pc in matched if pc.segment_labels]
+            else:
+                matched = matcher.match_point_clouds_with_labels(copies, labels, max_distance, assignment_method, weight_by_std_dev)
+            if not matched:
+                return []
+            return output_writer.write_point_clouds(matched, self.output_path)
+
+    async def _handle_match(self, body) -> dict:
+        if not isinstance(body, dict):
+            raise ValueError("The body of a match request must be an object.")
+        labels = parse_label_rows(body.get("labels"), self.class_table_path)
+        max_distance = float(body.get("max_distance", 2.0))
+        assignment_method = body.get("assignment", "greedy")
+        weight_by_std_dev = bool(body.get("weight_by_std_dev", False))
+        if assignment_method not in matcher.ASSIGNMENT_METHODS:
+            raise ValueError(f"Unknown assignment method '{assignment_method}', expected one of {matcher.ASSIGNMENT_METHODS}.")
+        # only the requests that are matched are counted
+        self.n_requests += 1
+        index, targets, distances = await self.match(labels, max_distance, assignment_method, weight_by_std_dev)
+        response = {
+            "n_labels": len(labels),
+            "n_matched": int(np.count_nonzero(targets >= 0)),
+            "assignments": [{"label": int(i), **index.describe(targets[i]), "distance": float(distances[i])} for i in np.flatnonzero(targets >= 0)],
+        }
+        if body.get("write"):
+            response["written"] = await asyncio.get_running_loop().run_in_executor(
+                None, self.write, index, labels, max_distance, assignment_method, weight_by_std_dev)
+        return response
+
+    async def _route(self, method: str, path: str, body: bytes):
+        if path == "/health":
+            index = self.index
+            return 200, {"status": "ok", "n_targets": len(index), "segmented": index.segmented, "n_batches": self.n_batches, "n_requests": self.n_requests}
+        if path == "/match":
+            if method != "POST":
+                return 405, {"error": "Use POST to match labels."}
+            return 200, await self._handle_match(json.loads(body or b"{}"))
+        if path == "/reload":
+            if method != "POST":
+                return 405, {"error": "Use POST to reload the index."}
+            await self.reload(force=True)
+            return 200, {"status": "reloaded", "n_targets": len(self.index)}
+        return 404, {"error": f"Unknown path {path}."}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                status, response = 400, {"error": "Malformed request line."}
+            else:
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                    if content_length < 0:
+                        raise ValueError(f"Negative Content-Length {content_length}.")
+                    body = await reader.readexactly(content_length)
+                    status, response = await self._route(request_line[0].upper(), request_line[1], body)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, response = 400, {"error": f"{type(e).__name__}: {e}"}
+                except Exception as e:
+                    logger.exception("Match request failed.")
+                    status, response = 500, {"error": f"{type(e).__name__}: {e}"}
+            payload = json.dumps(response).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, unix_socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_socket_path = unix_socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket_path)
+
+class MatchClient:
+    """
+    A minimal blocking client of the match service, over TCP or a Unix socket.
+
+    Parameters:
+    host (str): The host of the service.
+    port (int): The port of the service.
+    unix_socket_path (str): The Unix socket of the service, used instead of host and port if given.
+    timeout (float): The timeout of a request, in seconds.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, unix_socket_path: str = None, timeout: float = 60.0):
+        self.host = host
+        self.port = port
+        self.unix_socket_path = unix_socket_path
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, body: dict = None) -> dict:
+        """
+        Send a request and return its JSON response. Errors of the service raise a RuntimeError.
+        """
+        if self.unix_socket_path is not None:
+            connection = _UnixHTTPConnection(self.unix_socket_path, self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            payload = json.dumps(body).encode("utf-8") if body is not None else None
+            connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            content = json.loads(response.read() or b"{}")
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"Match service returned {response.status}: {content.get('error')}")
+        return content
+
+    def match(self, label_rows, max_distance: float = 2.0, assignment_method: str = "greedy", weight_by_std_dev: bool = False, write: bool = False) -> dict:
+        return self.request("POST", "/match", {"labels": label_rows, "max_distance": max_distance, "assignment": assignment_method,
+                                               "weight_by_std_dev": weight_by_std_dev, "write": write})
+
+    def health(self) -> dict:
+        return self.request("GET", "/health")
+
+    def reload(self) -> dict:
+        return self.request("POST", "/reload")
@@ -0,0 +1,168 @@
+"""
+This module provides a uniform grid index over 2D points, used to answer nearest neighbour queries in batches.
+"""
+import numpy as np
+
+# offsets of the 3x3 block of cells around the cell of a query point
+_NEIGHBOUR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+# grids with at most this many cells keep the offset of every cell in a dense table instead of binary searching the keys
+_MAX_DENSE_CELLS = 1 << 22
+
+class GridIndex:
+    """
+    This class indexes 2D points in a uniform grid of square cells.
+
+    With a cell size at least as large as the search radius, all the neighbours of a query point
+    are contained in the 3x3 block of cells around it, so a radius query only looks at a handful
+    of candidates instead of every indexed point. Points and queries with non-finite coordinates
+    (e.g. labels without a location) are never paired.
+    """
+
+    def __init__(self, points, cell_size: float):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not cell_size > 0:
+            raise ValueError(f"Cell size must be strictly positive, got {cell_size}.")
+        self.cell_size = float(cell_size)
+        finite = np.flatnonzero(np.isfinite(self.points).all(axis=1))
+        if len(finite) == 0:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.shape = (0, 0)
+            self.order = np.empty(0, dtype=np.int64)
+            self.sorted_keys = np.empty(0, dtype=np.int64)
+            self.cell_starts = None
+            return
+        cells = np.floor(self.points[finite] / self.cell_size).astype(np.int64)
+        self.origin = cells.min(axis=0)
+        self.shape = tuple(int(s) for s in cells.max(axis=0) - self.origin + 1)
+        keys = self._cell_keys(cells)
+        # stable sort so that points sharing a cell keep their original order
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[order]
+        self.order = finite[order]
+        # the points of cell k are sorted_keys[cell_starts[k]:cell_starts[k + 1]]: O(1) lookups for many queries
+        n_cells = self.shape[0] * self.shape[1]
+        if n_cells <= _MAX_DENSE_CELLS:
+            self.cell_starts = np.searchsorted(self.sorted_keys, np.arange(n_cells + 1))
+        else:
+            self.cell_starts = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_keys(self, cells):
+        local = cells - self.origin
+        return local[:, 0] * self.shape[1] + local[:, 1]
+
+    def query_pairs(self, queries, max_distance: float):
+        """
+        Find all the (query, point) pairs that are at most max_distance apart.
+
+        Parameters:
+        queries (array-like): An (M, 2) array of query points.
+        max_distance (float): The search radius, must not exceed the cell size.
+
+        Returns:
+        tuple: Three arrays (query indices, point indices, distances), one entry per pair.
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        if max_distance > self.cell_size:
+            raise ValueError(f"Search radius {max_distance} exceeds the cell size {self.cell_size} of the index.")
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        if len(self.sorted_keys) == 0 or len(queries) == 0:
+            return empty
+
+        finite = np.isfinite(queries).all(axis=1)
+        query_cells = np.floor(np.where(finite[:, None], queries, 0.0) / self.cell_size).astype(np.int64) - self.origin
+        query_ids, point_ids = [], []
+        for dx, dy in _NEIGHBOUR_OFFSETS:
+            cx = query_cells[:, 0] + dx
+            cy = query_cells[:, 1] + dy
+            inside = finite & (cx >= 0) & (cx < self.shape[0]) & (cy >= 0) & (cy < self.shape[1])
+            q = np.flatnonzero(inside)
+            keys = cx[q] * self.shape[1] + cy[q]
+            if self.cell_starts is not None:
+                starts = self.cell_starts[keys]
+                counts = self.cell_starts[keys + 1] - starts
+            else:
+                starts = np.searchsorted(self.sorted_keys, keys, side="left")
+                counts = np.searchsorted(self.sorted_keys, keys, side="right") - starts
+            q = np.repeat(q, counts)
+            # position of every candidate inside the sorted points
+            offsets = np.arange(len(q)) - np.repeat(np.cumsum(counts) - counts, counts)
+            query_ids.append(q)
+            point_ids.append(self.order[np.repeat(starts, counts) + offsets])
+        query_ids = np.concatenate(query_ids)
+        point_ids = np.concatenate(point_ids)
+        if len(query_ids) == 0:
+            return empty
+
+        diff = self.points[point_ids] - queries[query_ids]
+        distances = np.sqrt(diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1])
+        within = distances <= max_distance
+        return query_ids[within], point_ids[within], distances[within]
+
+    def query_nearest(self, queries, max_distance: float):
+        """
+        Find the nearest indexed point of each query point, within max_distance.
+
+        Ties are broken in favour of the point with the lowest index, as a linear scan would.
+
+        Parameters:
+        queries (array-like): An (M, 2) array of query points.
+        max_distance (float): The search radius, must not exceed the cell size.
+
+        Returns:
+        tuple: Two arrays of length M, the index of the nearest point (-1 if none is within reach) and its distance (inf if none).
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        nearest = np.full(len(queries), -1, dtype=np.int64)
+        nearest_distances = np.full(len(queries), np.inf)
+        query_ids, point_ids, distances = self.query_pairs(queries, max_distance)
+        if len(query_ids) == 0:
+            return nearest, nearest_distances
+        order = np.lexsort((point_ids, distances, query_ids))
+        query_ids, point_ids, distances = query_ids[order], point_ids[order], distances[order]
+        first = np.ones(len(query_ids), dtype=bool)
+        first[1:] = query_ids[1:] != query_ids[:-1]
+        nearest[query_ids[first]] = point_ids[first]
+        nearest_distances[query_ids[first]] = distances[first]
+        return nearest, nearest_distances
+
+
+def nearest_neighbours(points, queries, max_distance: float, chunk_size: int = 4096):
+    """
+    Find, for each query point, the nearest of the given points within max_distance.
+
+    Parameters:
+    points (array-like): An (N, 2) array of points to search.
+    queries (array-like): An (M, 2) array of query points.
+    max_distance (float): The maximum distance admissible between a query and its neighbour.
+    chunk_size (int): The maximum number of queries compared at once when no grid can be built (infinite max_distance).
+
+    Returns:
+    tuple: Two arrays of length M, the index of the nearest point (-1 if none is within reach) and its distance.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+    if np.isfinite(max_distance) and max_distance > 0:
+        return GridIndex(points, max_distance).query_nearest(queries, max_distance)
+
+    # without a finite radius every point is a candidate, so compare chunk by chunk
+    nearest = np.full(len(queries), -1, dtype=np.int64)
+    nearest_distances = np.full(len(queries), np.inf)
+    if len(points) == 0:
+        return nearest, nearest_distances
+    # keep the (queries x points) distance block to a few million entries
+    chunk_size = max(1, min(chunk_size, 2**22 // len(points)))
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries[start:start + chunk_size]
+        diff = points[None, :, :] - chunk[:, None, :]
+        distances = np.sqrt(diff[..., 0] * diff[..., 0] + diff[..., 1] * diff[..., 1])
+        # non-finite points or queries are never the nearest
+        distances[np.isnan(distances)] = np.inf
+        best = np.argmin(distances, axis=1)
+        best_distances = distances[np.arange(len(chunk)), best]
+        within = np.isfinite(best_distances) & (best_distances <= max_distance)
+        nearest[start:start + chunk_size] = np.where(within, best, -1)
+        nearest_distances[start:start + chunk_size] = np.where(within, best_distances, np.inf)
+    return nearest, nearest_distances
@@ -1,6 +1,10 @@
 """
 Several utils functions for point cloud processing and coordinates transformations.
 """
+import functools
+import os
+
+import numpy as np
 
 def convert_wgs84_to_lv95(lon, lat, alt):
     """
@@ -63,40 +67,178 @@ def convert_lv95_to_wgs84(x, y, z):
 
     return lat, lon, alt
 
-def get_label_name(label_index:int, csv_table_path:str) -> str:
+def convert_wgs84_to_lv95_array(lon, lat, alt=None):
     """
-    Get the label name from a CSV table given its index.
+    Convert arrays of coordinates from WGS84 (degrees) to LV95, in one vectorized pass.
+
+    Parameters:
+    lon (array-like): Longitudes in degrees (WGS84).
+    lat (array-like): Latitudes in degrees (WGS84).
+    alt (array-like): Altitudes in meters (WGS84), or None if only the planimetric coordinates are needed.
+
+    Returns:
+    tuple: Three float64 arrays with the x (north), y (east) and z coordinates in LV95 (z is None if alt is None).
+    """
+    # same formulas as convert_wgs84_to_lv95, written with products instead of powers to keep them cheap on large arrays
+    phi = (np.asarray(lat, dtype=np.float64) * 3600 - 169028.66) / 10000
+    lambda_ = (np.asarray(lon, dtype=np.float64) * 3600 - 26782.5) / 10000
+    phi2 = phi * phi
+    lambda2 = lambda_ * lambda_
+
+    y = 2600072.37 + lambda_ * (211455.93 - 10938.51 * phi - 0.36 * phi2 - 44.54 * lambda2)
+    x = 1200147.07 + 308807.95 * phi + 3745.25 * lambda2 + 76.63 * phi2 - 194.56 * lambda2 * phi + 119.79 * phi2 * phi
+    z = None
+    if alt is not None:
+        z = np.asarray(alt, dtype=np.float64) - 49.55 + 2.73 * lambda_ + 6.94 * phi
+    return x, y, z
+
+
+def convert_lv95_to_wgs84_array(x, y, z=None):
+    """
+    Convert arrays of coordinates from LV95 to WGS84 (degrees), in one vectorized pass.
+
+    Parameters:
+    x (array-like): X (north) coordinates in LV95.
+    y (array-like): Y (east) coordinates in LV95.
+    z (array-like): Z coordinates in LV95, or None if only the planimetric coordinates are needed.
+
+    Returns:
+    tuple: Three float64 arrays with the latitudes, longitudes in degrees and altitudes in meters (altitudes are None if z is None).
+    """
+    y_aux = (np.asarray(y, dtype=np.float64) - 2600000) / 1000000
+    x_aux = (np.asarray(x, dtype=np.float64) - 1200000) / 1000000
+    y_aux2 = y_aux * y_aux
+    x_aux2 = x_aux * x_aux
+
+    lat = (16.9023892 + 3.238272 * x_aux - 0.270978 * y_aux2 - 0.002528 * x_aux2 - 0.0447 * y_aux2 * x_aux - 0.0140 * x_aux2 * x_aux) * 100 / 36
+    lon = (2.6779094 + 4.728982 * y_aux + 0.791484 * y_aux * x_aux + 0.1306 * y_aux * x_aux2 - 0.0436 * y_aux2 * y_aux) * 100 / 36
+    alt = None
+    if z is not None:
+        alt = np.asarray(z, dtype=np.float64) + 49.55 - 12.60 * y_aux - 22.64 * x_aux
+    return lat, lon, alt
+
+
+def is_wgs84(xs, ys) -> bool:
+    """
+    Tell whether an array of planimetric coordinates is in WGS84 (degrees) rather than LV95 (meters).
+
+    The heuristic is evaluated once for the whole array: all the coordinates must agree. Non-finite coordinates
+    (e.g. a label row with a missing location) are ignored.
+
+    Parameters:
+    xs (array-like): The first coordinates (longitude or east).
+    ys (array-like): The second coordinates (latitude or north).
+
+    Returns:
+    bool: True if the coordinates are in WGS84.
+    """
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    xs, ys = xs[finite], ys[finite]
+    in_degrees = (xs < 180) & (ys < 90)
+    if in_degrees.all():
+        return in_degrees.size > 0
+    if in_degrees.any():
+        raise ValueError("Coordinates mix WGS84 and LV95 values, cannot convert them in one go.")
+    return False
+
+
+def to_lv95_2d(xs, ys):
+    """
+    Get the LV95 2D locations of an array of coordinates that are either in WGS84 or already in LV95.
+
+    Parameters:
+    xs (array-like): The first coordinates (longitude or east).
+    ys (array-like): The second coordinates (latitude or north).
+
+    Returns:
+    np.ndarray: An (N, 2) array of (north, east) LV95 coordinates, the convention used for all localisations.
+                Rows with non-finite coordinates are NaN, so that they match nothing.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    if finite.all():
+        if is_wgs84(xs, ys):
+            north, east, _ = convert_wgs84_to_lv95_array(xs, ys)
+            return np.column_stack((north, east))
+        return np.column_stack((ys, xs))
+    locations = np.full((len(xs), 2), np.nan)
+    locations[finite] = to_lv95_2d(xs[finite], ys[finite])
+    return locations
+
+def load_class_table(csv_table_path:str) -> dict:
+    """
+    Load the reference label table, once per path and version of the file: later calls return the cached table
+    until the file is modified.
 
     Parameters:
-    label_index (int): The index of the label.
     csv_table_path (str): The path to the CSV file containing the label table.
 
     Returns:
-    str: The name of the label corresponding to the given index.
+    dict: A dictionary mapping label indices to label names. It is shared between callers and must not be modified.
     """
+    return _read_class_table(csv_table_path, os.stat(csv_table_path).st_mtime_ns)
+
+@functools.lru_cache(maxsize=None)
+def _read_class_table(csv_table_path:str, mtime_ns:int) -> dict:
+    # mtime_ns is only part of the cache key
     with open(csv_table_path, 'r') as file:
         labels_dict = {}
         lines = file.readlines()
         for line in lines[1:]:  # Skip header
             parts = line.strip().split(';')
             labels_dict[int(parts[0])] = parts[1]
-    return labels_dict.get(label_index, "Unknown")
+    return labels_dict
+
+def _load_class_indices(csv_table_path:str) -> dict:
+    return _invert_class_table(csv_table_path, os.stat(csv_table_path).st_mtime_ns)
+
+@functools.lru_cache(maxsize=None)
+def _invert_class_table(csv_table_path:str, mtime_ns:int) -> dict:
+    return {name: index for index, name in _read_class_table(csv_table_path, mtime_ns).items()}
+
+def get_label_name(label_index:int, csv_table_path:str) -> str:
+    """
+    Get the label name from a CSV table given its index.
+
+    Parameters:
+    label_index (int): The index of the label.
+    csv_table_path (str): The path to the CSV file containing the label table.
+
+    Returns:
+    str: The name of the label corresponding to the given index.
+    """
+    return load_class_table(csv_table_path).get(label_index, "Unknown")
 
 def get_label_index(label_name:str, csv_table_path:str) -> int:
     """
     Get the label index from a CSV table given its name.
 
     Parameters:
-    label_name (str): The name of the label.
+    label_name (str): The name of the label, surrounding whitespace ignored.
     csv_table_path (str): The path to the CSV file containing the label table.
 
     Returns:
-    int: The index of the label corresponding to the given name.
+    int: The index of the label corresponding to the given name (-1 if it is missing from the table).
     """
-    with open(csv_table_path, 'r') as file:
-        labels_dict = {}
-        lines = file.readlines()
-        for line in lines[1:]:  # Skip header
-            parts = line.strip().split(';')
-            labels_dict[parts[1]] = int(parts[0])
-    return labels_dict.get(label_name, -1)
\ No newline at end of file
+    return _load_class_indices(csv_table_path).get(label_name.strip(), -1)
+
+def get_label_indices(label_names, csv_table_path:str) -> np.ndarray:
+    """
+    Get the label indices of an array of label names, looking up each distinct name only once.
+
+    Parameters:
+    label_names (array-like): The names of the labels.
+    csv_table_path (str): The path to the CSV file containing the label table.
+
+    Returns:
+    np.ndarray: The indices of the labels (-1 for names missing from the table).
+    """
+    class_indices = _load_class_indices(csv_table_path)
+    codes = {}
+    # encode the names as small integers first, so that the table lookup happens once per distinct name
+    inverse = np.fromiter((codes.setdefault(name, len(codes)) for name in np.asarray(label_names).tolist()), dtype=np.int64)
+    lookup = np.array([class_indices.get(name.strip(), -1) for name in codes], dtype=np.int64)
+    return lookup[inverse]
@@ -0,0 +1,96 @@
+import filecmp
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import laspy
+import numpy as np
+import plyfile
+import data_loader, label, point_cloud, segments
+
+def _segmented_points(n_points, n_segments, seed):
+    rng = np.random.default_rng(seed)
+    segment_ids = rng.integers(0, n_segments, n_points)
+    xs = 2600000.0 + 10.0 * segment_ids + rng.uniform(-2, 2, n_points)
+    ys = 1200000.0 + rng.uniform(-2, 2, n_points)
+    zs = rng.uniform(0, 20, n_points)
+    return segment_ids, xs, ys, zs
+
+def test_segment_ids_are_encoded_like_a_sort():
+    rng = np.random.default_rng(2)
+    # dense ids, a few ids spread over a range much larger than the number of points, float ids, and narrow integer
+    # ids whose range overflows their own type
+    for segment_ids in (rng.integers(5, 40, 1000), np.array([3, 50_000_000, 3, 7_000_000]), rng.integers(0, 30, 500).astype(np.float32) / 2,
+                        np.array([-100, 100, 5], dtype=np.int8), np.array([-1, 32767, 5, 5], dtype=np.int16)):
+        values, codes = segments.encode_segment_ids(segment_ids)
+        expected_values, expected_codes = np.unique(segment_ids, return_inverse=True)
+        assert np.array_equal(values, expected_values) and values.dtype == segment_ids.dtype
+        assert np.array_equal(codes, expected_codes.reshape(-1))
+    print("Segment id encoding test passed.")
+
+def test_chunk_parallel_scan_and_labels_match_sequential():
+    segment_ids, xs, ys, zs = _segmented_points(5000, 12, 7)
+    mapping = {3: label.Label(5, (0.0, 0.0, 0.0)), 7: label.Label(2, (0.0, 0.0, 0.0))}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vertices = np.zeros(len(xs), dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('scalar_PredInstance', '<f4')])
+        vertices['x'], vertices['y'], vertices['z'], vertices['scalar_PredInstance'] = xs, ys, zs, segment_ids
+        ply_path = os.path.join(tmp_dir, 'tile.ply')
+        plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex')]).write(ply_path)
+
+        header = laspy.LasHeader(point_format=0, version="1.2")
+        header.scales = [0.001, 0.001, 0.001]
+        header.offsets = [2600000.0, 1200000.0, 0.0]
+        header.add_extra_dim(laspy.ExtraBytesParams(name="PredInstance", type=np.int32))
+        las_data = laspy.LasData(header)
+        las_data.x, las_data.y, las_data.z = xs, ys, zs
+        las_data.PredInstance = segment_ids
+        las_path = os.path.join(tmp_dir, 'tile.las')
+        las_data.write(las_path)
+
+        for file_path, type_str, field in ((ply_path, "PLY", 'scalar_PredInstance'), (las_path, "LAS", 'PredInstance')):
+            sequential = data_loader.load_pc_file(file_path, field)
+            chunked = point_cloud.PointCloud.from_segmented_file(file_path, type_str, field, workers=2, chunk_size=700)
+            assert chunked.pc is None
+            assert chunked.n_clusters == sequential.n_clusters == 12
+            assert chunked.bbox == sequential.bbox
+            assert chunked.localisations == sequential.localisations
+            assert np.array_equal(chunked.segment_extents.counts, sequential.segment_extents.counts)
+
+            sequential.apply_labels(mapping)
+            chunked.apply_labels(mapping)
+            assert np.array_equal(chunked.get_classification(), sequential.get_classification())
+    print("Chunk-parallel segments test passed.")
+
+def test_chunk_parallel_las_relabel_is_written_without_loading():
+    segment_ids, xs, ys, zs = _segmented_points(5000, 12, 11)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        header = laspy.LasHeader(point_format=0, version="1.2")
+        header.scales = [0.001, 0.001, 0.001]
+        header.offsets = [2600000.0, 1200000.0, 0.0]
+        header.add_extra_dim(laspy.ExtraBytesParams(name="PredInstance", type=np.int32))
+        las_data = laspy.LasData(header)
+        las_data.x, las_data.y, las_data.z = xs, ys, zs
+        las_data.classification = np.full(len(xs), 1, dtype=np.uint8)
+        las_data.PredInstance = segment_ids
+        las_path = os.path.join(tmp_dir, 'tile.las')
+        las_data.write(las_path)
+
+        sequential = data_loader.load_pc_file(las_path, 'PredInstance')
+        chunked = point_cloud.PointCloud.from_segmented_file(las_path, "LAS", 'PredInstance', workers=2, chunk_size=700)
+        for pc in (sequential, chunked):
+            pc.apply_labels({4: label.Label(6, (0.0, 0.0, 0.0))})
+            pc.apply_labels({9: label.Label(3, (0.0, 0.0, 0.0))})
+        assert chunked.pc is None and chunked.classification is not None
+        chunked.store_pc(os.path.join(tmp_dir, 'chunked'), chunk_size=900)
+        assert chunked.pc is None
+        sequential.store_pc(os.path.join(tmp_dir, 'sequential'))
+        output_paths = [pc.get_output_path(os.path.join(tmp_dir, name)) for pc, name in ((chunked, 'chunked'), (sequential, 'sequential'))]
+        assert filecmp.cmp(*output_paths, shallow=False)
+        assert np.array_equal(laspy.read(output_paths[0]).classification, np.select([segment_ids == 4, segment_ids == 9], [6, 3], 1))
+    print("Chunk-parallel LAS relabel test passed.")
+
+if __name__ == "__main__":
+    test_segment_ids_are_encoded_like_a_sort()
+    test_chunk_parallel_scan_and_labels_match_sequential()
+    test_chunk_parallel_las_relabel_is_written_without_loading()
@@ -2,6 +2,7 @@ import os
 import sys
 include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
 sys.path.insert(0, include_path)
+import numpy as np
 import utils
 
 def test_wgs84_to_lv95_and_back():
@@ -20,5 +21,50 @@ def test_wgs84_to_lv95_and_back():
     assert abs(alt - alt_converted) < 0.1
     print("WGS84 to LV95 and back conversion test passed.")
 
+def test_array_conversions_match_scalar_ones():
+    lons = np.array([7.44744, 6.7113081, 8.5])
+    lats = np.array([46.94809, 46.5923453, 47.3])
+    alts = np.array([540.0, 915.8, 400.0])
+
+    xs, ys, zs = utils.convert_wgs84_to_lv95_array(lons, lats, alts)
+    for i in range(len(lons)):
+        x, y, z = utils.convert_wgs84_to_lv95(lons[i], lats[i], alts[i])
+        assert np.isclose(xs[i], x, rtol=0, atol=1e-6)
+        assert np.isclose(ys[i], y, rtol=0, atol=1e-6)
+        assert np.isclose(zs[i], z, rtol=0, atol=1e-6)
+
+    back_lats, back_lons, back_alts = utils.convert_lv95_to_wgs84_array(xs, ys, zs)
+    for i in range(len(lons)):
+        lat, lon, alt = utils.convert_lv95_to_wgs84(xs[i], ys[i], zs[i])
+        assert np.isclose(back_lats[i], lat, rtol=0, atol=1e-12)
+        assert np.isclose(back_lons[i], lon, rtol=0, atol=1e-12)
+        assert np.isclose(back_alts[i], alt, rtol=0, atol=1e-9)
+    print("Array conversion test passed.")
+
+def test_to_lv95_2d_detects_coordinate_system_once():
+    lons = np.array([7.44744, 6.7113081])
+    lats = np.array([46.94809, 46.5923453])
+    locations = utils.to_lv95_2d(lons, lats)
+    x, y, _ = utils.convert_wgs84_to_lv95(lons[0], lats[0], 0.0)
+    assert np.allclose(locations[0], (x, y))
+
+    # LV95 inputs are (east, north) and come out as (north, east), like the converted ones
+    easts = np.array([2600000.0, 2544324.5])
+    norths = np.array([1200000.0, 1160275.6])
+    assert np.array_equal(utils.to_lv95_2d(easts, norths), np.column_stack((norths, easts)))
+
+    # a row without a location gets a NaN location instead of making the others ambiguous
+    with_missing = utils.to_lv95_2d([lons[0], np.nan, lons[1]], [lats[0], np.nan, lats[1]])
+    assert np.array_equal(with_missing[[0, 2]], locations) and np.isnan(with_missing[1]).all()
+
+    try:
+        utils.to_lv95_2d([7.4, 2600000.0], [46.9, 1200000.0])
+        assert False, "Mixed coordinate systems should be rejected"
+    except ValueError:
+        pass
+    print("LV95 2D location test passed.")
+
 if __name__ == "__main__":
-    test_wgs84_to_lv95_and_back()
\ No newline at end of file
+    test_wgs84_to_lv95_and_back()
+    test_array_conversions_match_scalar_ones()
+    test_to_lv95_2d_detects_coordinate_system_once()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+import sys
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import laspy
+import numpy as np
+import label, matcher, point_cloud, segments
+
+def test_footprints_match_per_segment_cells():
+    rng = np.random.default_rng(1)
+    segment_ids = rng.integers(0, 30, 20000).astype(np.float32)
+    xs, ys = rng.uniform(0, 50, 20000), rng.uniform(0, 50, 20000)
+    footprints = segments.Footprints.compute(segment_ids, xs, ys, 2.0)
+    cells = np.floor(np.column_stack((xs, ys)) / 2.0).astype(np.int64)
+    for i, value in enumerate(footprints.values):
+        expected = {tuple(cell) for cell in cells[segment_ids == value]}
+        assert {tuple(cell) for cell in footprints.cells[footprints.segment_indices == i]} == expected
+    assert footprints.counts.sum() == len(segment_ids)
+
+    # a location falls in the densest segment of its cell
+    queries = rng.uniform(-5, 55, (500, 2))
+    query_cells = np.floor(queries / 2.0).astype(np.int64)
+    found = footprints.lookup(queries[:, 0], queries[:, 1])
+    for query_cell, segment_index in zip(query_cells, found):
+        in_cell = (cells == query_cell).all(axis=1)
+        if not in_cell.any():
+            assert segment_index == -1
+            continue
+        counts = np.bincount(np.searchsorted(footprints.values, segment_ids[in_cell]), minlength=len(footprints.values))
+        assert segment_index == np.argmax(counts)
+
+    # footprints of chunks merge into the footprints of the whole cloud
+    parts = [segments.Footprints.compute(segment_ids[i:i + 3000], xs[i:i + 3000], ys[i:i + 3000], 2.0) for i in range(0, 20000, 3000)]
+    merged = segments.Footprints.merge(parts)
+    assert np.array_equal(merged.values, footprints.values)
+    assert np.array_equal(merged.cell_keys, footprints.cell_keys)
+    assert np.array_equal(merged.cell_segments, footprints.cell_segments)
+    print("Footprints test passed.")
+
+def test_label_inside_a_leaning_crown_matches_its_segment():
+    header = laspy.LasHeader(point_format=0, version="1.2")
+    header.add_extra_dim(laspy.ExtraBytesParams(name="PredInstance", type=np.float32))
+    header.scales = [0.001, 0.001, 0.001]
+    header.offsets = [2600000.0, 1200000.0, 0.0]
+    rng = np.random.default_rng(2)
+    # segment 1 leans east: its bbox center is far from its trunk; segment 2 stands 3m north of the trunk of segment 1
+    xs = np.concatenate([2600000.0 + rng.uniform(0, 8, 400), 2600000.5 + rng.uniform(-0.5, 0.5, 200)])
+    ys = np.concatenate([1200000.0 + rng.uniform(-0.5, 0.5, 400), 1200003.0 + rng.uniform(-0.5, 0.5, 200)])
+    las_data = laspy.LasData(header)
+    las_data.x, las_data.y = xs, ys
+    las_data.z = np.zeros(600)
+    las_data.PredInstance = np.repeat(np.array([1.0, 2.0], dtype=np.float32), [400, 200])
+    pc = point_cloud.PointCloud(las_data, type_str="LAS", discriminative_scalar_field_name="PredInstance")
+
+    # a label at the trunk of segment 1 (x = 2600000.2): nearer to the center of segment 2 than to the center of segment 1
+    trunk = label.Label(3, (2600000.2, 1200000.0, 0.0))
+    for assignment_method in matcher.ASSIGNMENT_METHODS:
+        pc.segment_labels = {}
+        matcher.match_point_cloud_with_labels(pc, [trunk], "PredInstance", max_distance=10.0, assignment_method=assignment_method)
+        assert list(pc.segment_labels) == [2.0]
+        pc.segment_labels = {}
+        matcher.match_point_cloud_with_labels(pc, [trunk], "PredInstance", max_distance=10.0, assignment_method=assignment_method, footprint_cell_size=0.5)
+        assert list(pc.segment_labels) == [1.0]
+    print("Footprint matching test passed.")
+
+if __name__ == "__main__":
+    test_footprints_match_per_segment_cells()
+    test_label_inside_a_leaning_crown_matches_its_segment()
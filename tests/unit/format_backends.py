@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import json
+import subprocess
+import laspy
+import numpy as np
+import plyfile
+import data_loader, formats
+
+def test_formats_are_selected_and_their_backends_imported_lazily():
+    assert formats.get_type_str('a/tree.las') == "LAS" and formats.get_type_str('a/tree.ply') == "PLY"
+    assert formats.get_type_str('a/tree.txt') is None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        header = laspy.LasHeader(point_format=0, version="1.2")
+        header.offsets = [2600000.0, 1200000.0, 0.0]
+        las_data = laspy.LasData(header)
+        las_data.x, las_data.y, las_data.z = 2600000.0 + np.arange(10.0), 1200000.0 + np.arange(10.0), np.zeros(10)
+        las_data.write(os.path.join(tmp_dir, 'a.las'))
+        vertices = np.zeros(10, dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+        plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex')]).write(os.path.join(tmp_dir, 'b.ply'))
+
+        assert [os.path.basename(path) for path in data_loader.list_pc_files(tmp_dir)] == ['a.las', 'b.ply']
+        assert [os.path.basename(path) for path in data_loader.list_pc_files(tmp_dir, type_strs=["PLY"])] == ['b.ply']
+
+        # a LAS-only job in a new interpreter never imports the PLY backend
+        code = (f"import sys, json; sys.path.insert(0, {include_path!r}); import data_loader; "
+                f"pcs = data_loader.load_pc_files_from_directory({tmp_dir!r}, depth=1, type_strs=['LAS']); "
+                "print(json.dumps([len(pcs), pcs[0].localisation, 'plyfile' in sys.modules]))")
+        n_point_clouds, localisation, imported_plyfile = json.loads(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout)
+        assert n_point_clouds == 1 and not imported_plyfile
+        assert np.allclose(localisation, data_loader.load_pc_file(os.path.join(tmp_dir, 'a.las'), lazy=True).localisation)
+    print("Format backends test passed.")
+
+if __name__ == "__main__":
+    test_formats_are_selected_and_their_backends_imported_lazily()
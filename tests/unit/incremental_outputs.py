@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import filecmp
+import numpy as np
+import plyfile
+import incremental, label, point_cloud
+
+def _write_segmented_ply(file_path):
+    rng = np.random.default_rng(4)
+    vertices = np.zeros(2000, dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('scalar_PredInstance', '<f4'), ('scalar_Classification', '<f4')])
+    vertices['x'] = rng.uniform(2600000, 2600100, 2000)
+    vertices['y'] = rng.uniform(1200000, 1200100, 2000)
+    vertices['scalar_PredInstance'] = rng.integers(0, 5, 2000)
+    vertices['scalar_Classification'] = 9
+    plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex')]).write(file_path)
+
+def _labelled(file_path, classes):
+    pc = point_cloud.PointCloud(plyfile.PlyData.read(file_path), type_str="PLY", discriminative_scalar_field_name="scalar_PredInstance", file_path=file_path)
+    pc.apply_labels({np.float32(value): label.Label(cls, (float(value), 0.0, 0.0)) for value, cls in classes.items()})
+    return pc
+
+def test_incremental_store_only_touches_changed_outputs():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, 'segments.ply')
+        _write_segmented_ply(source_path)
+        output_dir = os.path.join(tmp_dir, 'output_pc')
+        full_dir = os.path.join(tmp_dir, 'full')
+
+        stats = incremental.store_point_clouds([_labelled(source_path, {1: 3, 2: 4, 3: 5})], output_dir)
+        assert stats["written"] == 1
+        output_path = os.path.join(output_dir, 'pc_with_labels.ply')
+        signature = os.stat(output_path).st_mtime_ns
+        stats = incremental.store_point_clouds([_labelled(source_path, {1: 3, 2: 4, 3: 5})], output_dir)
+        assert stats["unchanged"] == 1 and os.stat(output_path).st_mtime_ns == signature
+
+        # segment 2 changes class, segment 3 loses its label: updated in place, same content as a full write
+        pc = _labelled(source_path, {1: 3, 2: 7})
+        stats = incremental.store_point_clouds([pc], output_dir)
+        assert stats["updated"] == 1
+        pc.store_pc(full_dir)
+        assert filecmp.cmp(output_path, os.path.join(full_dir, 'pc_with_labels.ply'), shallow=False)
+
+        # an output that is not produced anymore is removed
+        stats = incremental.store_point_clouds([], output_dir)
+        assert stats["removed"] == 1 and not os.path.exists(output_path)
+    print("Incremental store test passed.")
+
+if __name__ == "__main__":
+    test_incremental_store_only_touches_changed_outputs()
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import filecmp
+import laspy
+import numpy as np
+import plyfile
+import label, propagation
+
+def _brute_force_classes(xs, ys, labels, max_distance):
+    # LV95 clouds: (x, y) are (east, north), label geolocations are given as (east, north) too
+    label_xy = np.array([lbl.geolocation[:2] for lbl in labels])
+    distances = np.hypot(xs[:, None] - label_xy[None, :, 0], ys[:, None] - label_xy[None, :, 1])
+    nearest = np.argmin(distances, axis=1)
+    classes = np.array([lbl.label for lbl in labels])[nearest]
+    return np.where(distances[np.arange(len(xs)), nearest] <= max_distance, classes, propagation.NO_LABEL)
+
+def test_each_point_gets_the_class_of_its_nearest_label():
+    rng = np.random.default_rng(3)
+    n_points = 5000
+    xs = 2600000.0 + rng.uniform(0, 40, n_points)
+    ys = 1200000.0 + rng.uniform(0, 40, n_points)
+    labels = [label.Label(int(cls), (2600000.0 + x, 1200000.0 + y, 0.0)) for cls, x, y in zip(rng.integers(1, 8, 30), rng.uniform(0, 40, 30), rng.uniform(0, 40, 30))]
+    expected = _brute_force_classes(xs, ys, labels, 3.0)
+    assert (expected == propagation.NO_LABEL).any() and (expected != propagation.NO_LABEL).any()
+    # a label whose name is missing from the class table is dropped, even where it is the nearest one
+    unknown_labels = labels + [label.Label(-1, (xs[0], ys[0], 0.0))]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        header = laspy.LasHeader(point_format=0, version="1.2")
+        header.scales = [0.0001, 0.0001, 0.0001]
+        header.offsets = [2600000.0, 1200000.0, 0.0]
+        las_data = laspy.LasData(header)
+        las_data.x, las_data.y, las_data.z = xs, ys, np.zeros(n_points)
+        las_path = os.path.join(tmp_dir, 'tile.las')
+        las_data.write(las_path)
+        las_data = laspy.read(las_path)
+        expected_las = _brute_force_classes(np.asarray(las_data.x), np.asarray(las_data.y), labels, 3.0)
+
+        vertices = np.zeros(n_points, dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+        vertices['x'], vertices['y'] = xs, ys
+        ply_path = os.path.join(tmp_dir, 'tile.ply')
+        plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex')]).write(ply_path)
+
+        for workers in (1, 2):
+            output_las = os.path.join(tmp_dir, f'labelled_{workers}.las')
+            stats = propagation.propagate_labels_to_file(las_path, output_las, "LAS", unknown_labels, 3.0, chunk_size=700, workers=workers)
+            assert stats == {"n_points": n_points, "n_labelled": int(np.count_nonzero(expected_las != propagation.NO_LABEL))}
+            assert np.array_equal(laspy.read(output_las).classification, np.where(expected_las == propagation.NO_LABEL, propagation.LAS_NO_LABEL, expected_las))
+
+            output_ply = os.path.join(tmp_dir, f'labelled_{workers}.ply')
+            propagation.propagate_labels_to_file(ply_path, output_ply, "PLY", labels, 3.0, chunk_size=700, workers=workers)
+            assert np.array_equal(plyfile.PlyData.read(output_ply)['vertex'].data['scalar_Classification'], expected)
+        assert filecmp.cmp(os.path.join(tmp_dir, 'labelled_1.ply'), os.path.join(tmp_dir, 'labelled_2.ply'), shallow=False)
+    print("Label propagation test passed.")
+
+if __name__ == "__main__":
+    test_each_point_gets_the_class_of_its_nearest_label()
@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import numpy as np
+import data_loader, label, utils
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+LABELS_CSV = os.path.join(REPO_ROOT, 'data', 'labels', '2025_10_13_aggregated_species_geolocation_and_labels.csv')
+CLASS_TABLE_CSV = os.path.join(REPO_ROOT, 'class_table.csv')
+
+def test_label_set_matches_row_by_row_parsing():
+    labels = data_loader.load_labels_from_csv(LABELS_CSV, CLASS_TABLE_CSV)
+    with open(LABELS_CSV, 'r') as file:
+        lines = file.readlines()[1:]
+    assert len(labels) == len(lines)
+    for i, line in enumerate(lines):
+        parts = line.strip().split(';')
+        lbl = labels[i]
+        assert lbl.label == utils.get_label_index(parts[8], CLASS_TABLE_CSV)
+        assert lbl.geolocation == (float(parts[0]), float(parts[1]), float(parts[2]))
+        assert np.array_equal(lbl.std_devs, (float(parts[4]), float(parts[5]), float(parts[6])), equal_nan=True)
+    # the sample has missing std-devs, they must come out as NaN and sort last
+    norms = labels.get_std_dev_norms()
+    assert np.isnan(norms).any()
+    assert np.all(np.isnan(norms[labels.get_sorted_order()][-np.isnan(norms).sum():]))
+    print("Label set parsing test passed.")
+
+def test_unexpected_header_and_columns_are_rejected():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bad_header = os.path.join(tmp_dir, 'bad_header.csv')
+        with open(bad_header, 'w') as file:
+            file.write("#lon;lat\n6.7;46.5\n")
+        bad_columns = os.path.join(tmp_dir, 'bad_columns.csv')
+        with open(bad_columns, 'w') as file:
+            file.write(data_loader.LABELS_CSV_HEADER + "\n6.7;46.5;900;20;0.1;0.1;0.1;2\n")
+        for path in (bad_header, bad_columns):
+            try:
+                data_loader.load_labels_from_csv(path, CLASS_TABLE_CSV)
+                assert False, f"{path} should have been rejected"
+            except ValueError:
+                pass
+    print("Label CSV validation test passed.")
+
+def test_long_label_names_are_looked_up_whole():
+    long_name = "Abies_alba_" + "x" * 120
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        class_table_path = os.path.join(tmp_dir, 'class_table.csv')
+        with open(class_table_path, 'w') as file:
+            file.write(f"# label; description\n1;Abies_alba\n2;{long_name}\n")
+        labels_path = os.path.join(tmp_dir, 'labels.csv')
+        with open(labels_path, 'w') as file:
+            file.write(data_loader.LABELS_CSV_HEADER + f"\n6.7;46.5;900;20;0.1;0.1;0.1;2; {long_name}\n6.7;46.5;900;20;0.1;0.1;0.1;2; {long_name[:-1]}\n")
+        assert data_loader.load_labels_from_csv(labels_path, class_table_path).classes.tolist() == [2, -1]
+    print("Long label name test passed.")
+
+def test_label_set_from_labels():
+    labels = [label.Label(3, (6.71, 46.59, 900.0), (0.0, 0.0, 1.0)), label.Label(1, (6.72, 46.58, 901.0))]
+    label_set = label.LabelSet.from_labels(labels)
+    assert len(label_set) == 2
+    assert label_set[0].label == 3 and label_set[1].geolocation == (6.72, 46.58, 901.0)
+    assert np.allclose(label_set.get_2d_locations()[0], labels[0].get_2d_location())
+    assert np.allclose(label_set.get_std_dev_norms(), [lbl.get_std_dev_norm() for lbl in labels])
+    print("Label set conversion test passed.")
+
+def test_class_table_is_read_again_when_modified():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        class_table_path = os.path.join(tmp_dir, 'class_table.csv')
+        with open(class_table_path, 'w') as file:
+            file.write("# label; description\n1;Abies_alba\n")
+        assert utils.get_label_index(" Abies_alba ", class_table_path) == 1
+        assert utils.get_label_indices(["Picea_abies"], class_table_path).tolist() == [-1]
+        with open(class_table_path, 'a') as file:
+            file.write("2;Picea_abies\n")
+        # a distinct modification time, whatever the resolution of the file system
+        stat = os.stat(class_table_path)
+        os.utime(class_table_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert utils.get_label_indices(["Picea_abies", "Abies_alba"], class_table_path).tolist() == [2, 1]
+        assert utils.get_label_name(2, class_table_path) == "Picea_abies"
+    print("Class table cache test passed.")
+
+if __name__ == "__main__":
+    test_label_set_matches_row_by_row_parsing()
+    test_unexpected_header_and_columns_are_rejected()
+    test_long_label_names_are_looked_up_whole()
+    test_label_set_from_labels()
+    test_class_table_is_read_again_when_modified()
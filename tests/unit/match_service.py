@@ -0,0 +1,102 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import asyncio
+import socket
+import threading
+import time
+import laspy
+import numpy as np
+import data_loader, matcher, service
+
+CLASS_TABLE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'class_table.csv'))
+
+def _write_tree(directory, index, east, north):
+    header = laspy.LasHeader(point_format=0, version="1.2")
+    header.scales = [0.001, 0.001, 0.001]
+    header.offsets = [2600000.0, 1200000.0, 0.0]
+    las_data = laspy.LasData(header)
+    rng = np.random.default_rng(index)
+    las_data.x = east + rng.uniform(-1, 1, 200)
+    las_data.y = north + rng.uniform(-1, 1, 200)
+    las_data.z = rng.uniform(0, 20, 200)
+    las_data.write(os.path.join(directory, f'tree_{index}.las'))
+
+def _row(east, north, name="Fagus_sylvatica"):
+    return {"longitude": east, "latitude": north, "altitude": 0.0, "label": name}
+
+def test_service_matches_batches_and_reloads():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        point_clouds_dir = os.path.join(tmp_dir, 'point_clouds')
+        os.makedirs(point_clouds_dir)
+        for index in range(3):
+            _write_tree(point_clouds_dir, index, 2600000.0 + 10 * index, 1200000.0)
+        match_service = service.MatchService(point_clouds_dir, depth=1, class_table_path=CLASS_TABLE_PATH,
+                                             output_path=os.path.join(tmp_dir, 'output_pc'), watch_interval=0.05, batch_window=0.05)
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(match_service.start(port=0), loop).result(timeout=30)
+            client = service.MatchClient(port=match_service.port)
+            assert client.health()["n_targets"] == 3
+
+            rows = [_row(2600000.3, 1200000.2), _row(2600019.8, 1200000.1, "Picea_abies"), _row(2600050.0, 1200000.0)]
+            response = client.match(rows, max_distance=2.0)
+            assert response["n_matched"] == 2
+            assert [(a["label"], os.path.basename(a["file"])) for a in response["assignments"]] == [(0, 'tree_0.las'), (1, 'tree_2.las')]
+
+            # the same assignments as the one-shot matcher, and the outputs it would write
+            labels = service.parse_label_rows(rows, CLASS_TABLE_PATH)
+            point_clouds = data_loader.load_pc_files_from_directory(point_clouds_dir, depth=1)
+            expected = matcher.match_point_clouds_with_labels(point_clouds, labels, 2.0)
+            assert sorted(pc.file_path for pc in expected) == sorted(a["file"] for a in response["assignments"])
+            response = client.match(rows, max_distance=2.0, write=True)
+            assert len(response["written"]) == 2 and all(os.path.exists(path) for path in response["written"])
+
+            # invalid requests are rejected with a 400 and not counted
+            n_requests = client.health()["n_requests"]
+            for body in ({"labels": ["not a row"]}, {"labels": [_row(2600000.0, 1200000.0, "Unknown_species")]}, {"labels": [{"label": 1}]},
+                         {"labels": rows, "assignment": "random"}, ["not an object"]):
+                try:
+                    client.request("POST", "/match", body)
+                    assert False, f"{body} should have been rejected"
+                except RuntimeError as error:
+                    assert "returned 400" in str(error)
+            assert client.health()["n_requests"] == n_requests
+            with socket.create_connection(("127.0.0.1", match_service.port), timeout=30) as connection:
+                connection.sendall(b"POST /match HTTP/1.1\r\nContent-Length: many\r\n\r\n")
+                assert connection.recv(1024).startswith(b"HTTP/1.1 400")
+
+            # concurrent requests are answered in one batch: it only starts once the 4 labels are queued
+            n_batches = client.health()["n_batches"]
+            match_service.batch_window, match_service.max_batch_labels = 60.0, 4
+            results = [None] * 4
+            def send(i):
+                results[i] = client.match([_row(2600000.0 + 10 * (i % 3), 1200000.0)], max_distance=2.0)
+            threads = [threading.Thread(target=send, args=(i,)) for i in range(4)]
+            for request_thread in threads:
+                request_thread.start()
+            for request_thread in threads:
+                request_thread.join()
+            assert all(result["n_matched"] == 1 for result in results)
+            health = client.health()
+            assert health["n_requests"] == n_requests + 4 and health["n_batches"] == n_batches + 1
+            match_service.batch_window, match_service.max_batch_labels = 0.05, 100_000
+
+            # a new file is picked up without restarting the service
+            _write_tree(point_clouds_dir, 5, 2600050.0, 1200000.0)
+            deadline = time.time() + 10
+            while client.health()["n_targets"] != 4 and time.time() < deadline:
+                time.sleep(0.05)
+            assert client.match(rows, max_distance=2.0)["n_matched"] == 3
+        finally:
+            asyncio.run_coroutine_threadsafe(match_service.stop(), loop).result(timeout=30)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+    print("Match service test passed.")
+
+if __name__ == "__main__":
+    test_service_matches_batches_and_reloads()
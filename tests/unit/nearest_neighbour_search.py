@@ -0,0 +1,62 @@
+import os
+import sys
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import numpy as np
+import spatial_index
+
+def brute_force_nearest(points, queries, max_distance):
+    nearest = []
+    for query in queries:
+        best_index = -1
+        best_distance = float('inf')
+        for i, point in enumerate(points):
+            distance = np.linalg.norm(point - query)
+            if distance < best_distance:
+                best_distance = distance
+                best_index = i
+        nearest.append(best_index if best_distance <= max_distance else -1)
+    return np.array(nearest)
+
+def test_grid_nearest_matches_brute_force():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 100, size=(500, 2)) + [2600000.0, 1200000.0]
+    queries = rng.uniform(-5, 105, size=(300, 2)) + [2600000.0, 1200000.0]
+    # duplicated points must resolve to the lowest index, as in a linear scan
+    points[10] = points[3]
+    queries[0] = points[3]
+
+    for max_distance in (0.5, 2.0, 7.5):
+        nearest, distances = spatial_index.nearest_neighbours(points, queries, max_distance)
+        expected = brute_force_nearest(points, queries, max_distance)
+        assert np.array_equal(nearest, expected)
+        assert np.all(np.isinf(distances[nearest < 0]))
+        assert np.all(distances[nearest >= 0] <= max_distance)
+    assert spatial_index.nearest_neighbours(points, queries, 2.0)[0][0] == 3
+
+def test_infinite_distance_falls_back_to_full_scan():
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 1000, size=(50, 2))
+    queries = rng.uniform(0, 1000, size=(20, 2))
+    nearest, _ = spatial_index.nearest_neighbours(points, queries, float('inf'))
+    assert np.array_equal(nearest, brute_force_nearest(points, queries, float('inf')))
+
+def test_empty_index():
+    nearest, distances = spatial_index.nearest_neighbours(np.empty((0, 2)), [[0.0, 0.0]], 2.0)
+    assert nearest.tolist() == [-1]
+    assert np.isinf(distances[0])
+
+def test_non_finite_points_and_queries_are_never_paired():
+    points = np.array([[np.nan, np.nan], [1.0, 1.0], [5.0, np.inf]])
+    queries = np.array([[1.5, 1.0], [np.nan, 0.0], [5.0, 5.0]])
+    for max_distance in (2.0, float('inf')):
+        nearest, distances = spatial_index.nearest_neighbours(points, queries, max_distance)
+        assert nearest.tolist() == [1, -1, 1 if max_distance == float('inf') else -1]
+        assert np.isinf(distances[1])
+
+if __name__ == "__main__":
+    test_grid_nearest_matches_brute_force()
+    test_infinite_distance_falls_back_to_full_scan()
+    test_empty_index()
+    test_non_finite_points_and_queries_are_never_paired()
+    print("Nearest neighbour search tests passed.")
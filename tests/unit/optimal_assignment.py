@@ -0,0 +1,52 @@
+import os
+import sys
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import itertools
+import numpy as np
+import assignment, label, matcher, point_cloud
+
+def _best_matching(label_locations, target_locations, max_distance):
+    """
+    Brute force: the largest matching, and among those the one with the smallest total distance.
+    """
+    distances = np.linalg.norm(label_locations[:, None] - target_locations[None], axis=2)
+    pairs = [(i, j) for i in range(len(label_locations)) for j in range(len(target_locations)) if distances[i, j] <= max_distance]
+    for size in range(len(pairs), 0, -1):
+        costs = [sum(distances[i, j] for i, j in matching) for matching in itertools.combinations(pairs, size)
+                 if len({i for i, _ in matching}) == size and len({j for _, j in matching}) == size]
+        if costs:
+            return size, min(costs)
+    return 0, 0.0
+
+def test_assignment_is_optimal():
+    rng = np.random.default_rng(5)
+    for _ in range(100):
+        label_locations = rng.uniform(0, 5, (int(rng.integers(1, 6)), 2))
+        target_locations = rng.uniform(0, 5, (int(rng.integers(1, 6)), 2))
+        label_ids, target_ids, distances = assignment.assign(target_locations, label_locations, 2.0)
+        assert len(set(label_ids.tolist())) == len(label_ids) and len(set(target_ids.tolist())) == len(target_ids)
+        assert np.allclose(distances, np.linalg.norm(label_locations[label_ids] - target_locations[target_ids], axis=1))
+        size, cost = _best_matching(label_locations, target_locations, 2.0)
+        assert len(label_ids) == size and np.isclose(distances.sum(), cost)
+    print("Optimal assignment test passed.")
+
+def test_optimal_matching_gives_one_label_per_point_cloud():
+    point_clouds = []
+    for north, east in ((1200000.0, 2600000.0), (1200003.0, 2600000.0)):
+        pc = point_cloud.PointCloud.__new__(point_cloud.PointCloud)
+        pc.pc = None
+        pc.label = None
+        pc.localisation = (north, east)
+        point_clouds.append(pc)
+    # both labels are nearest to the first point cloud, only the second label reaches the other one
+    labels = [label.Label(1, (2600000.0, 1200000.5, 0.0)), label.Label(2, (2600000.0, 1200001.4, 0.0))]
+    greedy = matcher.match_point_clouds_with_labels(point_clouds, labels, max_distance=2.0)
+    assert greedy[0] is greedy[1]
+    optimal = matcher.match_point_clouds_with_labels(point_clouds, labels, max_distance=2.0, assignment_method="optimal")
+    assert [pc.label.label for pc in optimal] == [1, 2] and optimal[0] is point_clouds[0] and optimal[1] is point_clouds[1]
+    print("Optimal matching test passed.")
+
+if __name__ == "__main__":
+    test_assignment_is_optimal()
+    test_optimal_matching_gives_one_label_per_point_cloud()
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import laspy
+import numpy as np
+import plyfile
+import label, output_writer, point_cloud
+
+def _write_tree_ply(file_path, center, n_points):
+    rng = np.random.default_rng(n_points)
+    vertices = np.zeros(n_points, dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+    vertices['x'] = center[0] + rng.uniform(-1, 1, n_points)
+    vertices['y'] = center[1] + rng.uniform(-1, 1, n_points)
+    vertices['z'] = rng.uniform(0, 20, n_points)
+    # same bounding box, hence the same localisation, for all the trees of a center
+    vertices['x'][:2] = center[0] - 1, center[0] + 1
+    vertices['y'][:2] = center[1] - 1, center[1] + 1
+    plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex')]).write(file_path)
+
+def test_concurrent_writes_and_merged_output():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # two trees with the same bounding box center: their outputs would have the same name
+        point_clouds = []
+        for i, n_points in enumerate([300, 500, 700]):
+            file_path = os.path.join(tmp_dir, f'tree_{i}.ply')
+            _write_tree_ply(file_path, (2600000.0 + 10 * (i // 2), 1200000.0), n_points)
+            pc = point_cloud.PointCloud.from_file(file_path, type_str="PLY")
+            pc.apply_label(label.Label(i + 1, (6.7, 46.5, 900.0)))
+            point_clouds.append(pc)
+        assert point_clouds[0].get_output_path(tmp_dir) == point_clouds[1].get_output_path(tmp_dir)
+
+        output_dir = os.path.join(tmp_dir, 'output_pc')
+        # a budget smaller than one file: the writes run one at a time
+        paths = output_writer.write_point_clouds(point_clouds + point_clouds[:1], output_dir, workers=3, max_pending_bytes=1)
+        assert len(paths) == 3 and len(set(paths)) == 3
+        assert paths == output_writer.assign_output_paths(list(reversed(point_clouds)), output_dir)[::-1]
+        for pc, path in zip(point_clouds, paths):
+            data = plyfile.PlyData.read(path)['vertex'].data
+            assert len(data) == plyfile.PlyData.read(pc.file_path)['vertex'].count
+            assert (data['scalar_Classification'] == pc.label.label).all()
+
+        for extension in ('las', 'ply'):
+            merged_path = os.path.join(tmp_dir, f'merged.{extension}')
+            assert output_writer.write_merged(point_clouds, merged_path, chunk_size=128) == 1500
+            if extension == 'las':
+                merged = laspy.read(merged_path)
+                classifications, segment_ids, xs = np.asarray(merged.classification), np.asarray(merged.SegmentId), np.asarray(merged.x)
+            else:
+                merged = plyfile.PlyData.read(merged_path)['vertex'].data
+                classifications, segment_ids, xs = merged['scalar_Classification'], merged['scalar_SegmentId'], merged['x']
+            assert np.array_equal(np.bincount(segment_ids.astype(int)), [0, 300, 500, 700])
+            assert np.array_equal(classifications, segment_ids)
+            source_xs = plyfile.PlyData.read(point_clouds[2].file_path)['vertex'].data['x']
+            assert np.allclose(xs[800:], source_xs, atol=1e-3)
+            assert os.path.exists(merged_path + '.segments.csv')
+    print("Output writer test passed.")
+
+def test_merged_las_keeps_the_precision_of_wgs84_inputs():
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        header = laspy.LasHeader(point_format=0, version="1.2")
+        header.scales = [1e-7, 1e-7, 0.01]
+        header.offsets = [7.0, 46.0, 0.0]
+        las_data = laspy.LasData(header)
+        las_data.x, las_data.y, las_data.z = 7.4 + rng.uniform(0, 1e-4, 200), 46.9 + rng.uniform(0, 1e-4, 200), rng.uniform(0, 20, 200)
+        las_path = os.path.join(tmp_dir, 'tree.las')
+        las_data.write(las_path)
+        las_pc = point_cloud.PointCloud.from_file(las_path, type_str="LAS")
+        las_pc.label = label.Label(2, (7.4, 46.9, 500.0))
+
+        merged_path = os.path.join(tmp_dir, 'merged.las')
+        assert output_writer.write_merged([las_pc], merged_path) == 200
+        merged = laspy.read(merged_path)
+        assert np.allclose(merged.header.scales[:2], 1e-7)
+        assert np.allclose(merged.x, las_data.x, atol=1e-7) and np.allclose(merged.y, las_data.y, atol=1e-7)
+
+        # rebuilt from a catalog, without its header, with a class missing from the class table
+        rebuilt_pc = point_cloud.PointCloud.from_scan({**las_pc.scan(), "header": None}, label.Label(-1, (7.4, 46.9, 500.0)))
+        assert output_writer.write_merged([rebuilt_pc], merged_path) == 200
+        merged = laspy.read(merged_path)
+        assert np.allclose(merged.header.scales[:2], 1e-7) and (merged.classification == 0).all()
+
+        ply_path = os.path.join(tmp_dir, 'tree.ply')
+        _write_tree_ply(ply_path, (7.4, 46.9), 100)
+        ply_pc = point_cloud.PointCloud.from_file(ply_path, type_str="PLY")
+        ply_pc.label = label.Label(3, (7.4, 46.9, 500.0))
+        try:
+            output_writer.write_merged([las_pc, ply_pc], merged_path)
+            assert False, "WGS84 PLY point clouds were merged into a LAS file"
+        except ValueError as error:
+            assert "WGS84" in str(error)
+    print("Merged WGS84 LAS test passed.")
+
+if __name__ == "__main__":
+    test_concurrent_writes_and_merged_output()
+    test_merged_las_keeps_the_precision_of_wgs84_inputs()
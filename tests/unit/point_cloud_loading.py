@@ -0,0 +1,172 @@
+import os
+import sys
+import tempfile
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import filecmp
+import shutil
+import laspy
+import numpy as np
+import plyfile
+import catalog, data_loader, las_stream, label, main, point_cloud
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+POINT_CLOUDS_DIR = os.path.join(REPO_ROOT, 'data', 'point_clouds')
+
+def test_lazy_point_clouds_are_localised_like_loaded_ones():
+    file_paths = data_loader.list_pc_files(POINT_CLOUDS_DIR, depth=2)
+    assert any(path.endswith('.las') for path in file_paths) and any(path.endswith('.ply') for path in file_paths)
+    for file_path in file_paths:
+        lazy_pc = data_loader.load_pc_file(file_path, lazy=True)
+        loaded_pc = data_loader.load_pc_file(file_path)
+        assert lazy_pc.pc is None
+        assert lazy_pc.localisation == loaded_pc.localisation
+    print("Lazy localisation test passed.")
+
+def test_parallel_loading_is_deterministic():
+    sequential = data_loader.load_pc_files_from_directory(POINT_CLOUDS_DIR, depth=2)
+    parallel = data_loader.load_pc_files_from_directory(POINT_CLOUDS_DIR, depth=2, workers=3)
+    assert [pc.file_path for pc in sequential] == [pc.file_path for pc in parallel]
+    assert [pc.localisation for pc in sequential] == [pc.localisation for pc in parallel]
+    assert all(pc.pc is None for pc in parallel)
+    print("Parallel loading test passed.")
+
+def test_ply_scans_and_depth_1_process_pool_hold_no_points():
+    ply_paths = data_loader.list_pc_files(POINT_CLOUDS_DIR, depth=1)
+    assert len(ply_paths) > 1 and all(path.endswith('.ply') for path in ply_paths)
+    for file_path in ply_paths:
+        loaded_pc = data_loader.load_pc_file(file_path)
+        for lazy in (True, False):
+            scanned_pc = point_cloud.PointCloud.from_scan(data_loader.scan_pc_file(file_path, lazy=lazy))
+            assert scanned_pc.pc is None
+            assert (scanned_pc.file_path, scanned_pc.type_str, scanned_pc.localisation) == (file_path, "PLY", loaded_pc.localisation)
+
+    sequential = data_loader.load_pc_files_from_directory(POINT_CLOUDS_DIR, depth=1)
+    parallel = data_loader.load_pc_files_from_directory(POINT_CLOUDS_DIR, depth=1, workers=2)
+    assert [(pc.file_path, pc.localisation) for pc in sequential] == [(pc.file_path, pc.localisation) for pc in parallel]
+    assert all(pc.pc is None for pc in parallel)
+    # the points of a scanned point cloud are read again when it is stored, then released
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, pc in (("sequential", sequential[0]), ("parallel", parallel[0])):
+            pc.apply_label(label.Label(3, (0.0, 0.0, 0.0)))
+            pc.store_pc(os.path.join(tmp_dir, name))
+        assert parallel[0].pc is None
+        assert filecmp.cmp(sequential[0].get_output_path(os.path.join(tmp_dir, 'sequential')), parallel[0].get_output_path(os.path.join(tmp_dir, 'parallel')), shallow=False)
+    print("PLY scan test passed.")
+
+def test_streamed_las_write_is_identical_to_in_memory_write():
+    file_path = os.path.join(POINT_CLOUDS_DIR, 'tile_1_iter_1_class#61', 'tile_1_iter_1_class#61.las')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        in_memory_path = os.path.join(tmp_dir, 'in_memory.las')
+        las_data = laspy.read(file_path)
+        las_data.classification[:] = 7
+        las_data.write(in_memory_path)
+        streamed_path = os.path.join(tmp_dir, 'streamed.las')
+        las_stream.write_labelled(file_path, streamed_path, classification=7, chunk_size=5000)
+        assert filecmp.cmp(in_memory_path, streamed_path, shallow=False)
+
+        mapped_path = os.path.join(tmp_dir, 'mapped.las')
+        las_stream.write_labelled(file_path, mapped_path, scalar_field_name='PredInstance', mapping={61: 3}, chunk_size=5000)
+        assert np.all(laspy.read(mapped_path).classification == 3)
+
+    extents = las_stream.compute_extents(file_path, 'PredInstance', chunk_size=5000)
+    assert list(extents) == [61]
+    assert np.allclose(extents[61], (las_data.x.min(), las_data.y.min(), las_data.x.max(), las_data.y.max()))
+    print("Streamed LAS test passed.")
+
+def test_segmented_las_is_labelled_without_being_loaded():
+    rng = np.random.default_rng(5)
+    segment_ids = rng.integers(0, 6, 3000)
+    header = laspy.LasHeader(point_format=0, version="1.2")
+    header.scales = [0.001, 0.001, 0.001]
+    header.offsets = [2600000.0, 1200000.0, 0.0]
+    header.add_extra_dim(laspy.ExtraBytesParams(name="PredInstance", type=np.int32))
+    las_data = laspy.LasData(header)
+    las_data.x = 2600000.0 + 10.0 * segment_ids + rng.uniform(-1, 1, len(segment_ids))
+    las_data.y = 1200000.0 + rng.uniform(-1, 1, len(segment_ids))
+    las_data.z = rng.uniform(0, 20, len(segment_ids))
+    las_data.PredInstance = segment_ids
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        point_clouds_dir = os.path.join(tmp_dir, 'point_clouds')
+        os.makedirs(point_clouds_dir)
+        las_data.write(os.path.join(point_clouds_dir, 'tile.las'))
+        labels_path = os.path.join(tmp_dir, 'labels.csv')
+        with open(labels_path, 'w') as file:
+            file.write(data_loader.LABELS_CSV_HEADER + "\n")
+            file.write("2600010.2;1200000.1;0;20;0.1;0.1;0.1;0;Picea_abies\n2600030.1;1200000.3;0;20;0.2;0.2;0.2;0;Abies_alba\n")
+
+        pc = data_loader.load_pc_files_from_directory(point_clouds_dir, depth=0, scalar_field_name='PredInstance')[0]
+        assert pc.pc is None and pc.n_clusters == 6
+        outputs = {}
+        for name, chunk_size in (("in_memory", None), ("streamed", 700)):
+            output_dir = os.path.join(tmp_dir, name)
+            main.run(dir_depth=0, max_distance=2.0, scalar_field_name='PredInstance', chunk_size=chunk_size, point_clouds_path=point_clouds_dir,
+                     labels_path=labels_path, class_table_path=os.path.join(REPO_ROOT, 'class_table.csv'), output_path=output_dir)
+            outputs[name] = os.path.join(output_dir, 'pc_with_labels.las')
+        assert filecmp.cmp(outputs["in_memory"], outputs["streamed"], shallow=False)
+        assert np.array_equal(laspy.read(outputs["streamed"]).classification, np.select([segment_ids == 1, segment_ids == 3], [2, 1], 0))
+    print("Segmented LAS test passed.")
+
+def test_binary_ply_is_streamed_with_its_classification():
+    rng = np.random.default_rng(3)
+    vertices = np.zeros(1000, dtype=[('x', '>f8'), ('y', '>f8'), ('z', '>f8'), ('scalar_PredInstance', '>f4')])
+    vertices['x'] = rng.uniform(2600000, 2600100, 1000)
+    vertices['y'] = rng.uniform(1200000, 1200100, 1000)
+    vertices['scalar_PredInstance'] = rng.integers(0, 4, 1000)
+    camera = np.array([(1.0, 2.0)], dtype=[('px', '>f4'), ('py', '>f4')])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'cloud.ply')
+        plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex'), plyfile.PlyElement.describe(camera, 'camera')],
+                        byte_order='>', comments=['kept'], obj_info=['also kept']).write(file_path)
+        pc = point_cloud.PointCloud(plyfile.PlyData.read(file_path), type_str="PLY", discriminative_scalar_field_name="scalar_PredInstance")
+        pc.apply_labels({np.float32(3): label.Label(5, (0.0, 0.0, 0.0))})
+        pc.store_pc(tmp_dir, chunk_size=300)
+
+        written = plyfile.PlyData.read(pc.get_output_path(tmp_dir))
+        assert written.byte_order == '>' and written.comments == ['kept'] and written.obj_info == ['also kept']
+        assert np.array_equal(written['camera'].data, camera)
+        for name in vertices.dtype.names:
+            assert np.array_equal(written['vertex'][name], vertices[name])
+        assert np.array_equal(written['vertex']['scalar_Classification'], np.where(vertices['scalar_PredInstance'] == 3, 5, -1))
+    print("Streamed PLY test passed.")
+
+def test_catalog_reuses_unchanged_files_only():
+    file_paths = data_loader.list_pc_files(POINT_CLOUDS_DIR, depth=2)[:3]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file_path in file_paths:
+            shutil.copy(file_path, tmp_dir)
+        catalog_path = os.path.join(tmp_dir, 'catalog', 'pc_catalog.json')
+        expected = data_loader.load_pc_files_from_directory(tmp_dir, depth=1)
+
+        first = data_loader.load_pc_files_from_directory(tmp_dir, depth=1, catalog=catalog.Catalog.load(catalog_path))
+        pc_catalog = catalog.Catalog.load(catalog_path)
+        second = data_loader.load_pc_files_from_directory(tmp_dir, depth=1, catalog=pc_catalog)
+        assert (pc_catalog.n_hits, pc_catalog.n_misses) == (3, 0)
+        assert all(pc.pc is None for pc in second)
+        for point_clouds in (first, second):
+            assert [pc.file_path for pc in point_clouds] == [pc.file_path for pc in expected]
+            assert [pc.localisation for pc in point_clouds] == [pc.localisation for pc in expected]
+
+        # a changed file is scanned again, a deleted one leaves the catalog
+        changed_path, deleted_path = expected[0].file_path, expected[1].file_path
+        os.utime(changed_path, ns=(0, 0))
+        os.remove(deleted_path)
+        pc_catalog = catalog.Catalog.load(catalog_path)
+        data_loader.load_pc_files_from_directory(tmp_dir, depth=1, catalog=pc_catalog)
+        assert (pc_catalog.n_hits, pc_catalog.n_misses) == (1, 1)
+        assert len(catalog.Catalog.load(catalog_path)) == 2
+
+        # a run over fewer files, by format or depth, keeps the entries of the files it does not list
+        data_loader.load_pc_files_from_directory(tmp_dir, depth=0, catalog=catalog.Catalog.load(catalog_path))
+        data_loader.load_pc_files_from_directory(tmp_dir, depth=1, catalog=catalog.Catalog.load(catalog_path), type_strs=["PLY"])
+        assert len(catalog.Catalog.load(catalog_path)) == 2
+    print("Catalog test passed.")
+
+if __name__ == "__main__":
+    test_lazy_point_clouds_are_localised_like_loaded_ones()
+    test_parallel_loading_is_deterministic()
+    test_ply_scans_and_depth_1_process_pool_hold_no_points()
+    test_streamed_las_write_is_identical_to_in_memory_write()
+    test_segmented_las_is_labelled_without_being_loaded()
+    test_binary_ply_is_streamed_with_its_classification()
+    test_catalog_reuses_unchanged_files_only()
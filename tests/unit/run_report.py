@@ -0,0 +1,47 @@
+import os
+import sys
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import numpy as np
+import instrumentation, label, matcher, point_cloud
+
+def _point_cloud_at(north, east):
+    pc = point_cloud.PointCloud.__new__(point_cloud.PointCloud)
+    pc.pc = None
+    pc.label = None
+    pc.localisation = (north, east)
+    return pc
+
+def test_run_report_records_stages_and_matches():
+    point_clouds = [_point_cloud_at(1200000.0, 2600000.0), _point_cloud_at(1200010.0, 2600000.0)]
+    # LV95 labels, given as (east, north, altitude): two match the first point cloud, one matches nothing
+    labels = [label.Label(1, (2600000.5, 1200000.0, 0.0)), label.Label(2, (2600000.0, 1200001.5, 0.0)), label.Label(3, (2600100.0, 1200100.0, 0.0))]
+    report = instrumentation.RunReport(trace_memory=True)
+    with report.activate():
+        with instrumentation.stage("match"):
+            matched = matcher.match_point_clouds_with_labels(point_clouds, labels, max_distance=2.0)
+            with instrumentation.stage("allocate"):
+                np.ones(1_000_000)
+    # outside of an active report, stages are not recorded
+    with instrumentation.stage("ignored"):
+        pass
+
+    assert len(matched) == 2
+    result = report.to_dict()
+    assert set(result["stages"]) == {"match", "label", "allocate"}
+    assert result["stages"]["label"]["calls"] == 1
+    # the peak of a stage includes the peaks of the stages it contains
+    assert result["stages"]["allocate"]["peak_traced_memory_bytes"] >= 8_000_000
+    assert result["stages"]["match"]["peak_traced_memory_bytes"] >= result["stages"]["allocate"]["peak_traced_memory_bytes"]
+    # the resident memory is the peak of the whole process: a stage records how much it raised it
+    assert result["stages"]["match"]["peak_rss_increase_bytes"] >= result["stages"]["allocate"]["peak_rss_increase_bytes"] >= 0
+    assert result["stages"]["allocate"]["process_peak_rss_bytes"] <= result["process_peak_rss_bytes"]
+    matches = result["matches"]
+    assert (matches["n_labels"], matches["n_matched"], matches["n_skipped"], matches["n_labelled_targets"]) == (3, 2, 1, 1)
+    edges = matches["distance_histogram"]["bin_edges"]
+    assert (edges[0], edges[-1]) == (0.0, 2.0)
+    assert sum(matches["distance_histogram"]["counts"]) == 2
+    print("Run report test passed.")
+
+if __name__ == "__main__":
+    test_run_report_records_stages_and_matches()
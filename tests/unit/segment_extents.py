@@ -0,0 +1,79 @@
+import os
+import sys
+include_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..', 'src'))
+sys.path.insert(0, include_path)
+import laspy
+import numpy as np
+import plyfile
+import label, point_cloud, segments
+
+def test_extents_match_per_segment_masks():
+    rng = np.random.default_rng(0)
+    for segment_ids in (rng.integers(0, 40, 5000).astype(np.float32), rng.choice([-3.5, 0.25, 1e9], 5000)):
+        xs, ys = rng.uniform(0, 100, 5000), rng.uniform(0, 100, 5000)
+        extents = segments.SegmentExtents.compute(segment_ids, xs, ys)
+        assert np.array_equal(extents.values, np.unique(segment_ids))
+        assert extents.values.dtype == segment_ids.dtype
+        for i, value in enumerate(extents.values):
+            mask = segment_ids == value
+            assert extents.counts[i] == mask.sum()
+            assert np.array_equal(extents.mins[i], (xs[mask].min(), ys[mask].min()))
+            assert np.array_equal(extents.maxs[i], (xs[mask].max(), ys[mask].max()))
+            assert np.allclose(extents.get_centroids()[i], (xs[mask].mean(), ys[mask].mean()))
+
+        # extents of chunks merge into the extents of the whole cloud
+        parts = [segments.SegmentExtents.compute(segment_ids[i:i + 700], xs[i:i + 700], ys[i:i + 700]) for i in range(0, 5000, 700)]
+        merged = segments.SegmentExtents.merge(parts)
+        assert np.array_equal(merged.values, extents.values)
+        assert np.array_equal(merged.counts, extents.counts)
+        assert np.array_equal(merged.mins, extents.mins)
+        assert np.array_equal(merged.maxs, extents.maxs)
+    print("Segment extents test passed.")
+
+def test_las_segments_use_the_requested_dimension():
+    header = laspy.LasHeader(point_format=0, version="1.2")
+    header.add_extra_dim(laspy.ExtraBytesParams(name="PredInstance", type=np.float32))
+    header.scales = [0.001, 0.001, 0.001]
+    header.offsets = [2600000.0, 1200000.0, 0.0]
+    las_data = laspy.LasData(header)
+    las_data.x = np.array([2600000.0, 2600002.0, 2600010.0, 2600014.0, 2600020.0])
+    las_data.y = np.array([1200000.0, 1200002.0, 1200010.0, 1200012.0, 1200020.0])
+    las_data.z = np.zeros(5)
+    las_data.PredInstance = np.array([1, 1, 2, 2, 0], dtype=np.float32)
+
+    pc = point_cloud.PointCloud(las_data, type_str="LAS", discriminative_scalar_field_name="PredInstance")
+    assert pc.n_clusters == 3
+    # segment 0 is the ground and is not localised
+    assert sorted(pc.localisations) == [1, 2]
+    assert np.allclose(pc.localisations[1], (1200001.0, 2600001.0))
+    assert np.allclose(pc.localisations[2], (1200011.0, 2600012.0))
+    print("LAS segments test passed.")
+
+def test_apply_labels_relabels_all_segments_at_once():
+    rng = np.random.default_rng(2)
+    vertices = np.zeros(1000, dtype=[('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('scalar_PredInstance', '<f4')])
+    vertices['x'] = rng.uniform(2600000, 2600100, 1000)
+    vertices['y'] = rng.uniform(1200000, 1200100, 1000)
+    vertices['scalar_PredInstance'] = rng.integers(0, 6, 1000)
+    ply_data = plyfile.PlyData([plyfile.PlyElement.describe(vertices, 'vertex')])
+    pc = point_cloud.PointCloud(ply_data, type_str="PLY", discriminative_scalar_field_name="scalar_PredInstance")
+
+    mapping = {np.float32(2): label.Label(4, (0.0, 0.0, 0.0)), np.float32(5): label.Label(1, (0.0, 0.0, 0.0))}
+    pc.apply_labels(mapping)
+    classification = pc.get_classification()
+    expected = np.full(1000, -1, dtype=np.float32)
+    expected[vertices['scalar_PredInstance'] == 2] = 4
+    expected[vertices['scalar_PredInstance'] == 5] = 1
+    assert np.array_equal(classification, expected)
+    assert np.array_equal(pc.pc['vertex']['x'], vertices['x'])
+
+    # a second call only updates the segments it maps
+    pc.apply_labels({np.float32(2): label.Label(7, (0.0, 0.0, 0.0))})
+    expected[vertices['scalar_PredInstance'] == 2] = 7
+    assert np.array_equal(pc.get_classification(), expected)
+    print("Bulk relabelling test passed.")
+
+if __name__ == "__main__":
+    test_extents_match_per_segment_masks()
+    test_las_segments_use_the_requested_dimension()
+    test_apply_labels_relabels_all_segments_at_once()